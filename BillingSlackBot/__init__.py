@@ -5,7 +5,6 @@ import requests
 import azure.functions as func
 import urllib.parse
 import json
-import base64
 import stripe
 
 stripe.api_key = os.environ["STRIPE_SECRET"]
@@ -13,7 +12,7 @@ stripe.api_key = os.environ["STRIPE_SECRET"]
 from datetime import datetime
 from datetime import timedelta
 from ..SharedCode.helperfuncs import MemberData
-from ..SharedCode.github import OWASPGitHub
+from ..SharedCode.leaderindex import leader_index
 from ..SharedCode.copper import OWASPCopper
 from mailchimp3 import MailChimp
 from mailchimp3.mailchimpclient import MailChimpError
@@ -446,18 +445,11 @@ def send_response(response_text, response_url):
 
 
 def fill_leader_details(memberinfo):
-    gh = OWASPGitHub()
-    r = gh.GetFile('owasp.github.io', '_data/leaders.json')
     leader_infos = []
-    if r.ok:
-        doc = json.loads(r.text)
-        content = base64.b64decode(doc['content']).decode(encoding='utf-8')
-        leaders = json.loads(content)
+    if leader_index.Refresh():
         for email in memberinfo['emails']:
-            for sub in leaders:
-                if sub['email'] and sub['email'].lower() == email['email'].lower():
-                    leader_infos.append(sub)
-            
+            leader_infos.extend(leader_index.GetLeader(email['email']))
+
         memberinfo['leader_info'] = leader_infos
 
     return memberinfo
@@ -2,13 +2,10 @@ import datetime
 import logging
 import os
 import json
-import time
 
 import azure.functions as func
-from azure.cosmosdb.table.tableservice import TableService
-from azure.cosmosdb.table.models import Entity
-
 from ..SharedCode import github
+from ..SharedCode import repositorytable
 
 #################################################
 # Function Disabled in favor of Runbook
@@ -23,78 +20,71 @@ def main(mytimer: func.TimerRequest) -> None:
     logging.info('BuildRepositoriesEntry function ran at %s', utc_timestamp)
     repos = []
     update = True
+    # incremental mode keeps the table and only re-reads repos whose pushed_at moved since the last run
+    incremental = os.environ.get('REPOSITORY_INCREMENTAL', 'false').lower() == 'true'
 
     gh = github.OWASPGitHub()
     gh.FindUser('hblankenship') # calling this just to load the libs, etc
 
+    # the table is updated in place either way, previous tells which rows changed or went away
+    previous = {}
+    try:
+        previous = repositorytable.get_repository_entries()
+        logging.info(f"Loaded {len(previous)} previously harvested repositories")
+    except Exception as err:
+        logging.error(f'exception loading previous repositories, doing a full harvest: {err}')
+        previous = {}
+        incremental = False
+
+    harvested = previous if incremental else None
     try:
         logging.info('Getting Chapter Repos')
-        repos = GetChapterRepos(gh)
+        repos = GetChapterRepos(gh, harvested)
     except Exception as err:
         logging.error(f'exception in getting chapter repos: {err}')
         update = False
     
     try:
         logging.info('Getting Project Repos')
-        repos.extend(GetProjectRepos(gh))
+        repos.extend(GetProjectRepos(gh, harvested))
     except Exception as err:
         logging.error(f'exception in getting project repos: {err}')
         update = False
 
     try:
         logging.info('Getting Committee Repos')
-        repos.extend(GetCommitteeRepos(gh))
+        repos.extend(GetCommitteeRepos(gh, harvested))
     except Exception as err:
         logging.error(f'exception in getting committee repos: {err}')
         update = False
 
     try:
         logging.info('Getting Event Repos')
-        repos.extend(GetEventRepos(gh))
+        repos.extend(GetEventRepos(gh, harvested))
     except Exception as err:
         logging.error(f'exception in getting event repos: {err}')
         update = False
     
     logging.info(f"Got {len(repos)} repositories.")
     if repos and len(repos) > 0 and update:
-        table_service = TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
-        table_service.delete_table(table_name=os.environ['REPOSITORY_TABLE']) #delete it to start fresh
-        # now wait for actual deletion....
-        while(table_service.exists(os.environ['REPOSITORY_TABLE'])):
-            time.sleep(5.0)
-
-        table_service.create_table(table_name=os.environ['REPOSITORY_TABLE']) #create if it doesn't exist
-    
-        while(not table_service.exists(os.environ['REPOSITORY_TABLE'])): # now I have to wait for it here....
-            time.sleep(5.0)
-
-        logging.info("Looping through repositories")
-        for repo in repos:
-            repos_entry = {
-                'PartitionKey':'ghrepos',
-                'RowKey': repo['name'],
-                'Repo': json.dumps(repo)
-            }
-        
-            table_service.insert_or_replace_entity(os.environ['REPOSITORY_TABLE'], entity=repos_entry)
-        
+        repositorytable.save_repository_entries(repos, previous)
 
     logging.info("function complete")
 
 
-def GetChapterRepos(gh):
-    repos = gh.GetPublicRepositories('www-chapter-')    
+def GetChapterRepos(gh, previous=None):
+    repos = gh.GetRepositoryEntries('www-chapter-', previous=previous)
     return repos
 
-def GetProjectRepos(gh):
-    repos = gh.GetPublicRepositories('www-project')
+def GetProjectRepos(gh, previous=None):
+    repos = gh.GetRepositoryEntries('www-project', previous=previous)
     return repos
 
-def GetCommitteeRepos(gh):
-    repos = gh.GetPublicRepositories('www-committee')
+def GetCommitteeRepos(gh, previous=None):
+    repos = gh.GetRepositoryEntries('www-committee', previous=previous)
     return repos
 
-def GetEventRepos(gh):
-    repos = gh.GetPublicRepositories('www-revent')
+def GetEventRepos(gh, previous=None):
+    repos = gh.GetRepositoryEntries('www-revent', previous=previous)
     return repos
 
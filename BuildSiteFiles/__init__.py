@@ -3,147 +3,86 @@ import json
 import re
 import os
 import time
-import random
 import azure.functions as func
 from ..SharedCode import github
 from ..SharedCode import helperfuncs
 from ..SharedCode import meetup
+from ..SharedCode import repositorytable
 import base64
 import logging
-from azure.cosmosdb.table.tableservice import TableService
-from azure.cosmosdb.table.models import Entity
-
-
-def build_event_json(repos, gh):
-    fmt_str = "%a %b %d %H:%M:%S %Y"
-    for repo in repos: #change to use title in project repo.....
-        repo['name'] = repo['name'].replace('www-revent-','').replace('-', ' ')
-        repo['name'] = " ".join(w.capitalize() for w in repo['name'].split())
-        try:
-            dobj = datetime.datetime.strptime(repo['created'], fmt_str)
-            repo['created'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-        try:
-            dobj = datetime.datetime.strptime(repo['updated'], fmt_str)
-            repo['updated'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-
-    repos.sort(key=lambda x: x['name'])
-    repos.sort(key=lambda x: x['level'], reverse=True)
-   
-    sha = ''
-    r = gh.GetFile('owasp.github.io', '_data/revents.json')
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
 
-    contents = json.dumps(repos)
-    r = gh.UpdateFile('owasp.github.io', '_data/revents.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
-        logging.info('Updated _data/events.json successfully')
-    else:
-        logging.error(f"Failed to update _data/revents.json: {r.text}")
-
-def build_committee_json(repos, gh):
-    fmt_str = "%a %b %d %H:%M:%S %Y"
-    for repo in repos: #change to use title in project repo.....
-        repo['name'] = repo['name'].replace('www-committee-','').replace('-', ' ')
-        repo['name'] = " ".join(w.capitalize() for w in repo['name'].split())
-        try:
-            dobj = datetime.datetime.strptime(repo['created'], fmt_str)
-            repo['created'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-        try:
-            dobj = datetime.datetime.strptime(repo['updated'], fmt_str)
-            repo['updated'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-
-    repos.sort(key=lambda x: x['name'])
-    repos.sort(key=lambda x: x['level'], reverse=True)
-   
-    sha = ''
-    r = gh.GetFile('owasp.github.io', '_data/committees.json')
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
 
-    contents = json.dumps(repos)
-    r = gh.UpdateFile('owasp.github.io', '_data/committees.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
-        logging.info('Updated _data/committees.json successfully')
-    else:
-        logging.error(f"Failed to update _data/committees.json: {r.text}")
-
-def build_project_json(repos, gh):
-    # we want to build certain json data files every now and then to keep the website data fresh.
-    #for each repository, public, with www-project
-    #get name of project, level, and type
-    # store in json
-    #write json file out to github.owasp.io _data folder
-    fmt_str = "%a %b %d %H:%M:%S %Y"
-    for repo in repos: #change to use title in project repo.....
-        repo['name'] = repo['name'].replace('www-project-','').replace('-', ' ')
-        repo['name'] = " ".join(w.capitalize() for w in repo['name'].split())
-        try:
-            dobj = datetime.datetime.strptime(repo['created'], fmt_str)
-            repo['created'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-        try:
-            dobj = datetime.datetime.strptime(repo['updated'], fmt_str)
-            repo['updated'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-
-    repos.sort(key=lambda x: x['name'])
-    repos.sort(key=lambda x: x['level'], reverse=True)
-   
-    sha = ''
-    r = gh.GetFile('owasp.github.io', '_data/projects.json')
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
-
-    contents = json.dumps(repos)
-    r = gh.UpdateFile('owasp.github.io', '_data/projects.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
-        logging.info('Updated _data/projects.json successfully')
-    else:
-        logging.error(f"Failed to update _data/projects.json: {r.text}")
-
-def build_chapter_json(repos, gh):
-    # we want to build certain json data files every now and then to keep the website data fresh.
-    #for each repository, public, with www-project
-    #get name of project, level, and type
-    # store in json
-    #write json file out to github.owasp.io _data folder
-    #Thu Sep 12 20:51:21 2019
-    fmt_str = "%a %b %d %H:%M:%S %Y"
+# www- prefix of each group of repositories the site lists, in the order a name is matched
+GROUP_PREFIXES = [('chapter', 'www-chapter-'), ('project', 'www-project-'), ('committee', 'www-committee-'), ('event', 'www-revent-')]
+
+# output: (stage that owns it, repository, path)
+SITE_OUTPUTS = {
+    'chapters': ('stage1', 'owasp.github.io', '_data/chapters.json'),
+    'projects': ('stage2', 'owasp.github.io', '_data/projects.json'),
+    'committees': ('stage3', 'owasp.github.io', '_data/committees.json'),
+    'revents': ('stage3', 'owasp.github.io', '_data/revents.json'),
+    'leaders': ('stage4', 'owasp.github.io', '_data/leaders.json'),
+    'community_events': ('stage5', 'www-community', '_data/community_events.json'),
+    'inactive_chapters': ('stage7', 'owasp.github.io', '_data/inactive_chapters.json')
+}
+
+# outputs listing a group's repositories, what they sort on after the name (descending), and the other way round
+OUTPUT_GROUPS = { 'chapters': 'chapter', 'projects': 'project', 'committees': 'committee', 'revents': 'event', 'inactive_chapters': 'chapter' }
+SORT_KEYS = { 'chapters': 'region', 'projects': 'level', 'committees': 'level', 'revents': 'level', 'inactive_chapters': 'region' }
+GROUP_OUTPUTS = { 'chapter': ['chapters', 'inactive_chapters'], 'project': ['projects'], 'committee': ['committees'], 'event': ['revents'] }
+
+MONTHS = { 'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6, 'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12 }
+
+def get_repo_group(name):
+    for group, prefix in GROUP_PREFIXES:
+        if prefix in name:
+            return group, prefix
+
+    return None, None
+
+# repository dates are stored as strftime('%c'), e.g. Thu Sep 12 20:51:21 2019; the site shows 2019-09-12
+def format_site_date(value):
+    parts = value.split() if isinstance(value, str) else []
+    if len(parts) == 5 and parts[1] in MONTHS and parts[2].isdigit() and parts[4].isdigit():
+        return f"{parts[4]}-{MONTHS[parts[1]]:02d}-{int(parts[2]):02d}"
+
+    return value
+
+# the repository as the site lists it: www-chapter-new-york becomes New York
+def site_entry(repo, prefix):
+    entry = dict(repo)
+    entry['name'] = " ".join(w.capitalize() for w in repo['name'].replace(prefix, '').replace('-', ' ').split())
+    for field in ['created', 'updated']:
+        if field in entry:
+            entry[field] = format_site_date(entry[field])
+
+    return entry
+
+def sort_site_entries(entries, key):
+    entries.sort(key=lambda x: x['name'])
+    entries.sort(key=lambda x: x[key], reverse=True)
+    return entries
+
+def dump_site_output(output, data):
+    if output == 'leaders':
+        return json.dumps(data, ensure_ascii=False, indent=4)
+    if output in ['chapters', 'community_events']:
+        return json.dumps(data, indent=4)
+
+    return json.dumps(data)
+
+# meetings is the number of meetup events a chapter held in the last year
+def count_chapter_meetings(entries):
+    today = datetime.datetime.today()
+    earliest = f"{today.year - 1}-01-01T00:00:00.000"
     mu = meetup.OWASPMeetup()
     mu.Login()
-    for repo in repos:
-        repo['name'] = repo['name'].replace('www-chapter-','').replace('-', ' ')
-        repo['name'] = " ".join(w.capitalize() for w in repo['name'].split())
-        try:
-            dobj = datetime.datetime.strptime(repo['created'], fmt_str)
-            repo['created'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-        try:
-            dobj = datetime.datetime.strptime(repo['updated'], fmt_str)
-            repo['updated'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-        
+    groupnames = [entry['meetup-group'] for entry in entries if 'meetup-group' in entry]
+    group_events = mu.GetEventsForGroups(groupnames, earliest=earliest, status='past')
+    for entry in entries:
         ecount = 0
-        today = datetime.datetime.today()
-        earliest = f"{today.year - 1}-01-01T00:00:00.000"
-        if 'meetup-group' in repo:
-            estr = mu.GetGroupEvents(repo['meetup-group'], earliest=earliest, status='past')
+        if 'meetup-group' in entry:
+            estr = group_events.get(entry['meetup-group'], '')
             if estr:
                 event_json = json.loads(estr)
                 if event_json and event_json['data'] and event_json['data']['proNetworkByUrlname']:
@@ -158,23 +97,142 @@ def build_chapter_json(repos, gh):
                         except:
                             pass
                     
-        repo['meetings'] = ecount
-
-    repos.sort(key=lambda x: x['name'])
-    repos.sort(key=lambda x: x['region'], reverse=True)
-   
-    sha = ''
-    r = gh.GetFile('owasp.github.io', '_data/chapters.json')
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
+        entry['meetings'] = ecount
+
+# Builds the SITE_OUTPUTS named in outputs (all of them by default) from one pass over repos: each
+# repository is sorted into its group and formatted for the site once, whatever it appears in.
+# Returns { output: contents } and the seconds each output took (plus 'scan' for the pass itself).
+# community_events is left out when there are none, so the last good file stays.
+def compile_site_data(gh, repos, outputs=None):
+    if outputs is None:
+        outputs = list(SITE_OUTPUTS.keys())
+
+    timings = {}
+    started = time.perf_counter()
+    group_repos = []
+    entries = { group: [] for group, prefix in GROUP_PREFIXES }
+    inactive_chapters = []
+    for repo in repos:
+        group, prefix = get_repo_group(repo['name'])
+        if not group:
+            continue
 
-    contents = json.dumps(repos, indent=4)
-    r = gh.UpdateFile('owasp.github.io', '_data/chapters.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
-        logging.info('Updated _data/chapters.json successfully')
+        group_repos.append(repo)
+        entry = site_entry(repo, prefix)
+        entries[group].append(entry)
+        if group == 'chapter' and repo.get('build', None) == 'no pages': # no build status, not active
+            inactive_chapters.append(dict(entry))
+    timings['scan'] = time.perf_counter() - started
+
+    compiled = {}
+    for output in outputs:
+        started = time.perf_counter()
+        if output == 'inactive_chapters':
+            compiled[output] = dump_site_output(output, sort_site_entries(inactive_chapters, SORT_KEYS[output]))
+        elif output in OUTPUT_GROUPS:
+            group_entries = entries[OUTPUT_GROUPS[output]]
+            if len(group_entries) > 0:
+                if output == 'chapters':
+                    count_chapter_meetings(group_entries)
+                compiled[output] = dump_site_output(output, sort_site_entries(group_entries, SORT_KEYS[output]))
+        elif output == 'leaders':
+            repo_leaders = get_repo_leaders(gh, group_repos)
+            compiled[output] = dump_site_output(output, merge_repo_results([repo['name'] for repo in group_repos], repo_leaders))
+        elif output == 'community_events':
+            repo_events = get_repo_community_events(meetup.OWASPMeetup(), group_repos)
+            events = merge_repo_results([repo['name'] for repo in group_repos], repo_events)
+            if len(events) > 0:
+                compiled[output] = dump_site_output(output, events)
+        timings[output] = time.perf_counter() - started
+
+    logging.info('Compiled site data from %d repos: %s', len(repos), ', '.join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return compiled, timings
+
+# outputs a push to repo_name touches: its group's files when its table entry changed, leaders.json
+# when leaders.md did (or might have, paths is None when the push was too big to list them)
+def get_affected_outputs(repo_name, entry_changed, paths):
+    group, prefix = get_repo_group(repo_name)
+    if not group:
+        return []
+
+    outputs = []
+    if entry_changed:
+        outputs.extend(GROUP_OUTPUTS[group])
+    if paths is None or 'leaders.md' in paths:
+        outputs.append('leaders')
+
+    return outputs
+
+def get_site_output(gh, output, ref=None):
+    stage, repo, path = SITE_OUTPUTS[output]
+    r = gh.GetFile(repo, path, ref=ref)
+    if not gh.TestResultCode(r.status_code):
+        raise Exception(f"Could not read {repo}/{path} to update: {r.text}")
+
+    doc = json.loads(r.text)
+    return json.loads(base64.b64decode(doc['content']).decode(encoding='utf-8'))
+
+PATCH_ATTEMPTS = 5
+
+# Rewrites one repository's part of the published outputs in place instead of compiling them from
+# every repository, for a push to that repository. repo is its repository table entry, None once
+# it is gone. Entries are matched on url; a chapter keeps the meetings count it had.
+# The files are read at one owasp.github.io commit and committed on exactly that commit; when
+# something else (another push, the nightly build) committed first they are read and patched
+# again, so neither undoes the other.
+def patch_site_data(gh, repo_name, repo, outputs):
+    repo_leaders = []
+    if repo and 'leaders' in outputs:
+        repo_leaders = get_repo_leaders(gh, [repo]).get(repo_name, [])
+
+    for attempt in range(PATCH_ATTEMPTS):
+        head_sha = gh.GetBranchHead('owasp.github.io')
+        compiled = {}
+        for output in outputs:
+            compiled[output] = patch_site_output(gh, output, repo_name, repo, repo_leaders, head_sha)
+
+        files = { SITE_OUTPUTS[output][2]: contents for output, contents in compiled.items() }
+        r = gh.CommitFiles('owasp.github.io', files, f"update {repo_name} site data", head_sha=head_sha)
+        if r.ok:
+            logging.info(f"Updated {', '.join(files.keys())} for {repo_name}")
+            return compiled
+        if r.status_code != 422:
+            raise Exception(f"Failed to commit {', '.join(files.keys())} for {repo_name}: {r.text}")
+        logging.info(f"owasp.github.io moved while updating {repo_name}, reading the files again")
+
+    raise Exception(f"Gave up updating site data for {repo_name} after {PATCH_ATTEMPTS} conflicting commits")
+
+def patch_site_output(gh, output, repo_name, repo, repo_leaders, head_sha):
+    group, prefix = get_repo_group(repo_name)
+    url = f"https://owasp.org/{ repo_name }/"
+    current = get_site_output(gh, output, head_sha)
+    if output == 'leaders':
+        position = next((i for i, leader in enumerate(current) if leader.get('group_url', None) == url), len(current))
+        current = [leader for leader in current if leader.get('group_url', None) != url]
+        current[position:position] = repo_leaders
     else:
-        logging.error(f"Failed to update _data/chapters.json: {r.text}")
+        known = next((entry for entry in current if entry.get('url', None) == url), None)
+        current = [entry for entry in current if entry.get('url', None) != url]
+        if repo and (output != 'inactive_chapters' or repo.get('build', None) == 'no pages'):
+            entry = site_entry(repo, prefix)
+            if output == 'chapters':
+                entry['meetings'] = known.get('meetings', 0) if known else 0
+            current.append(entry)
+        sort_site_entries(current, SORT_KEYS[output])
+
+    return dump_site_output(output, current)
+
+# the owasp.github.io outputs go in one commit, the rest file by file
+def write_site_data(gh, compiled, message='update site data'):
+    files = {}
+    for output, contents in compiled.items():
+        stage, repo, path = SITE_OUTPUTS[output]
+        if repo == 'owasp.github.io':
+            files[path] = contents
+        else:
+            upsert_site_file(gh, repo, path, contents)
+
+    commit_site_files(gh, files, message)
 
 def parse_leaderline(line):
     ename = line.find(']')
@@ -213,8 +271,12 @@ def add_to_leaders(repo, content, all_leaders, stype):
                 all_leaders.append(leader)
                 leader_count = leader_count + 1
 
-def build_leaders_json(gh, repos):
-    all_leaders = []
+# leaders found in each repo's leaders.md, by repo name
+def get_repo_leaders(gh, repos):
+    repo_leaders = {}
+    texts = None
+    if gh.use_graphql: # every leaders.md in a handful of queries instead of a request per repo
+        texts = gh.GetFileTexts([repo['name'] for repo in repos], 'leaders.md')
     #repos = gh.GetPublicRepositories('www-')
     for repo in repos:
         stype = ''
@@ -234,61 +296,37 @@ def build_leaders_json(gh, repos):
             continue
 
         #logging.info(f"attempting to get leader file for {repo['name']}")
-        r = gh.GetFile(repo['name'], 'leaders.md')
-        if r.ok:
-            doc = json.loads(r.text)
-            content = base64.b64decode(doc['content']).decode(encoding='utf-8')
-
-            add_to_leaders(repo, content, all_leaders, stype)
-    
-    #logging.info("Getting leaders file in main website....")
-    r = gh.GetFile('owasp.github.io', '_data/leaders.json')
-    sha = ''
-    if r.ok:
-        doc = json.loads(r.text)
-        sha = doc['sha']
-    #logging.info("Updating leaders file in main website....")
-    r = gh.UpdateFile('owasp.github.io', '_data/leaders.json', json.dumps(all_leaders, ensure_ascii=False, indent=4), sha)
-    if r.ok:
-        logging.info('Update leaders json succeeded')
-    else:
-        logging.error('Update leaders json failed: %s', r.status)
-
-def build_inactive_chapters_json(gh, repos):
-    #repos = gh.GetInactiveRepositories('www-chapter') No longer in use, use repo['build'] == 'no pages' to mean inactive
-    fmt_str = "%a %b %d %H:%M:%S %Y"
-    for repo in repos:
-        if repo['build'] != 'no pages': # has a build status
-            continue
-
-        repo['name'] = repo['name'].replace('www-chapter-','').replace('-', ' ')
-        repo['name'] = " ".join(w.capitalize() for w in repo['name'].split())
-        try:
-            dobj = datetime.datetime.strptime(repo['created'], fmt_str)
-            repo['created'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-        try:
-            dobj = datetime.datetime.strptime(repo['updated'], fmt_str)
-            repo['updated'] = dobj.strftime("%Y-%m-%d")
-        except ValueError:
-            pass
-
-    repos.sort(key=lambda x: x['name'])
-    repos.sort(key=lambda x: x['region'], reverse=True)
-   
-    sha = ''
-    r = gh.GetFile('owasp.github.io', '_data/inactive_chapters.json')
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
+        content = None
+        if texts is not None:
+            content = texts.get(repo['name'], None)
+        else:
+            r = gh.GetFile(repo['name'], 'leaders.md')
+            if r.ok:
+                doc = json.loads(r.text)
+                content = base64.b64decode(doc['content']).decode(encoding='utf-8')
+
+        if content is not None:
+            leaders = []
+            add_to_leaders(repo, content, leaders, stype)
+            repo_leaders[repo['name']] = leaders
+
+    return repo_leaders
+
+# repo_leaders may come from several get_repo_leaders calls, the file keeps the order of repo_names
+def merge_repo_results(repo_names, repo_results):
+    merged = []
+    for name in repo_names:
+        merged.extend(repo_results.get(name, []))
+
+    return merged
+
+def write_leaders_json(gh, all_leaders, files=None):
+    contents = json.dumps(all_leaders, ensure_ascii=False, indent=4)
+    if files is not None: # the caller commits everything it staged in one go
+        files['_data/leaders.json'] = contents
+        return
 
-    contents = json.dumps(repos)
-    r = gh.UpdateFile('owasp.github.io', '_data/inactive_chapters.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
-        logging.info('Updated _data/inactive_chapters.json successfully')
-    else:
-        logging.error(f"Failed to update _data/inactive_chapters.json: {r.text}")
+    return upsert_site_file(gh, 'owasp.github.io', '_data/leaders.json', contents)
 
 def deEmojify(text):
     EMOJI_PATTERN = re.compile(
@@ -342,43 +380,44 @@ def add_to_events(mue, events, repo):
 
     return events
 
-def create_community_events(gh, mu, repos):
+# upcoming meetup events of each repo's group, by repo name
+def get_repo_community_events(mu, repos):
     #repos = gh.GetPublicRepositories('www-')
     
-    events = []
+    repo_events = {}
     edate = datetime.datetime.today() + datetime.timedelta(-30)
     earliest = edate.strftime('%Y-%m-')+"01T00:00:00.000"
     if mu.Login():
+        group_repos = []
         for repo in repos:
             rname = repo['name']
             if 'www-chapter-' not in rname and 'www-project-' not in rname and 'www-committee-' not in rname and 'www-revent-' not in rname:
                 continue
 
             if 'meetup-group' in repo and repo['meetup-group']:
-                # Meetup throttling is likely occuring. We should slow these down....
-                mstr = mu.GetGroupEvents(repo['meetup-group'], earliest)
-                time.sleep(0 + random.randint(0, 2))
-                if mstr:
-                    muej = json.loads(mstr)
-                    if muej and muej['data'] and muej['data']['proNetworkByUrlname']:
-                        mue_events = muej['data']['proNetworkByUrlname']['eventsSearch']['edges']
-                        add_to_events(mue_events, events, rname)
+                group_repos.append(repo)
 
+        # batched and throttle-aware, see OWASPMeetup.GetEventsForGroups
+        group_events = mu.GetEventsForGroups([repo['meetup-group'] for repo in group_repos], earliest)
+        for repo in group_repos:
+            rname = repo['name']
+            mstr = group_events.get(repo['meetup-group'], '')
+            if mstr:
+                muej = json.loads(mstr)
+                if muej and muej['data'] and muej['data']['proNetworkByUrlname']:
+                    mue_events = muej['data']['proNetworkByUrlname']['eventsSearch']['edges']
+                    events = add_to_events(mue_events, [], rname)
+                    if events:
+                        repo_events[rname] = events
+
+    return repo_events
+
+def write_community_events(gh, events):
     if len(events) <= 0:
         return
         
-    r = gh.GetFile('www-community', '_data/community_events.json')
-    sha = ''
-    if r.ok:
-        doc = json.loads(r.text)
-        sha = doc['sha']
-    
     contents = json.dumps(events, indent=4)
-    r = gh.UpdateFile('www-community', '_data/community_events.json', contents, sha)
-    if r.ok:
-        logging.info('Updated _data/community_events.json successfully')
-    else:
-        logging.error(f"Failed to update _data/community_events.json: {r.text}")
+    return upsert_site_file(gh, 'www-community', '_data/community_events.json', contents)
 
 
 def update_chapter_admin_team(gh):
@@ -391,149 +430,99 @@ def update_chapter_admin_team(gh):
             if not r.ok:
                 logging.info(f'Failed to add repo: {r.text}')
 
-def update_events_sitedata(gh):
+def update_events_sitedata(gh, files=None):
     # file from _data/event.yml just needs to go in assets/sitedata/
     r = gh.GetFile('owasp.github.io', '_data/events.yml')
 
     if gh.TestResultCode(r.status_code):
         doc = json.loads(r.text)
         contents = base64.b64decode(doc['content']).decode()
-    
-
-        gh = github.OWASPGitHub()
-        r = gh.GetFile('owasp.github.io', 'assets/sitedata/events.yml')
+        if files is not None: # the caller commits everything it staged in one go
+            files['assets/sitedata/events.yml'] = contents
+            return
 
-        if gh.TestResultCode(r.status_code):
-            doc = json.loads(r.text)
-            sha = doc['sha']
-
-        r = gh.UpdateFile('owasp.github.io', 'assets/sitedata/events.yml', contents, sha)
-        if gh.TestResultCode(r.status_code):
-            logging.info('Updated assets/sitedata/events.yml successfully')
-        else:
-            logging.error(f"Failed to update assets/sitedata/events.yml: {r.text}")
+        return upsert_site_file(gh, 'owasp.github.io', 'assets/sitedata/events.yml', contents)
     else:
         logging.error(f'Failed to update assets/sitedata/events.yml: {r.text}')
 
-def update_corp_members(gh):
+def update_corp_members(gh, files=None):
     # file from _data/corp_members.yml just needs to go in assets/sitedata/
     r = gh.GetFile('owasp.github.io', '_data/corp_members.yml')
 
     if gh.TestResultCode(r.status_code):
         doc = json.loads(r.text)
         contents = base64.b64decode(doc['content']).decode()
-    
+        if files is not None: # the caller commits everything it staged in one go
+            files['assets/sitedata/corp_members.yml'] = contents
+            return
 
-        gh = github.OWASPGitHub()
-        r = gh.GetFile('owasp.github.io', 'assets/sitedata/corp_members.yml')
+        return upsert_site_file(gh, 'owasp.github.io', 'assets/sitedata/corp_members.yml', contents)
+    else:
+        logging.error(f'Failed to update assets/sitedata/corp_members.yml: {r.text}')
 
-        if gh.TestResultCode(r.status_code):
-            doc = json.loads(r.text)
-            sha = doc['sha']
+# writes path unless it already has these contents (no commit, no Pages build), True when it did
+def upsert_site_file(gh, repo, path, contents):
+    r, written = gh.UpsertFileIfChanged(repo, path, contents)
+    if written:
+        logging.info(f"Updated {repo}/{path} successfully")
+    elif gh.TestResultCode(r.status_code):
+        logging.info(f"{repo}/{path} unchanged, skipped the commit")
+    else:
+        logging.error(f"Failed to update {repo}/{path}: {r.text}")
 
-        r = gh.UpdateFile('owasp.github.io', 'assets/sitedata/corp_members.yml', contents, sha)
-        if gh.TestResultCode(r.status_code):
-            logging.info('Updated assets/sitedata/corp_members.yml successfully')
-        else:
-            logging.error(f"Failed to update assets/sitedata/corp_members.yml: {r.text}")
+    return written
+
+def commit_site_files(gh, files, message):
+    if len(files) <= 0:
+        return
+
+    r = gh.CommitFiles('owasp.github.io', files, message)
+    if r.ok:
+        logging.info(f"Committed {', '.join(files.keys())} successfully")
     else:
-        logging.error(f'Failed to update assets/sitedata/corp_members.yml: {r.text}')
+        logging.error(f"Failed to commit {', '.join(files.keys())}: {r.text}")
+        raise Exception(f"Failed to commit site files: {r.status_code}")
 
-def get_repos():
-    repos = []
-    
-    table_service = TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
-    #table_service.create_table(table_name=os.environ['REPOSITORY_TABLE']) #create if it doesn't exist
-    results = table_service.query_entities(os.environ['REPOSITORY_TABLE'])
-    for result in results:
-        repo = json.loads(result['Repo'])
-        repos.append(repo)
-
-    return repos
-
-def do_stage_one():
-    repos = get_repos()
-    chapter_repos = []
-    gh = github.OWASPGitHub()
-    for repo in repos:
-        if 'www-chapter-' in repo['name']:
-            chapter_repos.append(repo)
-
-    if len(chapter_repos) > 0:
-        logging.info("Building chapter json file")
-        try:
-            build_chapter_json(chapter_repos, gh)
-        except Exception as err:
-            logging.error(f"Exception building chapter json: {err}")
-            raise err
-
-def do_stage_two():
-    repos = get_repos()
-    project_repos = []
-    gh = github.OWASPGitHub()
-    for repo in repos:
-        if 'www-project-' in repo['name']:
-            project_repos.append(repo)
-
-    if len(project_repos) > 0:
-        logging.info("Building project json file")
-        try:
-            build_project_json(project_repos, gh)
-        except Exception as err:
-            logging.error(f"Exception building project json: {err}")
-            raise err
-
-def do_stage_three():
-    lasterr = None
-    repos = get_repos()
-    committee_repos = []
-    event_repos = []
-    gh = github.OWASPGitHub()
-    for repo in repos:
-        if 'www-committee-' in repo['name']:
-            committee_repos.append(repo)
-        elif 'www-revent-' in repo['name']:
-            event_repos.append(repo)            
-
-    if len(committee_repos) > 0:
-        logging.info('Building committees json file')
-        try:
-            build_committee_json(committee_repos, gh)
-        except Exception as err:
-            logging.error(f"Exception building committees json file: {err}")
-            lasterr = err
-    if len(event_repos) > 0:
-        logging.info("Building event json file")
-        try:
-            build_event_json(event_repos, gh)
-        except Exception as err:
-            logging.error(f"Exception building event json: {err}")
-            lasterr = err
-    if lasterr:
-        raise lasterr
+# group_types reads just those partitions of the repository table, e.g. ['chapter']
+def get_repos(group_types=None):
+    return repositorytable.get_repos(group_types=group_types)
 
-def do_stage_four():
-    repos = get_repos()
+def build_site_data(repos, outputs, message):
     gh = github.OWASPGitHub()
-    
-    logging.info('Building leaders json file')
+    logging.info(f"Building {', '.join(outputs)} site data")
     try:
-        build_leaders_json(gh, repos)
+        compiled, timings = compile_site_data(gh, repos, outputs)
+        write_site_data(gh, compiled, message)
     except Exception as err:
-        logging.error(f"Exception updating leaders json file: {err}")
+        logging.error(f"Exception building {', '.join(outputs)} site data: {err}")
         raise err
 
-def do_stage_five():
-    repos = get_repos()
-    gh = github.OWASPGitHub()
+    return timings
 
-    logging.info('Updating community events')
-    mu = meetup.OWASPMeetup()
-    try:
-        create_community_events(gh, mu, repos)
-    except Exception as err:
-        logging.error(f"Exception updating community events: {err}")
-        raise err
+def do_stage_one(repos=None):
+    if repos is None:
+        repos = get_repos(['chapter'])
+    build_site_data(repos, ['chapters'], 'update chapters site data')
+
+def do_stage_two(repos=None):
+    if repos is None:
+        repos = get_repos(['project'])
+    build_site_data(repos, ['projects'], 'update projects site data')
+
+def do_stage_three(repos=None):
+    if repos is None:
+        repos = get_repos(['committee', 'event'])
+    build_site_data(repos, ['committees', 'revents'], 'update committees and events site data')
+
+def do_stage_four(repos=None):
+    if repos is None:
+        repos = get_repos()
+    build_site_data(repos, ['leaders'], 'update leaders site data')
+
+def do_stage_five(repos=None):
+    if repos is None:
+        repos = get_repos()
+    build_site_data(repos, ['community_events'], 'update community events')
 
 def do_stage_six():
     gh = github.OWASPGitHub()
@@ -545,69 +534,127 @@ def do_stage_six():
         logging.error(f"Exception updating Chapter Administration team: {err}")
         raise err
 
-def do_stage_seven():
-    repos = get_repos()
-    gh = github.OWASPGitHub()
-    logging.info('Updating inactive chapters')
-    try:
-        build_inactive_chapters_json(gh, repos)
-    except Exception as err:
-        logging.error(f"Exception updating inactive chapters: {err}")  
-        raise err
+def do_stage_seven(repos=None):
+    if repos is None:
+        repos = get_repos(['chapter'])
+    build_site_data(repos, ['inactive_chapters'], 'update inactive chapters site data')
 
 def do_stage_eight():
     lasterr = None
     gh = github.OWASPGitHub()
+    files = {}
     logging.info('Updating corp_members.yml sitedata from site.data')
     try:
-        update_corp_members(gh)
+        update_corp_members(gh, files)
     except Exception as err:
         logging.error(f"Exception updating corp_members.yml: {err}")
         lasterr = err
 
     logging.info('Building sitedata/events yml file')
     try:
-        update_events_sitedata(gh)
+        update_events_sitedata(gh, files)
     except Exception as err:
         logging.error(f"Exception building sitedata/events yml: {err}")
         lasterr = err
 
+    try:
+        commit_site_files(gh, files, 'update sitedata')
+    except Exception as err:
+        lasterr = err
+
     if lasterr:
         raise lasterr
 
-def main(name: str) -> str:
-    if 'stage' not in name:
-        logging.warn('Returning from func due to bad stage')
-        return
-        
-    utc_timestamp = datetime.datetime.utcnow().replace(
-        tzinfo=datetime.timezone.utc).isoformat()
+# Stages the function app still builds itself, e.g. "stage1,stage4,stage5". The others are
+# performed by Runbook and only logged here.
+def get_enabled_stages():
+    return [stage.strip() for stage in os.environ.get('BUILD_SITE_STAGES', '').split(',') if stage.strip()]
 
-    logging.info('BuildSiteFiles function ran at %s with stage %s', utc_timestamp, name)
-    
+# every enabled output of stages 1-5 and 7 from a single pass, outputs narrows it further
+def do_site_data_stages(repos=None, outputs=None):
+    enabled = get_enabled_stages()
+    outputs = [output for output in (outputs or SITE_OUTPUTS.keys()) if SITE_OUTPUTS[output][0] in enabled]
+    if len(outputs) <= 0:
+        logging.info('Site data stages now performed by Runbook')
+        return {}
+    if repos is None:
+        repos = get_repos()
+
+    return build_site_data(repos, outputs, 'update site data')
+
+def run_stage(name, repos=None):
     if name == 'stage1':
-        #do_stage_one()
-        logging.info('Stage One now performed by Runbook')
+        do_stage_one(repos)
     elif name == 'stage2':
-        #do_stage_two()
-        logging.info('Stage Two now performed by Runbook')
+        do_stage_two(repos)
     elif name == 'stage3':
-        #do_stage_three()
-        logging.info('Stage Three now performed by Runbook')
+        do_stage_three(repos)
     elif name == 'stage4':
-        #do_stage_four()
-        logging.info('Stage Four now performed by Runbook')
+        do_stage_four(repos)
     elif name == 'stage5':
-        #do_stage_five()
-        logging.info('Stage Five now performed by Runbook')
+        do_stage_five(repos)
     elif name == 'stage6':
-        #do_stage_six()
-        logging.info('Stage Six now performed by Runbook for Nightly Chapter Maintenance')
+        do_stage_six()
     elif name == 'stage7':
-        logging.info('Stage Seven no longer required - using build')
+        do_stage_seven(repos)
     elif name == 'stage8':
-        #do_stage_eight()
-        logging.info('Stage Six now performed by Runbook')
+        do_stage_eight()
+
+# Leaders (stage4) and community events (stage5) are sharded by BuildSiteFilesOrchestrator:
+# 'collect' runs over one shard of repos and returns its results by repo name,
+# 'write' merges every shard's results in the order of repo_names and updates the file.
+def run_stage_part(name, part, payload):
+    gh = github.OWASPGitHub()
+    if name == 'stage4' and part == 'collect':
+        return get_repo_leaders(gh, payload['repos'])
+    if name == 'stage5' and part == 'collect':
+        mu = meetup.OWASPMeetup()
+        return get_repo_community_events(mu, payload['repos'])
+
+    repo_results = {}
+    for results in payload['results']:
+        repo_results.update(results)
+    merged = merge_repo_results(payload['repo_names'], repo_results)
+    if name == 'stage4':
+        logging.info('Building leaders json file')
+        write_leaders_json(gh, merged)
+    elif name == 'stage5':
+        logging.info('Updating community events')
+        write_community_events(gh, merged)
+
+    return name
+
+# name is either a stage ('stage1'...'stage8', or 'stages' for every site data output at once) or,
+# from the orchestrator, { 'stage': 'stageN', 'repos': [...], 'part': 'collect' | 'write', ... }
+# or { 'stage': 'stages', 'repos': [...], 'outputs': [...] }
+def main(name):
+    payload = {}
+    if isinstance(name, str) and name.startswith('{'):
+        name = json.loads(name)
+    if isinstance(name, dict):
+        payload = name
+        name = payload.get('stage', '')
+
+    if 'stage' not in name:
+        logging.warn('Returning from func due to bad stage')
+        return
+        
+    utc_timestamp = datetime.datetime.utcnow().replace(
+        tzinfo=datetime.timezone.utc).isoformat()
+
+    logging.info('BuildSiteFiles function ran at %s with stage %s', utc_timestamp, name)
+    
+    result = name
+    if name == 'stages':
+        result = { 'stage': name, 'timings': do_site_data_stages(payload.get('repos', None), payload.get('outputs', None)) }
+    elif name not in get_enabled_stages():
+        logging.info(f"Stage {name} now performed by Runbook")
+        if payload.get('part', None) == 'collect':
+            result = {}
+    elif 'part' in payload:
+        result = run_stage_part(name, payload['part'], payload)
+    else:
+        run_stage(name, payload.get('repos', None))
 
     # Staff Projects no longer located on website (sarcasm:thanks for that :p )
     # logging.info("Building staff projects and milestones json files")
@@ -620,4 +667,4 @@ def main(name: str) -> str:
         tzinfo=datetime.timezone.utc).isoformat()
     logging.info(f"BuildSiteFiles finished at {utc_timestamp} with stage {name}")
 
-    return name
\ No newline at end of file
+    return result
@@ -12,17 +12,58 @@ from datetime import datetime, timedelta
 import azure.functions as func
 import azure.durable_functions as df
 
+# Repos are loaded once by BuildSiteFilesRepos and the independent stages run side by side:
+# the chapters, projects, committees, events and inactive chapters data files (stages 1, 2, 3 and 7,
+# compiled together in one pass by the 'stages' activity), chapter admin team (stage6) and
+# sitedata (stage8). Leaders (stage4) and community events (stage5)
+# read a file or a meetup group per repo, so they are split into region shards of at most
+# SHARD_SIZE repos whose results one last activity per stage merges and commits.
+
+SHARD_SIZE = 100
+
+def get_group_repos(repos, prefixes):
+    return [repo for repo in repos if any(prefix in repo['name'] for prefix in prefixes)]
+
+def get_region_shards(repos):
+    regions = {}
+    for repo in repos:
+        regions.setdefault(repo.get('region', None) or 'Unknown', []).append(repo)
+
+    shards = []
+    for region in sorted(regions.keys()):
+        region_repos = regions[region]
+        for start in range(0, len(region_repos), SHARD_SIZE):
+            shards.append(region_repos[start:start + SHARD_SIZE])
+
+    return shards
+
 def orchestrator_function(context: df.DurableOrchestrationContext):
-    stages = 8
-    on_stage = 1
-    outputs = []
     ro = df.RetryOptions(60000, 3)
+    repos = yield context.call_activity_with_retry('BuildSiteFilesRepos', ro, 'repos')
+
+    group_repos = get_group_repos(repos, ['www-chapter-', 'www-project-', 'www-committee-', 'www-revent-'])
+    shards = get_region_shards(group_repos)
+    logging.info(f'Fanning out stages over {len(repos)} repos, {len(shards)} shards')
+
+    tasks = [
+        context.call_activity_with_retry('BuildSiteFiles', ro, { 'stage': 'stages', 'repos': group_repos, 'outputs': ['chapters', 'projects', 'committees', 'revents', 'inactive_chapters'] }),
+        context.call_activity_with_retry('BuildSiteFiles', ro, 'stage6'),
+        context.call_activity_with_retry('BuildSiteFiles', ro, 'stage8')
+    ]
+    for stage in ['stage4', 'stage5']:
+        for shard in shards:
+            tasks.append(context.call_activity_with_retry('BuildSiteFiles', ro, { 'stage': stage, 'part': 'collect', 'repos': shard }))
+
+    results = yield context.task_all(tasks)
+    outputs = results[:3]
+    leader_results = results[3:3 + len(shards)]
+    event_results = results[3 + len(shards):]
 
-    while on_stage <= stages:        
-        logging.info(f'Calling activity with stage {on_stage}')
-        res = yield context.call_activity_with_retry('BuildSiteFiles', ro, f"stage{on_stage}")
-        outputs.append(res)
-        on_stage = on_stage + 1
+    repo_names = [repo['name'] for repo in group_repos]
+    outputs.extend((yield context.task_all([
+        context.call_activity_with_retry('BuildSiteFiles', ro, { 'stage': 'stage4', 'part': 'write', 'repo_names': repo_names, 'results': leader_results }),
+        context.call_activity_with_retry('BuildSiteFiles', ro, { 'stage': 'stage5', 'part': 'write', 'repo_names': repo_names, 'results': event_results })
+    ])))
 
     return outputs
     
@@ -0,0 +1,9 @@
+import logging
+from ..SharedCode import repositorytable
+
+# Loads the repository table once per BuildSiteFilesOrchestrator run, the orchestrator
+# hands each stage the repos it needs instead of every stage reading the table again.
+def main(name):
+    repos = repositorytable.get_repos()
+    logging.info(f"BuildSiteFilesRepos loaded {len(repos)} repositories")
+    return repos
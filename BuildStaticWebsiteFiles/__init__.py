@@ -6,14 +6,30 @@ import azure.functions as func
 from ..SharedCode import github
 from ..SharedCode import helperfuncs
 from ..SharedCode import meetup
+from ..SharedCode import repositorytable
 import base64
 
-def build_groups_jsons(gh):
-    repos = gh.GetPublicRepositories('www-')
+def get_group_repos(gh, incremental):
+    if not incremental:
+        return gh.GetPublicRepositories('www-')
+
+    # only repos pushed since the last harvest are re-read, the rest come from REPOSITORY_TABLE
+    previous = repositorytable.get_repository_entries()
+    entries = gh.GetRepositoryEntries('www-', previous=previous)
+    repositorytable.save_repository_entries(entries, previous)
+    changed = len([entry for entry in entries if entry['changed']])
+    logging.info(f"Incremental build: {changed} of {len(entries)} repositories changed")
+
+    # the build functions rewrite name and dates in place, keep the harvested entries untouched
+    return [dict(entry['repo']) for entry in entries]
+
+def build_groups_jsons(gh, incremental=False):
+    repos = get_group_repos(gh, incremental)
     committee_repos = []
     project_repos = []
     chapter_repos = []
     event_repos = []
+    files = {}
 
     for repo in repos:
         rname = repo['name']
@@ -29,32 +45,40 @@ def build_groups_jsons(gh):
     if len(committee_repos) > 0:
         logging.info('Building committees json file')
         try:
-            build_committee_json(committee_repos, gh)
+            build_committee_json(committee_repos, gh, files)
         except Exception as err:
             logging.error(f"Exception building committees json file: {err}")
     
     if len(project_repos) > 0:
         logging.info("Building project json file")
         try:
-            build_project_json(project_repos, gh)
+            build_project_json(project_repos, gh, files)
         except Exception as err:
             logging.error(f"Exception building project json: {err}")
 
     if len(chapter_repos) > 0:
         logging.info("Building chapter json file")
         try:
-            build_chapter_json(chapter_repos, gh)
+            build_chapter_json(chapter_repos, gh, files)
         except Exception as err:
             logging.error(f"Exception building chapter json: {err}")
 
     if len(event_repos) > 0:
         logging.info("Building event json file")
         try:
-            build_event_json(event_repos, gh)
+            build_event_json(event_repos, gh, files)
         except Exception as err:
             logging.error(f"Exception building event json: {err}")
 
-def build_event_json(repos, gh):
+    # all of the group data files go up in one commit
+    if len(files) > 0:
+        r = gh.CommitFiles('owasp.github.io', files, 'Update group data files')
+        if r.ok:
+            logging.info(f"Committed {', '.join(files.keys())} successfully")
+        else:
+            logging.error(f"Failed to commit {', '.join(files.keys())}: {r.text}")
+
+def build_event_json(repos, gh, files=None):
     fmt_str = "%a %b %d %H:%M:%S %Y"
     for repo in repos: #change to use title in project repo.....
         repo['name'] = repo['name'].replace('www-revent-','').replace('-', ' ')
@@ -73,20 +97,24 @@ def build_event_json(repos, gh):
     repos.sort(key=lambda x: x['name'])
     repos.sort(key=lambda x: x['level'], reverse=True)
    
+    contents = json.dumps(repos)
+    if files is not None: # the caller commits everything it staged in one go
+        files['_data/revents.json'] = contents
+        return
+
     sha = ''
     r = gh.GetFile('owasp.github.io', '_data/revents.json')
     if gh.TestResultCode(r.status_code):
         doc = json.loads(r.text)
         sha = doc['sha']
 
-    contents = json.dumps(repos)
     r = gh.UpdateFile('owasp.github.io', '_data/revents.json', contents, sha)
     if gh.TestResultCode(r.status_code):
         logging.info('Updated _data/events.json successfully')
     else:
         logging.error(f"Failed to update _data/revents.json: {r.text}")
 
-def build_committee_json(repos, gh):
+def build_committee_json(repos, gh, files=None):
     fmt_str = "%a %b %d %H:%M:%S %Y"
     for repo in repos: #change to use title in project repo.....
         repo['name'] = repo['name'].replace('www-committee-','').replace('-', ' ')
@@ -105,20 +133,24 @@ def build_committee_json(repos, gh):
     repos.sort(key=lambda x: x['name'])
     repos.sort(key=lambda x: x['level'], reverse=True)
    
+    contents = json.dumps(repos)
+    if files is not None: # the caller commits everything it staged in one go
+        files['_data/committees.json'] = contents
+        return
+
     sha = ''
     r = gh.GetFile('owasp.github.io', '_data/committees.json')
     if gh.TestResultCode(r.status_code):
         doc = json.loads(r.text)
         sha = doc['sha']
 
-    contents = json.dumps(repos)
     r = gh.UpdateFile('owasp.github.io', '_data/committees.json', contents, sha)
     if gh.TestResultCode(r.status_code):
         logging.info('Updated _data/committees.json successfully')
     else:
         logging.error(f"Failed to update _data/committees.json: {r.text}")
 
-def build_project_json(repos, gh):
+def build_project_json(repos, gh, files=None):
     # we want to build certain json data files every now and then to keep the website data fresh.
     #for each repository, public, with www-project
     #get name of project, level, and type
@@ -142,20 +174,24 @@ def build_project_json(repos, gh):
     repos.sort(key=lambda x: x['name'])
     repos.sort(key=lambda x: x['level'], reverse=True)
    
+    contents = json.dumps(repos)
+    if files is not None: # the caller commits everything it staged in one go
+        files['_data/projects.json'] = contents
+        return
+
     sha = ''
     r = gh.GetFile('owasp.github.io', '_data/projects.json')
     if gh.TestResultCode(r.status_code):
         doc = json.loads(r.text)
         sha = doc['sha']
 
-    contents = json.dumps(repos)
     r = gh.UpdateFile('owasp.github.io', '_data/projects.json', contents, sha)
     if gh.TestResultCode(r.status_code):
         logging.info('Updated _data/projects.json successfully')
     else:
         logging.error(f"Failed to update _data/projects.json: {r.text}")
 
-def build_chapter_json(repos, gh):
+def build_chapter_json(repos, gh, files=None):
     # we want to build certain json data files every now and then to keep the website data fresh.
     #for each repository, public, with www-project
     #get name of project, level, and type
@@ -196,13 +232,17 @@ def build_chapter_json(repos, gh):
     repos.sort(key=lambda x: x['name'])
     repos.sort(key=lambda x: x['region'], reverse=True)
    
+    contents = json.dumps(repos, indent=4)
+    if files is not None: # the caller commits everything it staged in one go
+        files['_data/chapters.json'] = contents
+        return
+
     sha = ''
     r = gh.GetFile('owasp.github.io', '_data/chapters.json')
     if gh.TestResultCode(r.status_code):
         doc = json.loads(r.text)
         sha = doc['sha']
 
-    contents = json.dumps(repos, indent=4)
     r = gh.UpdateFile('owasp.github.io', '_data/chapters.json', contents, sha)
     if gh.TestResultCode(r.status_code):
         logging.info('Updated _data/chapters.json successfully')
@@ -2,12 +2,11 @@ import logging
 
 import azure.functions as func
 import json
-import base64
 import os
 import stripe
 from ..SharedCode import copper
 
-from ..SharedCode.github import OWASPGitHub
+from ..SharedCode.leaderindex import leader_index
 from ..SharedCode.googleapi import OWASPGoogle
 from datetime import datetime
 
@@ -134,41 +133,17 @@ def membership_found(email): # check copper for membership data and then Stripe,
         raise
 
 def is_leader(email):
-    leader_emails = get_leader_emails()
-    if not leader_emails or len(leader_emails) == 0:
-        logging.error(
-            "Did not load any emails for the leaders.  Aborting process.")
-        return True # default to true because we could not get leader emails....
-
-    return (email in leader_emails)
-
-def get_leader_emails():
     if os.environ.get('Disable.OWASP.Emails.Test.Mode', None) == 'true':
         emails = os.environ.get('Disable.OWASP.Emails.Test.Leaders', None).replace(' ','').split(',')
-        return emails
+        return (email in emails)
 
     try:
-        gh = OWASPGitHub()
-        gr = gh.GetFile('owasp.github.io', '_data/leaders.json')
-
-        if gr.ok:
-            doc = json.loads(gr.text)
-            content = base64.b64decode(doc['content']).decode()
-            data = json.loads(content)
-            with open('/tmp/github-leaders-data.json', 'w') as outfile:
-                json.dump(data, outfile)
-        else:
-            logging.error('Error retreiving leaders file from Github')
-            return []
-
-        # extract emails and cleanse
-        emails = []
-        for leader in data:
-            cleansed_email = leader['email'].replace('mailto://', '')
-            cleansed_email = cleansed_email.replace('mailto:', '')
-            cleansed_email = cleansed_email.lower()
-            emails.append(cleansed_email)
-        return emails
+        if not leader_index.Refresh() or leader_index.Count() == 0:
+            logging.error(
+                "Did not load any emails for the leaders.  Aborting process.")
+            return True # default to true because we could not get leader emails....
+
+        return leader_index.IsLeader(email)
     except Exception as ex:
         template = "An exception of type {0} occurred while processing a customer. Arguments:\n{1!r}"
         message = template.format(type(ex).__name__, ex.args)
@@ -13,6 +13,9 @@ import stripe
 
 import urllib.parse
 
+from ..SharedCode import stripecatalog
+from ..SharedCode import inventory
+
 from mailchimp3 import MailChimp
 from mailchimp3.mailchimpclient import MailChimpError
 mailchimp = MailChimp(mc_api=os.environ["MAILCHIMP_API_KEY"])
@@ -22,6 +25,11 @@ from sendgrid.helpers.mail import Mail
 from sendgrid.helpers.mail import From
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
+    with stripecatalog.request_scope():
+        return handle_request(req)
+
+
+def handle_request(req: func.HttpRequest) -> func.HttpResponse:
     request = req.get_json()
     errors = validate_request(request)
 
@@ -30,19 +38,51 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as error:
         errors['product'] = ['The ticket option that you selected is no longer available.']
 
-    if not bool(errors):
-        is_comp_order = is_order_comped(line_items)
-        if is_comp_order is True:
-            response = create_comp_order(request, line_items)
-            return return_response(response, True)
+    # the order's stock is held from here, order.created then leaves inventory alone and an
+    # expired checkout session gives it back
+    if not bool(errors) and inventory.is_enabled():
+        if inventory.reserve_order(request.get('sku', []), get_discount_code(request)):
+            request['inventory_reserved'] = True
         else:
-            line_items = normalize_line_items(line_items)
-            response = create_checkout_session(request, line_items)
-            return return_response(response, True)
+            errors['product'] = ['Product sold out']
+
+    if not bool(errors):
+        try:
+            is_comp_order = is_order_comped(line_items)
+            if is_comp_order is True:
+                response = create_comp_order(request, line_items)
+                return return_response(response, True)
+            else:
+                line_items = normalize_line_items(line_items)
+                response = create_checkout_session(request, line_items)
+                return return_response(response, True)
+        except Exception:
+            if request.get('inventory_reserved', False):
+                inventory.release_order(request.get('sku', []), get_discount_code(request))
+            raise
     else:
         return return_response(errors, False)
 
 
+def get_discount_code(request):
+    discount_code = request.get('discount_code', None)
+    if discount_code is None or discount_code.strip() == '':
+        return None
+
+    return discount_code.strip().upper()
+
+
+# cached catalog objects can be behind on inventory: with INVENTORY_TABLE the reservation in main()
+# decides, without it the count is read from Stripe itself
+def is_sold_out(kind, obj):
+    if inventory.is_enabled() or obj.get('metadata', {}).get('inventory', None) is None:
+        return False
+
+    current = stripecatalog.retrieve(kind, obj['id'])
+    stock = current.get('metadata', {}).get('inventory', None)
+    return stock is not None and int(stock) < 1
+
+
 def validate_request(request: Dict) -> Dict:
     errors = {}
 
@@ -55,27 +95,16 @@ def validate_request(request: Dict) -> Dict:
 
     if request.get('discount_code', None) is not None and request.get('discount_code', None) is not '':
         try:
-            coupon = stripe.Coupon.retrieve(
-                request.get('discount_code').strip().upper(),
-                api_key=os.environ["STRIPE_SECRET"]
-            )
+            coupon = stripecatalog.get_coupon(request.get('discount_code').strip().upper())
             logging.info(coupon)
             metadata = coupon.get('metadata', {})
-            product = stripe.Product.retrieve(
-                metadata.get('event_id'),
-                api_key=os.environ["STRIPE_SECRET"]
-            )
-            sku = stripe.SKU.retrieve(
-                request.get('sku')[0],
-                api_key=os.environ["STRIPE_SECRET"]
-            )
+            product = stripecatalog.get_product(metadata.get('event_id'))
+            sku = stripecatalog.get_sku(request.get('sku')[0])
             sku_metadata = sku.get('metadata', {})
             if sku.get('product') != product['id'] or metadata.get('event_id') != product['id']:
                 errors['discount_code'] = ['This discount is not valid']
-            if metadata.get('inventory', None) is not None:
-                coupon_inventory = int(metadata.get('inventory'))
-                if (coupon_inventory < 1):
-                    errors['discount_code'] = ['This discount is not valid']
+            if is_sold_out(stripecatalog.COUPON, coupon):
+                errors['discount_code'] = ['This discount is not valid']
         except Exception as err:
             errors['discount_code'] = ['This discount is not valid']
 
@@ -93,10 +122,7 @@ def get_line_items(request):
 
     if request.get('discount_code', None) is not None:
         try:
-            coupon = stripe.Coupon.retrieve(
-                request.get('discount_code').strip().upper(),
-                api_key=os.environ["STRIPE_SECRET"]
-            )
+            coupon = stripecatalog.get_coupon(request.get('discount_code').strip().upper())
             metadata = coupon.get('metadata', {})
             available_discount = coupon.get('amount_off', 0)
             if coupon.get('percent_off', 0) == 100:
@@ -107,11 +133,7 @@ def get_line_items(request):
         except Exception as exception:
             pass
 
-    for sku in skus:
-        stripe_sku = stripe.SKU.retrieve(
-            sku,
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+    for stripe_sku in stripecatalog.get_skus(skus):
         sku_metadata = stripe_sku.get('metadata', {})
         
         # check that all skus belong to the same product
@@ -137,9 +159,8 @@ def get_line_items(request):
                     raise Exception('Invalid product')
 
         # check that sku has available inventory
-        if sku_metadata.get('inventory', None) is not None:
-            if int(sku_metadata['inventory']) < 1:
-                raise Exception('Product sold out')
+        if is_sold_out(stripecatalog.SKU, stripe_sku):
+            raise Exception('Product sold out')
 
         product_name = stripe_sku['attributes']['name']
         product_price = stripe_sku['price']
@@ -192,15 +213,11 @@ def create_checkout_session(request: Dict, line_items: Dict) -> Dict:
 
     if request.get('discount_code', None) is not None and request.get('discount_code', None) != '':
         metadata['discount_code'] = request.get('discount_code', None)
+    if request.get('inventory_reserved', False):
+        metadata['inventory_reserved'] = 'True'
 
-    sku = stripe.SKU.retrieve(
-        request.get('sku')[0],
-        api_key=os.environ["STRIPE_SECRET"]
-    )
-    product = stripe.Product.retrieve(
-        sku['product'],
-        api_key=os.environ["STRIPE_SECRET"]
-    )
+    sku = stripecatalog.get_sku(request.get('sku')[0])
+    product = stripecatalog.get_product(sku['product'])
 
     metadata['event_id'] = product['id']
 
@@ -238,6 +255,13 @@ def create_checkout_session(request: Dict, line_items: Dict) -> Dict:
     }
 
     api_request['line_items'] = line_items
+    if metadata.get('inventory_reserved', None):
+        # what to give back if the session expires unpaid
+        api_request['metadata'] = {
+            'skus': metadata['skus'],
+            'discount_code': metadata.get('discount_code', ''),
+            'inventory_reserved': 'True'
+        }
     api_request['api_key'] = os.environ["STRIPE_SECRET"]
     api_response = stripe.checkout.Session.create(**api_request)
 
@@ -296,15 +320,11 @@ def create_comp_order(request, line_items):
 
     if request.get('discount_code', None) is not None and request.get('discount_code', None) != '':
         metadata['discount_code'] = request.get('discount_code', None)
+    if request.get('inventory_reserved', False):
+        metadata['inventory_reserved'] = 'True'
 
-    sku = stripe.SKU.retrieve(
-        request.get('sku')[0],
-        api_key=os.environ["STRIPE_SECRET"]
-    )
-    product = stripe.Product.retrieve(
-        sku['product'],
-        api_key=os.environ["STRIPE_SECRET"]
-    )
+    sku = stripecatalog.get_sku(request.get('sku')[0])
+    product = stripecatalog.get_product(sku['product'])
     product_metadata = product.get('metadata', {})
 
     metadata['event_id'] = product['id']
@@ -316,11 +336,7 @@ def create_comp_order(request, line_items):
     order_items = []
     order_total = 0
 
-    for line_item in request.get('sku', []):
-        sku = stripe.SKU.retrieve(
-            line_item,
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+    for line_item, sku in zip(request.get('sku', []), stripecatalog.get_skus(request.get('sku', []))):
         order_items.append({
             "amount": sku['price'],
             "currency": sku['currency'],
@@ -375,10 +391,7 @@ def create_comp_order(request, line_items):
 
 
 def send_comp_receipt(metadata, line_items):
-    stripe_event = stripe.Product.retrieve(
-        metadata.get('event_id'),
-        api_key=os.environ["STRIPE_SECRET"]
-    )
+    stripe_event = stripecatalog.get_product(metadata.get('event_id'))
     first_name = metadata.get('name').strip().split(' ')[0]
     message = Mail(
 	from_email=From('noreply@owasp.org', 'OWASP'),
@@ -398,6 +411,10 @@ def send_comp_receipt(metadata, line_items):
 
 
 def increment_discount_code(discount_code):
+    if inventory.is_enabled():
+        inventory.add_use(discount_code)
+        return
+
     try:
         discount_code = discount_code.strip().upper()
         coupon = stripe.Coupon.retrieve(
@@ -411,6 +428,7 @@ def increment_discount_code(discount_code):
             metadata={"uses": uses},
             api_key=os.environ["STRIPE_SECRET"]
         )
+        stripecatalog.invalidate(stripecatalog.COUPON, discount_code)
     except Exception as exception:
         pass
 
@@ -445,10 +463,7 @@ def add_event_registrant_to_mailing_list(email, metadata):
         request_data
     )
 
-    product = stripe.Product.retrieve(
-        metadata.get('event_id'),
-        api_key=os.environ["STRIPE_SECRET"]
-    )
+    product = stripecatalog.get_product(metadata.get('event_id'))
 
     segment_name = '2020 ' + product['name']
 
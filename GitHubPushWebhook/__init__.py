@@ -0,0 +1,65 @@
+import logging
+
+import azure.functions as func
+
+import os
+import json
+import hmac
+import hashlib
+
+from ..SharedCode import repositorytable
+
+# Organization webhook for pushes to the www- repositories. GitHub signs the body with
+# GH_WEBHOOK_SECRET (X-Hub-Signature-256); a verified push to a repository's default branch is
+# queued for SiteDataQueueWorker with the paths it touched, which refreshes that repository's row
+# in REPOSITORY_TABLE and only the site data files it shows up in, rather than waiting for the
+# nightly harvest.
+
+def is_valid_signature(body, signature):
+    secret = os.environ.get('GH_WEBHOOK_SECRET', '')
+    if not secret or not signature:
+        return False
+
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+# GitHub lists at most PUSH_COMMITS_LISTED commits of a push, None (anything may have changed) for bigger ones
+PUSH_COMMITS_LISTED = 20
+
+def get_pushed_paths(payload):
+    commits = payload.get('commits', [])
+    if len(commits) >= PUSH_COMMITS_LISTED or payload.get('forced', False):
+        return None
+
+    paths = set()
+    for commit in commits:
+        for change in ['added', 'modified', 'removed']:
+            paths.update(commit.get(change, []))
+
+    return sorted(paths)
+
+def main(req: func.HttpRequest, sdmsg: func.Out[func.QueueMessage]) -> func.HttpResponse:
+    body = req.get_body()
+    if not is_valid_signature(body, req.headers.get('X-Hub-Signature-256', None)):
+        logging.warn('GitHub webhook with a missing or bad signature')
+        return func.HttpResponse(status_code=401)
+
+    event_type = req.headers.get('X-GitHub-Event', '')
+    if event_type != 'push': # ping and anything else the hook was set up with
+        return func.HttpResponse(status_code=200)
+
+    payload = json.loads(body.decode('utf-8'))
+    repository = payload.get('repository', {})
+    repo_name = repository.get('name', '').lower()
+    if repositorytable.get_partition_key(repo_name) == repositorytable.OTHER_PARTITION_KEY:
+        return func.HttpResponse(status_code=200)
+    if payload.get('ref', '') != 'refs/heads/' + repository.get('default_branch', ''): # not what the site is built from
+        return func.HttpResponse(status_code=200)
+
+    sdmsg.set(json.dumps({
+        'repo': repo_name,
+        'paths': get_pushed_paths(payload),
+        'delivery': req.headers.get('X-GitHub-Delivery', None)
+    }))
+
+    return func.HttpResponse(status_code=202)
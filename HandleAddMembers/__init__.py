@@ -2,10 +2,8 @@ import logging
 
 import azure.functions as func
 import base64
-import requests
 import os
-import jwt
-import json
+from ..SharedCode import accesskeys
 
 
 def main(req: func.HttpRequest, mqueue: func.Out[func.QueueMessage]) -> func.HttpResponse:
@@ -57,24 +55,11 @@ def validate_usage(req):
         
     return allow_login
 
-def get_public_keys():
-    r = requests.get(os.environ['CF_TEAMS_DOMAIN'])
-    public_keys = []
-    jwk_set = r.json()
-    for key_dict in jwk_set['keys']:
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key_dict))
-        public_keys.append(public_key)
-    return public_keys
-
 def get_token_data(token):
     data = {}
-    keys = get_public_keys()
-    
-    for key in keys:
-        try:
-            data = jwt.decode(token, key=key, audience=os.environ['CF_ADMIN_POLICY_AUD'], algorithms=['RS256'], verify=True)
-            break
-        except Exception as err:
-            pass
+    try:
+        data = accesskeys.decode_access_token(token, audience=os.environ['CF_ADMIN_POLICY_AUD'])
+    except Exception as err:
+        pass
 
     return data
\ No newline at end of file
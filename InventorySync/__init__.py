@@ -0,0 +1,17 @@
+import datetime
+import logging
+
+import azure.functions as func
+
+from ..SharedCode import inventory
+
+def main(mytimer: func.TimerRequest) -> None:
+    utc_timestamp = datetime.datetime.utcnow().replace(
+        tzinfo=datetime.timezone.utc).isoformat()
+
+    if mytimer.past_due:
+        logging.info('The timer is past due!')
+    logging.info('InventorySync function ran at %s', utc_timestamp)
+
+    # checkouts count against INVENTORY_TABLE, Stripe metadata catches up here
+    inventory.sync()
@@ -3,8 +3,7 @@ import json
 import os
 import re
 import azure.functions as func
-from ..SharedCode.github import OWASPGitHub
-import base64
+from ..SharedCode.leaderindex import leader_index
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
@@ -19,22 +18,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             email = req_body.get('email')
 
     if email:
-        email = email.lower()
-        gh = OWASPGitHub()
-        r = gh.GetFile('owasp.github.io', '_data/leaders.json')
-        if r.ok:
-            doc = json.loads(r.text)
-            content = base64.b64decode(doc['content']).decode(encoding='utf-8')
-            leaders = json.loads(content)
-            AddAdditionalLeaders(leaders)
-            is_leader = False
-            groups = []
-            for leader in leaders:
-                if email == leader['email']:
-                    is_leader = True
-                    groups.append(leader['group'])
+        if leader_index.Refresh():
+            leaders = leader_index.GetLeader(email, include_additional=True)
+            is_leader = len(leaders) > 0
+            groups = [leader['group'] for leader in leaders]
 
-            
             result = {
                 'leader': is_leader,
                 'groups': groups
@@ -57,7 +45,3 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
              body=json.dumps(error),
              status_code=404
         )
-
-def AddAdditionalLeaders(leaders):
-    addLeaders = json.loads(os.environ.get('OWASP.Additional.Leaders', '{ }'))
-    leaders.extend(addLeaders)
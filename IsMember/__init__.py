@@ -3,6 +3,7 @@ import os
 import json
 import azure.functions as func
 from ..SharedCode.copper import OWASPCopper
+from ..SharedCode import membershipindex
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request.')
@@ -57,6 +58,9 @@ def validate_member(member_email):
     msg = "User not found"
     code = 404
 
+    if membershipindex.is_enabled() and membershipindex.is_current_member(member_email):
+        return func.HttpResponse("User found", status_code=200)
+
     cp = OWASPCopper()
     opptxt = cp.FindMemberOpportunity(member_email)
     if opptxt != None and 'Error:' not in opptxt:
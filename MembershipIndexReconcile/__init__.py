@@ -0,0 +1,17 @@
+import datetime
+import logging
+
+import azure.functions as func
+
+from ..SharedCode import membershipindex
+
+def main(mytimer: func.TimerRequest) -> None:
+    utc_timestamp = datetime.datetime.utcnow().replace(
+        tzinfo=datetime.timezone.utc).isoformat()
+
+    if mytimer.past_due:
+        logging.info('The timer is past due!')
+    logging.info('MembershipIndexReconcile function ran at %s', utc_timestamp)
+
+    # webhooks keep the index current, this catches anything they missed
+    membershipindex.reconcile()
@@ -0,0 +1,96 @@
+import os
+import re
+import json
+import time
+import threading
+import jwt
+from jwt import algorithms
+from .httpsession import get_session
+
+# Verification keys for the tokens the member functions accept.
+# The Cloudflare Access signing keys (the CF_TEAMS_DOMAIN JWKS) are parsed once per worker and kept
+# by kid for as long as the response's Cache-Control max-age allows, JWKS_CACHE_TTL when it sends none.
+# A kid not in the set refetches it once, at most every JWKS_REFRESH_INTERVAL seconds, so rotated
+# keys are picked up without letting made-up kids trigger a download per request.
+# CF_MEMBERSHIP_KEY_PUBLIC, which the OTP flow signs its own tokens with, is parsed once as well.
+
+CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', '3600'))
+REFRESH_INTERVAL = int(os.environ.get('JWKS_REFRESH_INTERVAL', '30'))
+
+class JWKSCache:
+    def __init__(self, url):
+        self.url = url
+        self.lock = threading.Lock()
+        self.keys = {}
+        self.expires = 0
+        self.fetched = 0
+
+    def GetMaxAge(self, headers):
+        match = re.search(r'max-age=(\d+)', headers.get('Cache-Control', ''))
+        if match:
+            return int(match.group(1))
+
+        return CACHE_TTL
+
+    def Refresh(self):
+        r = get_session().get(self.url)
+        r.raise_for_status()
+        keys = {}
+        for key_dict in r.json()['keys']:
+            keys[key_dict.get('kid', None)] = algorithms.RSAAlgorithm.from_jwk(json.dumps(key_dict))
+
+        self.keys = keys
+        self.fetched = time.time()
+        self.expires = self.fetched + self.GetMaxAge(r.headers)
+
+    # the parsed key for kid, or every key when the token did not name one
+    def GetKeys(self, kid=None):
+        with self.lock:
+            if time.time() >= self.expires:
+                self.Refresh()
+            elif kid is not None and kid not in self.keys and time.time() - self.fetched >= REFRESH_INTERVAL:
+                self.Refresh()
+
+            if kid is None:
+                return list(self.keys.values())
+            if kid in self.keys:
+                return [self.keys[kid]]
+
+            return []
+
+_access_keys = None
+_membership_key = None
+_keys_lock = threading.Lock()
+
+def get_access_keys():
+    global _access_keys
+    with _keys_lock:
+        if _access_keys is None:
+            _access_keys = JWKSCache(os.environ['CF_TEAMS_DOMAIN'])
+
+    return _access_keys
+
+def get_membership_public_key():
+    global _membership_key
+    with _keys_lock:
+        if _membership_key is None:
+            _membership_key = algorithms.RSAAlgorithm.from_jwk(os.environ['CF_MEMBERSHIP_KEY_PUBLIC'])
+
+    return _membership_key
+
+# decoded claims of a Cloudflare Access token, raises jwt.InvalidTokenError when it does not verify
+def decode_access_token(token, audience=None):
+    kid = jwt.get_unverified_header(token).get('kid', None)
+    keys = get_access_keys().GetKeys(kid)
+    if len(keys) == 0:
+        raise jwt.InvalidTokenError(f"No signing key for kid {kid}")
+
+    options = {} if audience else { 'verify_aud': False }
+    lasterr = None
+    for key in keys:
+        try:
+            return jwt.decode(token, key=key, audience=audience, algorithms=['RS256'], options=options)
+        except jwt.InvalidSignatureError as err:
+            lasterr = err
+
+    raise lasterr
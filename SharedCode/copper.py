@@ -1,11 +1,59 @@
 from re import sub
 import re
-import requests
 import json
 import os
 import logging
 from datetime import datetime, timedelta
 import time
+import random
+import threading
+from cachetools import TTLCache
+from .httpsession import get_session
+
+# Read-through cache for the Copper lookups membership checks repeat for the same people:
+# person search by email, person by id, a person's related opportunities and opportunities by id.
+# Entries live COPPER_CACHE_TTL seconds and the writes in OWASPCopper invalidate what they change.
+class CopperCache:
+    def __init__(self, ttl=None, maxsize=None):
+        if ttl is None:
+            ttl = int(os.environ.get('COPPER_CACHE_TTL', '300'))
+        if maxsize is None:
+            maxsize = int(os.environ.get('COPPER_CACHE_SIZE', '2048'))
+        self.lock = threading.Lock()
+        self.entries = None
+        if ttl > 0:
+            self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def Get(self, kind, key):
+        if self.entries is None:
+            return None
+        with self.lock:
+            entry = self.entries.get((kind, str(key).lower()), None)
+        if entry is None:
+            return None
+
+        return entry['text']
+
+    # pids are the people an entry is about, so person invalidation can find email searches too
+    def Set(self, kind, key, text, pids=None):
+        if self.entries is None:
+            return
+        with self.lock:
+            self.entries[(kind, str(key).lower())] = { 'text': text, 'pids': [str(pid) for pid in pids or []] }
+
+    def Invalidate(self, kind, key):
+        if self.entries is None:
+            return
+        with self.lock:
+            self.entries.pop((kind, str(key).lower()), None)
+
+    def InvalidatePerson(self, pid):
+        if self.entries is None or pid is None:
+            return
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if key in [('person', str(pid)), ('person_opps', str(pid))] or str(pid) in entry['pids']:
+                    self.entries.pop(key, None)
 
 class OWASPCopper:
 
@@ -17,6 +65,7 @@ class OWASPCopper:
     cp_related_fragment = ':entity/:entity_id/related'
     cp_custfields_fragment = 'custom_field_definitions/'
     cp_search_fragment = "search"
+    cache = CopperCache()
     
     # Custom Field Definition Ids
     cp_project_type = 399609
@@ -146,7 +195,7 @@ class OWASPCopper:
     def CallTimeoutCopperRequest(self, url):
         r = None
         while True:
-            r = requests.get(url, headers=self.GetHeaders())
+            r = get_session().get(url, headers=self.GetHeaders())
             if not r.ok:
                 if 'Gateway' in r.text or 'Time-out' in r.text:
                     time.sleep(random.random() * 2.0 + 2.0)
@@ -163,7 +212,7 @@ class OWASPCopper:
             'sort_by': 'name'
         }
         url = f'{self.cp_base_url}{self.cp_projects_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             return r.text
         
@@ -178,23 +227,71 @@ class OWASPCopper:
             if len(jsonp) > 0:
                 pid = jsonp[0]['id']
         if pid != None:
-            url = f'{self.cp_base_url}{self.cp_related_fragment}'
-            url = url.replace(':entity_id', str(pid)).replace(':entity', 'people')
-            url = url + '/opportunities'
-            r = requests.get(url, headers=self.GetHeaders())
-            if r.ok and r.text:
-                opps = json.loads(r.text)
+            opps_text = self.GetRelatedOpportunities(pid)
+            if opps_text:
+                opps = json.loads(opps_text)
 
         return opps
 
+    def GetRelatedOpportunities(self, pid):
+        opps_text = self.cache.Get('person_opps', pid)
+        if opps_text is not None:
+            return opps_text
+
+        url = f'{self.cp_base_url}{self.cp_related_fragment}'
+        url = url.replace(':entity_id', str(pid)).replace(':entity', 'people')
+        url = url + '/opportunities'
+        r = self.CallTimeoutCopperRequest(url)
+        if r.ok and r.text:
+            self.cache.Set('person_opps', pid, r.text, [pid])
+            return r.text
+
+        logging.info(f"Failed to list opportunities: {r.text}")
+        return ''
+
     def GetOpportunity(self, oid):
         opp = None
-        url = f'{self.cp_base_url}{self.cp_opp_fragment}{oid}'
-        r = requests.get(url, headers=self.GetHeaders())
-        if r.ok and r.text:
-            opp = json.loads(r.text)
+        opp_text = self.cache.Get('opportunity', oid)
+        if opp_text is None:
+            url = f'{self.cp_base_url}{self.cp_opp_fragment}{oid}'
+            r = get_session().get(url, headers=self.GetHeaders())
+            if r.ok and r.text:
+                opp_text = r.text
+                self.cache.Set('opportunity', oid, opp_text)
+        if opp_text:
+            opp = json.loads(opp_text)
         
         return opp
+
+    # Fetches many opportunities with the opportunity search by ids instead of one GET per id.
+    # Returns a dict of id -> opportunity for the ones found; None if the search failed.
+    def GetOpportunities(self, ids):
+        opps = {}
+        missing = []
+        for oid in ids:
+            opp_text = self.cache.Get('opportunity', oid)
+            if opp_text is not None:
+                opps[oid] = json.loads(opp_text)
+            elif oid not in missing:
+                missing.append(oid)
+
+        url = f'{self.cp_base_url}{self.cp_opp_fragment}{self.cp_search_fragment}'
+        for i in range(0, len(missing), 200):
+            data = {
+                'page_size': 200,
+                'sort_by': 'name',
+                'ids': missing[i:i + 200]
+            }
+            r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
+            if not r.ok:
+                logging.error(f"Failed to get opportunities: {r.text}")
+                return None
+
+            for opportunity in json.loads(r.text):
+                opps[opportunity['id']] = opportunity
+                self.cache.Set('opportunity', opportunity['id'], json.dumps(opportunity))
+
+        return opps
         
     def ListOpportunities(self, page_number=1, pipeline_ids=None, status_ids=[0,1,2,3]):
         data = {
@@ -208,7 +305,7 @@ class OWASPCopper:
             data['pipeline_ids'] = pipeline_ids
 
         url = f'{self.cp_base_url}{self.cp_opp_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             return r.text
         
@@ -224,20 +321,20 @@ class OWASPCopper:
                 pid = jsonp[0]['id']
         
         if pid != None:
-            url = f"{self.cp_base_url}{self.cp_related_fragment}"
-            url = url.replace(':entity_id', str(pid)).replace(':entity', 'people')
-            url = url + '/opportunities'
-            r = self.CallTimeoutCopperRequest(url)
-            if r.ok and r.text:
+            opps_text = self.GetRelatedOpportunities(pid)
+            opportunities = None
+            if opps_text:
+                related = json.loads(opps_text)
+                opportunities = self.GetOpportunities([item['id'] for item in related])
+            if opportunities is not None:
                 today = datetime.today()
                 tdstamp = int(today.timestamp())
-                for item in json.loads(r.text):
-                    url = url = f"{self.cp_base_url}{self.cp_opp_fragment}{item['id']}"
-                    r = self.CallTimeoutCopperRequest(url)
-                    if r.ok:
-                        opportunity = json.loads(r.text)
+                for item in related:
+                    if item['id'] in opportunities:
+                        opportunity = opportunities[item['id']]
+                        opp_text = json.dumps(opportunity)
                         if 'Lifetime' in opportunity['name'] or ('Membership' in opportunity['name'] and opportunity['monetary_value'] == 500):
-                            return r.text
+                            return opp_text
                         elif 'Membership' not in opportunity['name'] or 'Corporate' in opportunity['name']:
                             continue
                         
@@ -247,22 +344,21 @@ class OWASPCopper:
                                 if mend is not None:
                                     if subscription_data == None: # no data, just find first non-expired membership, if any
                                         if mend > tdstamp: 
-                                            opp = r.text
+                                            opp = opp_text
                                             tdstamp = mend # set this to current mend...later opp might be greater date
                                     elif subscription_data['membership_end']:
                                         tend = int(datetime.strptime(subscription_data['membership_end'], "%Y-%m-%d").timestamp())
                                         if mend == tend:
-                                            return r.text
+                                            return opp_text
                                 else:
                                     logging.error(f"Membership end is missing for {email}")
                                     opp = f'Error: Membership end is missing for {email}'
 
                     else:
-                        logging.info("Failed to get opportunity: {r.text}")
-                        opp = 'Error: ' + r.text
+                        logging.info(f"Failed to get opportunity: {item['id']}")
+                        opp = f"Error: failed to get opportunity {item['id']}"
             else:
-                logging.info(f"Failed to list opportunities: {r.text}")
-                opp = 'Error: ' + r.text
+                opp = 'Error: failed to get opportunities'
         else:
             logging.info("Failed to get person inside Opportunity")
             opp = 'Error: failed to get person'
@@ -275,7 +371,7 @@ class OWASPCopper:
         url = f"{self.cp_base_url}{self.cp_related_fragment}"
         url = url.replace(':entity_id', str(opp_id)).replace(':entity', 'opportunities')
         url = url + '/people'
-        r = requests.get(url, headers=self.GetHeaders())
+        r = get_session().get(url, headers=self.GetHeaders())
         if r.ok and r.text:
             persons = json.loads(r.text)
             if persons and len(persons) > 1:
@@ -293,9 +389,14 @@ class OWASPCopper:
 
     def GetPerson(self, pid):
         if pid:
+            pers_text = self.cache.Get('person', pid)
+            if pers_text is not None:
+                return pers_text
+
             url = f"{self.cp_base_url}{self.cp_people_fragment}{pid}"
-            r = requests.get(url, headers = self.default_headers)
+            r = get_session().get(url, headers = self.default_headers)
             if r.ok:
+                self.cache.Set('person', pid, r.text, [pid])
                 return r.text
             else:
                 logging.error(r.text)
@@ -315,10 +416,21 @@ class OWASPCopper:
         if len(lstxt) <= 0:
             return ''
 
+        people_text = self.cache.Get('email', lstxt)
+        if people_text is not None:
+            return people_text
+
+        people_text = self.SearchPersonByEmail(lstxt)
+        if people_text and people_text != '[]': # only remember people we found, they may be created any time
+            self.cache.Set('email', lstxt, people_text, [person['id'] for person in json.loads(people_text)])
+
+        return people_text
+
+    def SearchPersonByEmail(self, lstxt):
         # first use fetch_by_email
         url = f'{self.cp_base_url}{self.cp_people_fragment}fetch_by_email'
         data = { 'email': lstxt }
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok and r.text != '[]':
             return f"[{r.text}]"
 
@@ -330,7 +442,7 @@ class OWASPCopper:
 
         url = f'{self.cp_base_url}{self.cp_people_fragment}{self.cp_search_fragment}'
         
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             return r.text
         
@@ -348,7 +460,7 @@ class OWASPCopper:
         }
 
         url = f'{self.cp_base_url}{self.cp_people_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             return r.text
         
@@ -357,28 +469,9 @@ class OWASPCopper:
     def FindPersonByEmailObj(self, searchtext):
         results = []
 
-        lstxt = searchtext.lower()
-        if len(lstxt) <= 0:
-            return results
-
-        # first use fetch_by_email
-        url = f'{self.cp_base_url}{self.cp_people_fragment}fetch_by_email'
-        data = { 'email': lstxt }
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
-        if r.ok and r.text != '[]':
-            results = [json.loads(r.text)]
-
-        if len(results) == 0:
-            data = {
-                'page_size': 5,
-                'sort_by': 'name',
-                'emails': [lstxt]
-            }
-
-            url = f'{self.cp_base_url}{self.cp_people_fragment}{self.cp_search_fragment}'        
-            r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
-            if r.ok:
-                results = json.loads(r.text)
+        people_text = self.FindPersonByEmail(searchtext)
+        if people_text:
+            results = json.loads(people_text)
         
         return results
 
@@ -394,7 +487,7 @@ class OWASPCopper:
         }
         results = []
         url = f'{self.cp_base_url}{self.cp_people_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             res = json.loads(r.text)
             results.extend(res)
@@ -406,7 +499,7 @@ class OWASPCopper:
         }
 
         url = f'{self.cp_base_url}{self.cp_people_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             res = json.loads(r.text)
             results.extend(res)
@@ -418,7 +511,7 @@ class OWASPCopper:
         }
 
         url = f'{self.cp_base_url}{self.cp_people_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             res = json.loads(r.text)
             results.extend(res)
@@ -545,7 +638,8 @@ class OWASPCopper:
         data['custom_fields'] = fields
 
         url = f'{self.cp_base_url}{self.cp_people_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.Invalidate('email', email)
         pid = None
         if r.ok:
             person = json.loads(r.text)
@@ -561,7 +655,8 @@ class OWASPCopper:
         logging.info("Copper Update Address")
         data = { 'address': address_data }
         url = f'{self.cp_base_url}{self.cp_people_fragment}{pid}'
-        r = requests.put(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().put(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.InvalidatePerson(pid)
         pid = None
         if r.ok:
             person = json.loads(r.text)
@@ -580,7 +675,8 @@ class OWASPCopper:
             'emails': person_data['emails']            
         }
         url = f'{self.cp_base_url}{self.cp_people_fragment}{pid}'
-        r = requests.put(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().put(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.InvalidatePerson(pid)
         pid = None
         if r.ok:
             person = json.loads(r.text)
@@ -713,7 +809,8 @@ class OWASPCopper:
                 data['emails'].append({ 'email':other_email, 'category':'other'})
 
         url = f'{self.cp_base_url}{self.cp_people_fragment}{pid}'
-        r = requests.put(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().put(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.InvalidatePerson(pid)
         pid = None
         if r.ok:
             person = json.loads(r.text)
@@ -749,7 +846,8 @@ class OWASPCopper:
             }
 
             url = f'{self.cp_base_url}{self.cp_people_fragment}{pid}'
-            r = requests.put(url, headers=self.GetHeaders(), data=json.dumps(data))
+            r = get_session().put(url, headers=self.GetHeaders(), data=json.dumps(data))
+            self.cache.InvalidatePerson(pid)
             pid = None
             if r.ok:
                 person = json.loads(r.text)
@@ -772,7 +870,8 @@ class OWASPCopper:
         }
 
         url = f'{self.cp_base_url}{self.cp_opp_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.Invalidate('person_opps', people[0]['id'])
         if r.ok:
             return r.text
         else:
@@ -842,7 +941,8 @@ class OWASPCopper:
             data['custom_fields'] = fields
 
         url = f'{self.cp_base_url}{self.cp_opp_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.Invalidate('person_opps', pid)
         if r.ok:
             return r.text
         else:
@@ -857,7 +957,7 @@ class OWASPCopper:
             'name': proj_name, 
         }
         url = f'{self.cp_base_url}{self.cp_projects_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             return r.text
         
@@ -872,7 +972,8 @@ class OWASPCopper:
         }
         url = f'{self.cp_base_url}{self.cp_related_fragment}'
         url = url.replace(':entity_id', str(entity_id)).replace(':entity', entity)
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        self.cache.InvalidatePerson(person_id)
         if r.ok:
             return r.text
 
@@ -888,7 +989,7 @@ class OWASPCopper:
         }
         projects = []
         url = f'{self.cp_base_url}{self.cp_projects_fragment}{self.cp_search_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             projects = json.loads(r.text)
             return projects
@@ -956,7 +1057,7 @@ class OWASPCopper:
         data['custom_fields'] = custom_fields
 
         url = f'{self.cp_base_url}{self.cp_projects_fragment}'
-        r = requests.post(url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             project = json.loads(r.text)
             pid = project['id']
@@ -994,7 +1095,7 @@ class OWASPCopper:
 
     def GetCustomFields(self):
         url = f'{self.cp_base_url}{self.cp_custfields_fragment}'
-        r = requests.get(url, headers=self.GetHeaders())
+        r = get_session().get(url, headers=self.GetHeaders())
         if r.ok:
             return r.text
         
@@ -1002,7 +1103,7 @@ class OWASPCopper:
 
     def GetPipeline(self, pipeline_name):
         url = f'{self.cp_base_url}{self.cp_pipeline_fragment}'
-        r = requests.get(url, headers=self.GetHeaders())
+        r = get_session().get(url, headers=self.GetHeaders())
         
         if r.ok:
             pipelines = json.loads(r.text)
@@ -6,13 +6,11 @@ import stripe
 
 from .event import Event
 from .slack_response import SlackResponse
+from .. import stripecatalog
 
 class DiscountCode:
     def create(event_payload={}, response_url=None):
-        product = stripe.Product.retrieve(
-            event_payload.get('event_id'),
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+        product = stripecatalog.get_product(event_payload.get('event_id'))
 
         metadata = {
             'event_id': event_payload.get('event_id')
@@ -73,10 +71,7 @@ class DiscountCode:
             callback_id = 'edit_discount_code|' + discount_code["id"]
             submit_label = 'Update'
             title = 'Edit Discount Code'
-            product = stripe.Product.retrieve(
-                discount_code['metadata'].get('event_id'),
-                api_key=os.environ["STRIPE_SECRET"]
-            )
+            product = stripecatalog.get_product(discount_code['metadata'].get('event_id'))
             currency = product['metadata'].get('currency', 'usd')
             if currency == 'eur':
                 currency_symbol = '€'
@@ -275,10 +270,7 @@ class DiscountCode:
                 "type": "divider"
             })
 
-            product = stripe.Product.retrieve(
-                event_id,
-                api_key=os.environ["STRIPE_SECRET"]
-            )
+            product = stripecatalog.get_product(event_id)
 
             currency = product['metadata'].get('currency', 'usd')
             if currency == 'eur':
@@ -364,14 +356,12 @@ class DiscountCode:
             discount_code,
             api_key=os.environ["STRIPE_SECRET"]
         )
-        product = stripe.Product.retrieve(
-            discount_code['metadata']['event_id'],
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+        product = stripecatalog.get_product(discount_code['metadata']['event_id'])
         stripe.Coupon.delete(
             discount_code['id'],
             api_key=os.environ["STRIPE_SECRET"]
         )
+        stripecatalog.invalidate(stripecatalog.COUPON, discount_code['id'])
         response_message = SlackResponse.message(response_url, 'Discount Code deleted successfully')
         response_message.add_block({
             "type": "section",
@@ -3,6 +3,7 @@ import logging
 import json
 
 from .slack_response import SlackResponse
+from .. import stripecatalog
 
 import stripe
 
@@ -204,10 +205,7 @@ class Event:
 
     @classmethod
     def show_event(cls, response_url, product_id):
-        product = stripe.Product.retrieve(
-            product_id,
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+        product = stripecatalog.get_product(product_id)
         response_message = SlackResponse.message(response_url, text='Manage Event')
         response_message.add_block({
             "type": "section",
@@ -4,16 +4,14 @@ import json
 
 from .slack_response import SlackResponse
 from .event import Event
+from .. import stripecatalog
 
 import stripe
 
 class Product:
     @classmethod
     def create_product(cls, event_payload={}, response_url=None):
-        product = stripe.Product.retrieve(
-            event_payload.get('event_id'),
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+        product = stripecatalog.get_product(event_payload.get('event_id'))
 
         metadata = {
             "type": "regular"
@@ -105,10 +103,7 @@ class Product:
             api_key=os.environ["STRIPE_SECRET"]
         )
 
-        product = stripe.Product.retrieve(
-            sku['product'],
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+        product = stripecatalog.get_product(sku['product'])
 
         response_message = SlackResponse.message(response_url, 'Product updated successfully')
         response_message.add_block({
@@ -506,10 +501,7 @@ class Product:
             product_id,
             api_key=os.environ["STRIPE_SECRET"]
         )
-        product = stripe.Product.retrieve(
-            sku['product'],
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+        product = stripecatalog.get_product(sku['product'])
         stripe.SKU.modify(
             product_id,
             active=False,
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import base64
+import logging
+
+from azure.common import AzureConflictHttpError, AzureHttpError, AzureMissingResourceHttpError
+from azure.cosmosdb.table.tableservice import TableService
+
+from .. import github
+
+# _data/products.json in an event repo lists the SKUs of its Stripe product.
+# Setting up an event creates and edits dozens of SKUs in a few seconds, so SKU changes are held
+# in PRODUCTS_PENDING_TABLE (PartitionKey repo, RowKey sku id, latest change wins) and a
+# products.flush job on the stripe queue applies everything pending for the repo in one commit
+# once no change has come in for PRODUCTS_DEBOUNCE seconds. A commit that loses the race on sha
+# reads the file again and re-applies the changes on top. The 'flush' row marks a repo that already
+# has a flush job on its way. Without PRODUCTS_PENDING_TABLE each change is committed on its own.
+
+PRODUCTS_FILE = '_data/products.json'
+FLUSH_ROW_KEY = 'flush'
+FLUSH_JOB = 'products.flush'
+DEBOUNCE = int(os.environ.get('PRODUCTS_DEBOUNCE', '30'))
+COMMIT_ATTEMPTS = 5
+
+def is_enabled():
+    return bool(os.environ.get('PRODUCTS_PENDING_TABLE', ''))
+
+def get_table_service():
+    return TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+def send_flush_job(repo_name, delay):
+    from azure.storage.queue import QueueClient, TextBase64EncodePolicy # only needed with PRODUCTS_PENDING_TABLE
+
+    queue = QueueClient.from_connection_string(os.environ['AzureWebJobsStorage'], 'stripequeue', message_encode_policy=TextBase64EncodePolicy())
+    queue.send_message(json.dumps({ 'job_type': FLUSH_JOB, 'repo_name': repo_name }), visibility_timeout=delay)
+
+# op is 'create', 'update' (only if already listed) or 'delete'; sku is the products.json entry
+def add_change(repo_name, op, sku, table_service=None):
+    if not is_enabled():
+        commit_changes(repo_name, [{ 'op': op, 'sku': sku }])
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['PRODUCTS_PENDING_TABLE']
+    try:
+        pending = table_service.get_entity(table_name, repo_name, sku['id'])
+        if pending['Op'] == 'create' and op == 'update': # not in the file yet
+            op = 'create'
+    except AzureMissingResourceHttpError:
+        pass
+
+    table_service.insert_or_replace_entity(table_name, { 'PartitionKey': repo_name, 'RowKey': sku['id'], 'Op': op, 'Sku': json.dumps(sku), 'Changed': time.time() })
+
+    try:
+        table_service.insert_entity(table_name, { 'PartitionKey': repo_name, 'RowKey': FLUSH_ROW_KEY, 'Changed': time.time() })
+    except AzureConflictHttpError: # a flush is already on its way
+        return
+    send_flush_job(repo_name, DEBOUNCE)
+
+def apply_changes(products, changes):
+    for change in changes:
+        sku = change['sku']
+        position = None
+        for i in range(len(products['products'])):
+            if products['products'][i]['id'] == sku['id']:
+                position = i
+                break
+
+        if change['op'] == 'delete':
+            if position is not None:
+                del products['products'][position]
+        elif position is not None:
+            products['products'][position].update(sku)
+        elif change['op'] == 'create':
+            products['products'].append(sku)
+
+    return products
+
+def commit_changes(repo_name, changes, gh=None):
+    if not gh:
+        gh = github.OWASPGitHub()
+
+    for attempt in range(COMMIT_ATTEMPTS):
+        existing_file = gh.GetFile(repo_name, PRODUCTS_FILE)
+        if existing_file.status_code == 404: # not every event repo lists its products
+            logging.info(f"No {PRODUCTS_FILE} in {repo_name}, {len(changes)} product changes not applied")
+            return
+        if not gh.TestResultCode(existing_file.status_code):
+            raise Exception(f"Failed to read {repo_name}/{PRODUCTS_FILE}: {existing_file.text}")
+
+        doc = json.loads(existing_file.text)
+        products = json.loads(base64.b64decode(doc['content']).decode('utf-8'))
+        file_contents = json.dumps(
+            apply_changes(products, changes),
+            ensure_ascii=False,
+            indent=4
+        )
+        r = gh.UpdateFile(repo_name, PRODUCTS_FILE, file_contents, doc['sha'])
+        if gh.TestResultCode(r.status_code):
+            logging.info(f"Applied {len(changes)} product changes to {repo_name}/{PRODUCTS_FILE}")
+            return
+        if r.status_code != 409: # anything but someone else committing first
+            raise Exception(f"Failed to update {repo_name}/{PRODUCTS_FILE}: {r.text}")
+
+    raise Exception(f"Gave up updating {repo_name}/{PRODUCTS_FILE} after {COMMIT_ATTEMPTS} conflicting commits")
+
+def flush(repo_name, table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['PRODUCTS_PENDING_TABLE']
+
+    rows = list(table_service.query_entities(table_name, filter=f"PartitionKey eq '{repo_name}'"))
+    pending = [row for row in rows if row['RowKey'] != FLUSH_ROW_KEY]
+    latest = max([row['Changed'] for row in pending], default=0)
+    if time.time() - latest < DEBOUNCE: # still changing, wait for it to settle
+        send_flush_job(repo_name, max(int(DEBOUNCE - (time.time() - latest)), 1))
+        return
+
+    # changes from here on schedule their own flush
+    try:
+        table_service.delete_entity(table_name, repo_name, FLUSH_ROW_KEY)
+    except AzureMissingResourceHttpError:
+        pass
+    if len(pending) == 0:
+        return
+
+    pending.sort(key=lambda row: row['Changed'])
+    commit_changes(repo_name, [{ 'op': row['Op'], 'sku': json.loads(row['Sku']) } for row in pending])
+
+    for row in pending:
+        try: # a row changed since it was read stays for the next flush
+            table_service.delete_entity(table_name, repo_name, row['RowKey'], if_match=row['etag'])
+        except AzureHttpError as err:
+            if err.status_code not in [404, 412]:
+                raise
@@ -1,11 +1,9 @@
 import os
-import json
 import stripe
-import gspread
 import logging
 from datetime import datetime
-from googleapiclient.discovery import build
-from oauth2client.service_account import ServiceAccountCredentials
+from .. import sheetswriter
+from .. import stripecatalog
 
 
 def get_spreadsheet_name(event):
@@ -21,44 +19,28 @@ def get_spreadsheet_name(event):
 
 
 def create_spreadsheet(event):
-    scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
-    client_secret = json.loads(os.environ['GOOGLE_CREDENTIALS'], strict=False)
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(client_secret, scope)
-    drive = build('drive', 'v3', credentials=creds, cache_discovery=False)
     sheet_name = get_spreadsheet_name(event)
 
-    file_metadata = {
-        'name': sheet_name,
-        'parents': [os.environ['EVENT_REGISTRATION_FOLDER']],
-        'mimeType': 'application/vnd.google-apps.spreadsheet',
-    }
-
-    drive.files().create(body=file_metadata, supportsAllDrives=True).execute()
-
-    client = gspread.authorize(creds)
-    sheet = client.open(sheet_name).sheet1
-
     row_headers = ['Customer ID', 'First Name', 'Last Name', 'Company/Organization', 'Title', 'Email', 'Discount Code', 'Country', 'City', 'Gluten-Free', 'Halal', 'Kosher', 'Nut Allergy', 'Shellfish Allergy', 'Vegan', 'Vegetarian', 'Experience', 'Persona', 'Payment Date', 'Payment Amount', 'Refund Amount', 'Payment ID', 'Order ID', 'Payment Fees', 'SKU', 'Session']
 
-    sheet.append_row(row_headers)
+    sheetswriter.create_spreadsheet(sheet_name, [os.environ['EVENT_REGISTRATION_FOLDER']], row_headers)
 
 
 def add_order(order):
-    event = stripe.Product.retrieve(order['metadata'].get('event_id'), api_key=os.environ['STRIPE_SECRET'])
-    sheet = get_google_sheet(get_spreadsheet_name(event))
-    headers = sheet.row_values(1)
-    row_data = get_base_row_data_for_order(order, headers)
-
-    cell_list = sheet.findall(order['id'])
+    event = stripecatalog.get_product(order['metadata'].get('event_id'))
+    writer = sheetswriter.get_writer(get_spreadsheet_name(event))
+    headers = writer.GetHeaders()
 
-    if len(cell_list) > 0:
+    if len(writer.FindRows('Order ID', order['id'])) > 0:
         return
 
+    row_data = get_base_row_data_for_order(order, headers)
+    sku_rows = []
     for item in order['items']:
         if item['type'] != 'sku':
             continue
 
-        sku = stripe.SKU.retrieve(item['parent'], api_key=os.environ['STRIPE_SECRET'])
+        sku = stripecatalog.get_sku(item['parent'])
         sku_row = row_data.copy()
 
         sku_data = {
@@ -70,7 +52,10 @@ def add_order(order):
             column_index = headers.index(column_name)
             sku_row[column_index] = sku_data[column_name]
 
-        sheet.append_row(sku_row, table_range='A1')
+        sku_rows.append(sku_row)
+
+    # one append for the whole order
+    writer.AppendRows(sku_rows)
 
 
 def add_refund(charge_id, amount_refunded):
@@ -80,26 +65,11 @@ def add_refund(charge_id, amount_refunded):
     if event_id is None:
         return
 
-    event = stripe.Product.retrieve(charge['metadata'].get('event_id'), api_key=os.environ['STRIPE_SECRET'])
-
-    sheet = get_google_sheet(get_spreadsheet_name(event))
-    headers = sheet.row_values(1)
-    cell_list = sheet.findall(charge_id)
-
-    refund_cell = headers.index('Refund Amount') + 1
-
-    for cell in cell_list:
-        sheet.update_cell(cell.row, refund_cell, amount_refunded / 100)
-
-
-def get_google_sheet(sheet_name):
-    scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
-    client_secret = json.loads(os.environ['GOOGLE_CREDENTIALS'], strict=False)
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(client_secret, scope)
-    client = gspread.authorize(creds)
-    sheet = client.open(sheet_name).sheet1
+    event = stripecatalog.get_product(charge['metadata'].get('event_id'))
 
-    return sheet
+    writer = sheetswriter.get_writer(get_spreadsheet_name(event))
+    rows = writer.FindRows('Payment ID', charge_id)
+    writer.UpdateCells(rows, 'Refund Amount', amount_refunded / 100)
 
 
 def get_base_row_data_for_order(order, headers):
@@ -1,8 +1,8 @@
 import os
 import json
-import requests
 import logging
 import azure.functions as func
+from ..httpsession import get_session
 
 class SlackResponse:
     content = {}
@@ -130,7 +130,7 @@ class SlackResponse:
         if self.trigger_id is not None:
             response_json['trigger_id'] = self.trigger_id
 
-        requests.post(
+        get_session().post(
             'https://slack.com/api/views.open',
             json=response_json,
             headers={
@@ -143,7 +143,7 @@ class SlackResponse:
         response_json = self.content
 
         if self.response_url is not None:
-            requests.post(
+            get_session().post(
                 self.response_url,
                 json=response_json,
                 headers={
@@ -0,0 +1,105 @@
+# Front-matter parsing for the index.md of www- repositories.
+# Pages start with a YAML front-matter block between '---' lines holding flat 'key: value' pairs
+# (title, level, type, region, pitch, meetup-group...). The fast path only splits that block
+# and reads each line once; content without a block falls back to scanning every line.
+# Values are kept as written (quotes included) because the site data has always carried them that way.
+
+FRONT_MATTER_DELIMITER = '---'
+EXAMPLE_PAGE_TEXT = 'This is an example of a Project'
+
+class IndexPage:
+    def __init__(self, fields, not_updated=False, meetup_group=None):
+        self.fields = fields
+        self.not_updated = not_updated
+        self.title = fields.get('title', None)
+        self.type = fields.get('type', '')
+        self.pitch = fields.get('pitch', 'More info soon...')
+        self.meetup_group = meetup_group
+
+        if not_updated or 'level' not in fields:
+            self.level = '-1'
+        else:
+            self.level = fields['level']
+
+        if not_updated:
+            self.region = 'Needs Website Update'
+        else:
+            self.region = fields.get('region', 'Unknown')
+
+def get_front_matter_block(content):
+    start = 0
+    if content.startswith('\ufeff'):
+        start = 1
+
+    if not content.startswith(FRONT_MATTER_DELIMITER, start):
+        return None
+
+    start = content.find('\n', start)
+    if start < 0:
+        return None
+
+    end = content.find('\n' + FRONT_MATTER_DELIMITER, start)
+    if end < 0:
+        return None
+
+    return content[start + 1:end]
+
+def parse_fields(block):
+    fields = {}
+    for line in block.split('\n'):
+        if not line or line[0] in ' \t#-':
+            continue
+
+        key, sep, value = line.partition(':')
+        if not sep:
+            continue
+
+        key = key.strip().lower()
+        if key and key not in fields: # first one wins
+            fields[key] = value.strip()
+
+    return fields
+
+def parse_front_matter(content):
+    block = get_front_matter_block(content)
+    if block is None: # no front matter block, look at every line
+        block = content
+
+    return parse_fields(block)
+
+# chapters that never set meetup-group usually link their group somewhere in the page
+def find_meetup_group(content):
+    ndx = content.find('meetup.com/')
+    if ndx < 0:
+        return None
+
+    ndx += 11
+    eolfs = content.find('/', ndx)
+
+    if eolfs - ndx <= 6: # meetup.com/en-US/group/ style links
+        ndx = eolfs
+        eolfs = content.find('/', ndx + 1)
+
+    eolp = content.find(')', ndx + 1)
+    eols = content.find(' ', ndx + 1)
+    eol = eolfs
+    if eolp > -1 and eolp < eol:
+        eol = eolp
+    if eols > -1 and eols < eol:
+        eol = eols
+
+    mu = content[ndx:eol].replace('/', '').strip()
+    if not mu:
+        return None
+
+    return mu
+
+def parse_index_page(content):
+    fields = parse_front_matter(content)
+    not_updated = EXAMPLE_PAGE_TEXT in content
+
+    meetup_group = fields.get('meetup-group', None)
+    if not meetup_group:
+        meetup_group = find_meetup_group(content)
+
+    return IndexPage(fields, not_updated, meetup_group)
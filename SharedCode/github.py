@@ -9,8 +9,21 @@ import datetime
 import urllib
 import time
 import random
+import threading
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from .githubcache import get_response_cache
+from .githubrate import get_rate_budget, INTERACTIVE, BATCH
+from .frontmatter import parse_index_page
+from .httpsession import get_session
 # Major update 6.7.2021 to match, upgrade Azure version of similar file
 
+# the sha git (and so the contents API) gives a file with these contents
+def git_blob_sha(contents):
+    data = contents.encode('utf-8')
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
 class OWASPGitHub:
     apitoken = os.environ["GH_APITOKEN"]
     user = "harold.blankenship@owasp.com"
@@ -24,6 +37,18 @@ class OWASPGitHub:
     team_getbyname_fragment = "orgs/OWASP/teams/:team_slug"
     team_listrepo_fragment = "orgs/OWASP/teams/:team_slug/repos"
     search_repos_fragment = "search/repositories"
+    graphql_fragment = "graphql"
+    git_ref_fragment = "repos/OWASP/:repo/git/ref/heads/:branch"
+    git_update_ref_fragment = "repos/OWASP/:repo/git/refs/heads/:branch"
+    git_commits_fragment = "repos/OWASP/:repo/git/commits"
+    git_trees_fragment = "repos/OWASP/:repo/git/trees"
+    harvest_workers = int(os.environ.get('GH_HARVEST_WORKERS', '4'))
+    # GH_USE_GRAPHQL harvests repositories (and reads leaders.md) through GraphQL, snapshot_page_size repos a query
+    use_graphql = os.environ.get('GH_USE_GRAPHQL', 'false').lower() == 'true'
+    snapshot_page_size = int(os.environ.get('GH_SNAPSHOT_PAGE_SIZE', '100'))
+    default_branches = {}
+    rate_budget = get_rate_budget()
+    response_cache = get_response_cache()
 
     of_org_fragment = "orgs/OWASP-Foundation/repos"
     of_content_fragment = "repos/OWASP-Foundation/:repo/contents/:path"
@@ -47,6 +72,17 @@ class OWASPGitHub:
         COMMITTEE = 2
         EVENT = 3
 
+    # priority is INTERACTIVE for someone waiting on the answer (Slack commands), BATCH otherwise
+    def __init__(self, priority=BATCH):
+        self.priority = priority
+
+    # every GitHub call goes through here so the shared budget sees it
+    def SendRequest(self, method, url, resource='core', **kwargs):
+        self.rate_budget.Acquire(resource, self.priority)
+        r = get_session().request(method, url=url, **kwargs)
+        self.rate_budget.Update(r)
+        return r
+
     def HandleRateLimit(self, r, count =0):
         if r.ok:
             return False, 0
@@ -54,7 +90,10 @@ class OWASPGitHub:
         retry = False
         if 'Retry-After' in r.headers:
             retry = True
-            time.sleep(r.headers['Retry-After'])
+            time.sleep(int(r.headers['Retry-After']))
+        elif 'X-RateLimit-Remaining' in r.headers and int(r.headers['X-RateLimit-Remaining']) == 0 and 'X-RateLimit-Reset' in r.headers:
+            # spent, wait for the window instead of burning the retries
+            time.sleep(min(max(int(r.headers['X-RateLimit-Reset']) - time.time(), 1), self.rate_budget.GetMaxWait(self.priority)))
         elif 'X-RateLimit-Remaining' in r.headers and int(r.headers['X-RateLimit-Remaining']) < 50:
             time.sleep(15 + random.randint(0, 5))
         elif 'Timeout' in r.text:
@@ -81,7 +120,7 @@ class OWASPGitHub:
         }
 
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.post(url = self.gh_endpoint + self.org_fragment, headers = headers, data=json.dumps(data))
+        r = self.SendRequest('post', url = self.gh_endpoint + self.org_fragment, headers = headers, data=json.dumps(data))
 
         return r
 
@@ -93,19 +132,28 @@ class OWASPGitHub:
         repoName = self.FormatRepoName(repoName, repoType)
         url = self.gh_endpoint + self.content_fragment
         url = url.replace(":repo", repoName)
+        replacetags = ["[GROUPNAME]", "[:REGION]", "[:COUNTRY]", "[:PROJTYPE]", "[:GROUPSITE_URL]", "[:DESCRIPTION]", "[:ROADMAP]"]
+        replacestrs = [groupName, region, country, proj_type, group_site, description, roadmap]
         # change to use files.json....
         sfile = open(basedir + "files.json")
         filestosend = json.load(sfile)
-        for f in filestosend["files"]:
-            fpath = basedir + f['path']
+        fpaths = [basedir + f['path'] for f in filestosend["files"]]
 
-            r = self.SendFile( url, fpath, ["[GROUPNAME]", "[:REGION]", "[:COUNTRY]", "[:PROJTYPE]", "[:GROUPSITE_URL]", "[:DESCRIPTION]", "[:ROADMAP]"], [groupName, region, country, proj_type, group_site, description, roadmap])
-            if not self.TestResultCode(r.status_code):
-                break
+        # the new repository is empty and the Git Data API needs a branch to build on, so the first
+        # file goes through the contents api and the rest follow as a single commit
+        r = self.SendFile(url, fpaths[0], replacetags, replacestrs)
+        if self.TestResultCode(r.status_code) and len(fpaths) > 1:
+            files = {}
+            for fpath in fpaths[1:]:
+                pathname, filecstr = self.PrepareFile(fpath, replacetags, replacestrs)
+                files[pathname] = filecstr
+
+            r = self.CommitFiles(repoName, files, "initialize repo")
 
         return r
 
-    def GetFile(self, repo, filepath, of_content_fragment = None):
+    # ref reads the file as of that commit instead of the default branch
+    def GetFile(self, repo, filepath, of_content_fragment = None, ref = None):
         url = self.gh_endpoint
         if not of_content_fragment:
             url = url + self.content_fragment
@@ -114,16 +162,30 @@ class OWASPGitHub:
 
         url = url.replace(":repo", repo)
         url = url.replace(":path", filepath)
+        if ref:
+            url = url + "?ref=" + ref
 
         #bytestosend = base64.b64encode(filecstr.encode())
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.get(url = url, headers=headers)
+        cached = None
+        if self.response_cache:
+            cached = self.response_cache.Get(url)
+            if cached:
+                headers['If-None-Match'] = cached['etag']
+
+        r = self.SendRequest('get', url = url, headers=headers)
         count = 0
         retry, count = self.HandleRateLimit(r, count)
         while(retry):
-            r = requests.get(url = url, headers=headers)
+            r = self.SendRequest('get', url = url, headers=headers)
             retry, count = self.HandleRateLimit(r, count)
 
+        if self.response_cache:
+            if cached and r.status_code == requests.codes.not_modified: # unchanged, and free against the rate limit
+                r = self.response_cache.BuildResponse(cached, url)
+            else:
+                self.response_cache.Store(url, r)
+
         return r
 
     def GetOFFile(self, repo, filepath):
@@ -135,15 +197,14 @@ class OWASPGitHub:
         url = url.replace(":path", filepath)
 
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.delete(url = url, headers=headers)
+        r = self.SendRequest('delete', url = url, headers=headers)
         return r
 
-    def SendFile(self, url, filename, replacetags = None, replacestrs = None):
+    def PrepareFile(self, filename, replacetags = None, replacestrs = None):
         pathname = filename[filename.find("docs/") + 5:]
         if pathname == "gitignore":
             pathname = "." + pathname
 
-        url = url.replace(":path", pathname)
         sfile = open(filename)
         filecstr = sfile.read()
 
@@ -152,6 +213,12 @@ class OWASPGitHub:
                 replacestr = replacestrs[idx] # this is liquid, not python...
                 filecstr = filecstr.replace(replacetag, replacestr)
 
+        return pathname, filecstr
+
+    def SendFile(self, url, filename, replacetags = None, replacestrs = None):
+        pathname, filecstr = self.PrepareFile(filename, replacetags, replacestrs)
+        url = url.replace(":path", pathname)
+
         bytestosend = base64.b64encode(filecstr.encode())
         committer = {
             "name" : "OWASP Foundation",
@@ -163,11 +230,11 @@ class OWASPGitHub:
             "content" : bytestosend.decode()
         }
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.put(url = url, headers=headers, data=json.dumps(data))
+        r = self.SendRequest('put', url = url, headers=headers, data=json.dumps(data))
         count = 0
         retry, count = self.HandleRateLimit(r, count)
         while(retry):
-            r = requests.put(url = url, headers=headers, data=json.dumps(data))
+            r = self.SendRequest('put', url = url, headers=headers, data=json.dumps(data))
             retry, count = self.HandleRateLimit(r, count)
 
         return r
@@ -181,7 +248,7 @@ class OWASPGitHub:
         url = url.replace(":repo", repoName)
 
         data = { "source" : { "branch" : "main" }}
-        r = requests.post(url = url, headers=headers, data=json.dumps(data))
+        r = self.SendRequest('post', url = url, headers=headers, data=json.dumps(data))
 
         return r
 
@@ -218,7 +285,7 @@ class OWASPGitHub:
         while not done:
             pagestr = "?page=%d" % pageno
             url = self.gh_endpoint + self.org_fragment + pagestr
-            r = requests.get(url=url, headers = headers)
+            r = self.SendRequest('get', url=url, headers = headers)
 
             if self.TestResultCode(r.status_code):
                 repos = json.loads(r.text)
@@ -238,7 +305,7 @@ class OWASPGitHub:
                         logging.info("rebuilding " + repoName + "\n")
                         url = self.gh_endpoint + self.pages_fragment
                         url = url.replace(":repo",repoName)
-                        r = requests.post(url = url + "/builds", headers=headers)
+                        r = self.SendRequest('post', url = url + "/builds", headers=headers)
                         if not self.TestResultCode(r.status_code):
                             logging.warn(repoName + " not rebuilt: " + r.text)
 
@@ -261,7 +328,127 @@ class OWASPGitHub:
             "sha" : sha
         }
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.put(url = url, headers=headers, data=json.dumps(data))
+        r = self.SendRequest('put', url = url, headers=headers, data=json.dumps(data))
+        if r.ok and self.response_cache:
+            self.response_cache.Invalidate(url)
+
+        return r
+
+    # UpdateFile without the commit (and the Pages build it sets off) when the file on GitHub
+    # already has these contents; returns the response and whether a write happened
+    def UpsertFileIfChanged(self, repo, filepath, contents):
+        sha = ''
+        r = self.GetFile(repo, filepath)
+        if self.TestResultCode(r.status_code):
+            sha = json.loads(r.text)['sha']
+            if sha == git_blob_sha(contents):
+                return r, False
+
+        r = self.UpdateFile(repo, filepath, contents, sha)
+        return r, self.TestResultCode(r.status_code)
+
+    def GetDefaultBranch(self, repo):
+        if repo not in self.default_branches:
+            r = self.RepoExists(repo)
+            if not r.ok:
+                return 'main'
+            self.default_branches[repo] = json.loads(r.text)['default_branch']
+
+        return self.default_branches[repo]
+
+    def SendGitData(self, method, fragment, repo, data = None, branch = ''):
+        url = self.gh_endpoint + fragment
+        url = url.replace(':repo', repo).replace(':branch', branch)
+        headers = {"Authorization": "token " + self.apitoken}
+        jsonData = None
+        if data is not None:
+            jsonData = json.dumps(data)
+
+        r = self.SendRequest(method, url = url, headers=headers, data=jsonData)
+        count = 0
+        retry, count = self.HandleRateLimit(r, count)
+        while(retry and r.status_code != 422): # 422 is a real answer (ref moved), not something to retry
+            r = self.SendRequest(method, url = url, headers=headers, data=jsonData)
+            retry, count = self.HandleRateLimit(r, count)
+
+        return r
+
+    def GetBranchHead(self, repo, branch = None):
+        if not branch:
+            branch = self.GetDefaultBranch(repo)
+
+        r = self.SendGitData('GET', self.git_ref_fragment, repo, branch = branch)
+        if not r.ok:
+            raise Exception(f"Could not read the head of {repo}/{branch}: {r.text}")
+
+        return json.loads(r.text)['object']['sha']
+
+    # Writes many files to one repository as a single commit through the Git Data API, so a site
+    # data refresh costs one Pages build instead of one per file. files maps path to contents; a
+    # contents of None removes the path. If the branch moves while we build the commit it is rebuilt
+    # on the new head, unless head_sha pins the commit the files were derived from: then a moved
+    # branch returns the 422 and the caller reads the files again.
+    def CommitFiles(self, repo, files, message = "remote update files", branch = None, head_sha = None):
+        if not branch:
+            branch = self.GetDefaultBranch(repo)
+
+        tree = []
+        for path, contents in files.items():
+            entry = { "path": path, "mode": "100644", "type": "blob" }
+            if contents is None:
+                entry["sha"] = None
+            else:
+                entry["content"] = contents
+            tree.append(entry)
+
+        committer = {
+            "name" : "OWASP Foundation",
+            "email" : "owasp.foundation@owasp.org"
+        }
+
+        pinned = head_sha is not None
+        attempt = 0
+        while True:
+            if not pinned:
+                r = self.SendGitData('GET', self.git_ref_fragment, repo, branch = branch)
+                if not r.ok:
+                    return r
+                head_sha = json.loads(r.text)['object']['sha']
+
+            r = self.SendGitData('GET', self.git_commits_fragment + '/' + head_sha, repo)
+            if not r.ok:
+                return r
+            base_tree = json.loads(r.text)['tree']['sha']
+
+            r = self.SendGitData('POST', self.git_trees_fragment, repo, { "base_tree": base_tree, "tree": tree })
+            if not r.ok:
+                return r
+            tree_sha = json.loads(r.text)['sha']
+            if tree_sha == base_tree: # every file already had these contents
+                logging.info(f"{', '.join(files.keys())} unchanged in {repo}, nothing to commit")
+                return r
+
+            data = {
+                "message" : message,
+                "committer" : committer,
+                "tree" : tree_sha,
+                "parents" : [head_sha]
+            }
+            r = self.SendGitData('POST', self.git_commits_fragment, repo, data)
+            if not r.ok:
+                return r
+            commit_sha = json.loads(r.text)['sha']
+
+            r = self.SendGitData('PATCH', self.git_update_ref_fragment, repo, { "sha": commit_sha, "force": False }, branch = branch)
+            attempt = attempt + 1
+            if r.status_code != 422 or attempt > 3 or pinned:
+                break
+            logging.info(f"{repo}/{branch} moved while committing, rebuilding commit on the new head")
+
+        if r.ok and self.response_cache:
+            for path in files:
+                self.response_cache.Invalidate(self.gh_endpoint + self.content_fragment.replace(':repo', repo).replace(':path', path))
+
         return r
 
     def GetPages(self, repoName):
@@ -272,11 +459,11 @@ class OWASPGitHub:
         url = self.gh_endpoint + self.pages_fragment
         url = url.replace(':repo', repoName)
 
-        r = requests.get(url=url, headers = headers)
+        r = self.SendRequest('get', url=url, headers = headers)
         count = 0
         retry, count = self.HandleRateLimit(r, count)
         while(retry):
-            r = requests.get(url=url, headers = headers)
+            r = self.SendRequest('get', url=url, headers = headers)
             retry, count = self.HandleRateLimit(r, count)
 
         if r.ok:
@@ -285,8 +472,19 @@ class OWASPGitHub:
         return result
 
 
-    def GetPublicRepositories(self, matching=""):
+    def GetPublicRepositories(self, matching="", max_workers=None):
+        entries = self.GetRepositoryEntries(matching, max_workers)
+        return [entry['repo'] for entry in entries]
+
+    # previous maps repo name to the entry returned by an earlier run ({'repo', 'pushed_at'}); repos
+    # whose pushed_at has not moved reuse that entry instead of fetching pages status and index.md again
+    def GetRepositoryEntries(self, matching="", max_workers=None, previous=None):
+        if self.use_graphql:
+            return self.GetRepositorySnapshot(matching, previous)
+
         headers = self.GetHeaders()
+        if not max_workers:
+            max_workers = self.harvest_workers
 
         qurl = "org:owasp is:public"
         if matching:
@@ -300,16 +498,16 @@ class OWASPGitHub:
         pageno = 1
         pageend = -1
 
-        results = []
+        candidates = []
         while not done:
             pagestr = "?page=%d" % pageno
             #url = self.gh_endpoint + self.org_fragment + pagestr + '&per_page=100'
             url = self.gh_endpoint + self.search_repos_fragment + pagestr + "&" + urllib.parse.urlencode(qdata) + "&per_page=100" # I am concerned that this search might use a cache and I wonder how often the cache is updated...
-            r = requests.get(url=url, headers = headers)
+            r = self.SendRequest('get', resource='search', url=url, headers = headers)
             count = 0
             retry, count = self.HandleRateLimit(r, count)
             while(retry):
-                r = requests.get(url=url, headers = headers)
+                r = self.SendRequest('get', resource='search', url=url, headers = headers)
                 retry, count = self.HandleRateLimit(r, count)
 
             if r.ok:
@@ -325,136 +523,235 @@ class OWASPGitHub:
 
                 pageno = pageno + 1
 
-                final_repos = []
                 for repo in repos['items']:# This works for search fragment
-                #for repo in repos:
                     repoName = repo['name'].lower()
                     istemplate = repo['is_template']
 
                     if istemplate: #probably should change this in case a project/chapter/etc decides to make their repo a template for some odd reason but for now....
                         continue
 
-                    haspages = repo['has_pages'] #false for Iran...maybe was never activated?
-
                     # even if matching, we still only really want project, chapter, event, or committee repos here....
                     if not matching or (matching in repoName):
-                        pages = None
-                        repo['build'] = 'no pages' # start with this
-                        if haspages:
-                            pages = self.GetPages(repoName)
-                            if pages:
-                                repo['build'] = pages['status']
-
-                        # going to change below to use repo['build'] instead
-                        # if (not pages or pages['status'] == None) and not inactive:
-                        #     continue
-                        # elif (pages and pages['status'] != None) and inactive:
-                        #     continue
-                        final_repos.append(repo)
-                    time.sleep(.5) # Github is timing out ... I can run this on my box without issue...not sure what is causing this.
-
-                for repo in final_repos:
-                    repoName = repo['name'].lower()
-                    istemplate = repo['is_template']
-                    haspages = repo['has_pages'] #false for Iran...maybe was never activated?
-
-                    addrepo = {}
-                    addrepo['name'] = repoName
-                    addrepo['url'] = f"https://owasp.org/{ repoName }/"
-
-                    cdate = datetime.datetime.strptime(repo['created_at'], "%Y-%m-%dT%H:%M:%SZ")
-                    udate = datetime.datetime.strptime(repo['pushed_at'], "%Y-%m-%dT%H:%M:%SZ")
-                    addrepo['created'] = cdate.strftime('%c')
-                    addrepo['updated'] = udate.strftime('%c')
-                    addrepo['build'] = repo['build']
-
-                    r = self.GetFile(repoName, 'index.md')
-                    if r.ok:
-                        doc = json.loads(r.text)
-                        content = base64.b64decode(doc['content']).decode()
-                        ndx = content.find('title:')
-                        eol = content.find('\n', ndx + 7)
-                        if ndx >= 0:
-                            title = content[ndx + 7:eol]
-                            addrepo['title'] = title.strip()
-                        else:
-                            addrepo['title'] = repoName
-
-                        ndx = content.find('level:') + 6
-                        eol = content.find("\n", ndx)
-                        not_updated = (content.find("This is an example of a Project") >= 0)
-                        if ndx < 0 or not_updated:
-                            level = "-1"
-                        else:
-                            level = content[ndx:eol]
-                        addrepo['level'] = level.strip()
-                        ndx = content.find('type:') + 5
-                        eol = content.find("\n", ndx)
-                        gtype = content[ndx:eol]
-                        addrepo['type'] = gtype.strip()
-                        ndx = content.find('region:') + 7
-
-                        if not_updated:
-                            gtype = 'Needs Website Update'
-                        elif ndx > 6: # -1 + 7
-                            eol = content.find("\n", ndx)
-                            gtype = content[ndx:eol]
-                        else:
-                            gtype = 'Unknown'
-
-                        addrepo['region'] = gtype.strip()
-
-                        ndx = content.find('pitch:') + 6
-                        if ndx > 5: # -1 + 6
-                            eol = content.find('\n', ndx)
-                            gtype = content[ndx:eol]
-                        else:
-                            gtype = 'More info soon...'
-                        addrepo['pitch'] = gtype.strip()
-
-                        ndx = content.find('meetup-group:')
-                        if ndx > -1:
-                            ndx += 13
-                            eol=content.find('\n', ndx)
-                            mu = content[ndx:eol]
-                            if len(mu.strip()) > 0:
-                                addrepo['meetup-group'] = mu.strip()
-
-                        if 'meetup-group' not in addrepo:
-                            ndx = content.find('meetup.com/')
-                            if ndx > -1:
-                                ndx += 11
-                                eolfs = content.find('/', ndx)
-
-                                if eolfs - ndx <= 6:
-                                    ndx = eolfs
-                                    eolfs = content.find('/', ndx + 1)
-
-                                eolp = content.find(')', ndx + 1)
-                                eols = content.find(' ', ndx + 1)
-                                eol = eolfs
-                                if eolp > -1 and eolp < eol:
-                                    eol = eolp
-                                if eols > -1 and eols < eol:
-                                    eol = eols
-
-                                mu = content[ndx:eol]
-                                if '/' in mu:
-                                    mu = mu.replace('/','')
-                                if len(mu.strip()) > 0:
-                                    addrepo['meetup-group'] = mu.strip()
-
-                        results.append(addrepo)
+                        candidates.append(repo)
+            else: # a partial list would read as every repo on the missing pages being gone
+                logging.error(f"Failed to search repositories on page {pageno}: {r.text}")
+                raise Exception(f"Failed to search repositories on page {pageno}: {r.status_code}")
+
+        # pages status and index.md are fetched for many repos at once; map keeps the search order
+        # so results come back the same way every run
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            harvested = list(executor.map(functools.partial(self.HarvestRepositoryEntry, previous=previous), candidates))
+
+        results = [entry for entry in harvested if entry]
 
         return results
 
+    def HarvestRepositoryEntry(self, repo, previous=None):
+        repoName = repo['name'].lower()
+        known = None
+        if previous:
+            known = previous.get(repoName, None)
+
+        if known and known['pushed_at'] and known['pushed_at'] == repo['pushed_at']:
+            return { 'repo': known['repo'], 'pushed_at': repo['pushed_at'], 'changed': False }
+
+        addrepo = self.HarvestRepository(repo)
+        if not addrepo:
+            return None
+
+        return { 'repo': addrepo, 'pushed_at': repo['pushed_at'], 'changed': True }
+
+    def HarvestRepository(self, repo):
+        repoName = repo['name'].lower()
+        haspages = repo['has_pages'] #false for Iran...maybe was never activated?
+
+        repo['build'] = 'no pages' # start with this
+        if haspages:
+            pages = self.GetPages(repoName)
+            if pages:
+                repo['build'] = pages['status']
+
+        addrepo = {}
+        addrepo['name'] = repoName
+        addrepo['url'] = f"https://owasp.org/{ repoName }/"
+
+        cdate = datetime.datetime.strptime(repo['created_at'], "%Y-%m-%dT%H:%M:%SZ")
+        udate = datetime.datetime.strptime(repo['pushed_at'], "%Y-%m-%dT%H:%M:%SZ")
+        addrepo['created'] = cdate.strftime('%c')
+        addrepo['updated'] = udate.strftime('%c')
+        addrepo['build'] = repo['build']
+
+        r = self.GetFile(repoName, 'index.md')
+        if r.status_code == requests.codes.not_found: # not a site repository (any more)
+            return None
+        if not r.ok: # anything else is not an answer, don't let it look like a missing page
+            raise Exception(f"Failed to read {repoName}/index.md: {r.status_code} {r.text}")
+
+        doc = json.loads(r.text)
+        content = base64.b64decode(doc['content']).decode()
+        self.ParseIndexContent(repoName, content, addrepo)
+
+        return addrepo
+
+    def PostGraphQL(self, query, variables=None):
+        headers = {"Authorization": "bearer " + self.apitoken}
+        url = self.gh_endpoint + self.graphql_fragment
+        data = json.dumps({ 'query': query, 'variables': variables or {} })
+
+        r = self.SendRequest('post', resource='graphql', url=url, headers=headers, data=data)
+        count = 0
+        retry, count = self.HandleRateLimit(r, count)
+        while(retry):
+            r = self.SendRequest('post', resource='graphql', url=url, headers=headers, data=data)
+            retry, count = self.HandleRateLimit(r, count)
+
+        if not r.ok:
+            logging.error(f"GraphQL query failed: {r.status_code} {r.text}")
+            return None
+
+        result = json.loads(r.text)
+        if result.get('errors', None): # partial results still come back in data, e.g. a missing file
+            logging.warn(f"GraphQL query returned errors: {result['errors'][:3]}")
+
+        return result.get('data', None)
+
+    # What GetRepositoryEntries harvests, plus each repo's leaders.md text ('leaders'), in one search query
+    # per snapshot_page_size repos instead of a pages and an index.md request per repo.
+    # GraphQL has no Pages endpoint, the build status comes from the latest github-pages deployment.
+    snapshot_query = """
+    query($q: String!, $first: Int!, $after: String) {
+      search(query: $q, type: REPOSITORY, first: $first, after: $after) {
+        pageInfo { hasNextPage endCursor }
+        nodes {
+          ... on Repository {
+            name
+            createdAt
+            pushedAt
+            isTemplate
+            index: object(expression: "HEAD:index.md") { ... on Blob { text } }
+            leaders: object(expression: "HEAD:leaders.md") { ... on Blob { text } }
+            deployments(environments: ["github-pages"], last: 1) { nodes { latestStatus { state } } }
+          }
+        }
+      }
+    }
+    """
+
+    def GetRepositorySnapshot(self, matching="", previous=None):
+        qurl = "org:owasp is:public"
+        if matching:
+            qurl = qurl + f" in:name {matching}"
+
+        results = []
+        after = None
+        while True:
+            data = self.PostGraphQL(self.snapshot_query, { 'q': qurl, 'first': self.snapshot_page_size, 'after': after })
+            if not data or not data.get('search', None): # a partial snapshot would read as the rest being gone
+                logging.error(f"Failed to snapshot repositories after {len(results)}")
+                raise Exception(f"Failed to snapshot repositories after {len(results)}")
+
+            for node in data['search']['nodes']:
+                if not node or node['isTemplate']:
+                    continue
+                if matching and matching not in node['name'].lower():
+                    continue
+
+                entry = self.SnapshotRepositoryEntry(node, previous)
+                if entry:
+                    results.append(entry)
+
+            page_info = data['search']['pageInfo']
+            if not page_info['hasNextPage']:
+                break
+            after = page_info['endCursor']
+
+        return results
+
+    # a site built from a branch (not a workflow) may have no github-pages deployment on record,
+    # so without one the status is asked of the Pages API like the REST harvest does
+    def GetPagesStatus(self, node):
+        deployments = (node.get('deployments', None) or {}).get('nodes', [])
+        if not deployments or not deployments[-1].get('latestStatus', None):
+            pages = self.GetPages(node['name'].lower())
+            if pages:
+                return pages['status']
+            return 'no pages'
+
+        state = deployments[-1]['latestStatus']['state']
+        if state in ['SUCCESS', 'INACTIVE']:
+            return 'built'
+        if state in ['ERROR', 'FAILURE']:
+            return 'errored'
+
+        return 'building'
+
+    def SnapshotRepositoryEntry(self, node, previous=None):
+        repoName = node['name'].lower()
+        leaders = (node.get('leaders', None) or {}).get('text', None)
+        known = None
+        if previous:
+            known = previous.get(repoName, None)
+
+        if known and known['pushed_at'] and known['pushed_at'] == node['pushedAt']:
+            return { 'repo': known['repo'], 'pushed_at': node['pushedAt'], 'changed': False, 'leaders': leaders }
+
+        content = (node.get('index', None) or {}).get('text', None)
+        if content is None:
+            return None
+
+        addrepo = {}
+        addrepo['name'] = repoName
+        addrepo['url'] = f"https://owasp.org/{ repoName }/"
+
+        cdate = datetime.datetime.strptime(node['createdAt'], "%Y-%m-%dT%H:%M:%SZ")
+        udate = datetime.datetime.strptime(node['pushedAt'], "%Y-%m-%dT%H:%M:%SZ")
+        addrepo['created'] = cdate.strftime('%c')
+        addrepo['updated'] = udate.strftime('%c')
+        addrepo['build'] = self.GetPagesStatus(node)
+        self.ParseIndexContent(repoName, content, addrepo)
+
+        return { 'repo': addrepo, 'pushed_at': node['pushedAt'], 'changed': True, 'leaders': leaders }
+
+    # text of path in each of repo_names (None where it is missing), snapshot_page_size repos a query
+    def GetFileTexts(self, repo_names, path):
+        texts = {}
+        for start in range(0, len(repo_names), self.snapshot_page_size):
+            names = repo_names[start:start + self.snapshot_page_size]
+            fields = []
+            for i, name in enumerate(names):
+                fields.append(f'r{i}: repository(owner: "OWASP", name: {json.dumps(name)}) {{ object(expression: {json.dumps("HEAD:" + path)}) {{ ... on Blob {{ text }} }} }}')
+            data = self.PostGraphQL("query { " + "\n".join(fields) + " }")
+            if data is None: # only a file missing from an answered query reads as None
+                raise Exception(f"Failed to read {path} for {len(names)} repositories")
+            for i, name in enumerate(names):
+                repo = data.get(f'r{i}', None) or {}
+                texts[name] = (repo.get('object', None) or {}).get('text', None)
+
+        return texts
+
+    def ParseIndexContent(self, repoName, content, addrepo):
+        page = parse_index_page(content)
+        if page.title is not None:
+            addrepo['title'] = page.title
+        else:
+            addrepo['title'] = repoName
+
+        addrepo['level'] = page.level
+        addrepo['type'] = page.type
+        addrepo['region'] = page.region
+        addrepo['pitch'] = page.pitch
+        if page.meetup_group:
+            addrepo['meetup-group'] = page.meetup_group
+
+        return addrepo
+
     def GetFilesMatching(self, repo, path, matching=''):
         rfiles = []
         url = self.gh_endpoint + self.content_fragment
         url = url.replace(":repo", repo)
         url = url.replace(":path", path)
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         if self.TestResultCode(r.status_code):
             contents = json.loads(r.text)
             for item in contents:
@@ -471,7 +768,7 @@ class OWASPGitHub:
         headers = self.GetHeaders()
 
         url = self.gh_endpoint + repofrag
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         repo_names = []
         if r.ok:
             jsonRepos = json.loads(r.text)
@@ -485,7 +782,7 @@ class OWASPGitHub:
         headers = self.GetHeaders()
 
         url = self.gh_endpoint + getTeamUrl
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         team_id = None
         if r.ok:
             jsonTeam = json.loads(r.text)
@@ -502,11 +799,11 @@ class OWASPGitHub:
 
         data = { "permission" : self.PermType.ADMIN}
         jsonData = json.dumps(data)
-        r = requests.put(url = url, headers=headers, data=jsonData)
+        r = self.SendRequest('put', url = url, headers=headers, data=jsonData)
         count = 0
         retry, count = self.HandleRateLimit(r, count)
         while(retry):
-            r = requests.put(url = url, headers=headers, data=jsonData)
+            r = self.SendRequest('put', url = url, headers=headers, data=jsonData)
             retry, count = self.HandleRateLimit(r, count)
 
         return r
@@ -521,11 +818,11 @@ class OWASPGitHub:
         url = self.gh_endpoint + collabfrag
 
         # first do a get to see if they are already a user
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         if not r.ok:
             data = { "permission" : self.PermType.ADMIN}
             jsonData = json.dumps(data)
-            r = requests.put(url = url, headers=headers, data=jsonData)
+            r = self.SendRequest('put', url = url, headers=headers, data=jsonData)
 
         return r
 
@@ -602,7 +899,7 @@ class OWASPGitHub:
             }
 
         url = self.gh_endpoint + repofrag
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         return r
 
     def GetLastUpdate(self, repoName, file):
@@ -613,7 +910,7 @@ class OWASPGitHub:
             }
 
         url = self.gh_endpoint + repofrag
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         datecommit = None
         if r.ok:
             res = json.loads(r.text)
@@ -625,7 +922,7 @@ class OWASPGitHub:
         url = self.gh_endpoint + self.user_fragment
         url = url.replace(":username", user)
         headers = {"Authorization": "token " + self.apitoken}
-        r = requests.get(url = url, headers=headers)
+        r = self.SendRequest('get', url = url, headers=headers)
         user = None
         if r.ok:
             try:
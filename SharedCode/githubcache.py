@@ -0,0 +1,118 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import requests
+from cachetools import LRUCache
+from requests.structures import CaseInsensitiveDict
+
+# Conditional request cache for GitHub content responses.
+# Entries hold the ETag and body of the last 200 response for a repo + path so the next
+# request can send If-None-Match. GitHub answers 304 for unchanged files and does not
+# count those against the rate limit, and we serve the stored body locally.
+#
+# Backend is picked with GH_CACHE_BACKEND (memory, sqlite or none); size with GH_CACHE_SIZE.
+
+class MemoryCacheBackend:
+    def __init__(self, maxsize=512):
+        self.lock = threading.Lock()
+        self.entries = LRUCache(maxsize=maxsize)
+
+    def Get(self, key):
+        with self.lock:
+            return self.entries.get(key, None)
+
+    def Set(self, key, etag, body):
+        with self.lock:
+            self.entries[key] = { 'etag': etag, 'body': body }
+
+    def Delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class SqliteCacheBackend:
+    def __init__(self, path, maxsize=2048):
+        self.lock = threading.Lock()
+        self.path = path
+        self.maxsize = maxsize
+        with self.Connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, body TEXT, last_used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def Connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def Get(self, key):
+        with self.lock, self.Connect() as conn:
+            row = conn.execute("SELECT etag, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        return { 'etag': row[0], 'body': row[1] }
+
+    def Set(self, key, etag, body):
+        with self.lock, self.Connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses (key, etag, body, last_used) VALUES (?, ?, ?, ?)", (key, etag, body, time.time()))
+            # least recently used entries go once we are over size
+            conn.execute("DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)", (self.maxsize,))
+
+    def Delete(self, key):
+        with self.lock, self.Connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def Get(self, key):
+        try:
+            return self.backend.Get(key)
+        except Exception as err:
+            logging.warn(f"GitHub response cache read failed: {err}")
+            return None
+
+    def Store(self, key, r):
+        etag = r.headers.get('ETag', None)
+        if r.status_code != requests.codes.ok or not etag:
+            return
+
+        try:
+            self.backend.Set(key, etag, r.text)
+        except Exception as err:
+            logging.warn(f"GitHub response cache write failed: {err}")
+
+    def Invalidate(self, key):
+        try:
+            self.backend.Delete(key)
+        except Exception as err:
+            logging.warn(f"GitHub response cache delete failed: {err}")
+
+    def BuildResponse(self, entry, url):
+        # callers only look at status_code, ok, text and headers so a plain 200 is enough
+        r = requests.models.Response()
+        r.status_code = requests.codes.ok
+        r._content = entry['body'].encode('utf-8')
+        r.encoding = 'utf-8'
+        r.headers = CaseInsensitiveDict({ 'ETag': entry['etag'], 'Content-Type': 'application/json' })
+        r.url = url
+        return r
+
+def get_response_cache():
+    backend_name = os.environ.get('GH_CACHE_BACKEND', 'memory').lower()
+    maxsize = int(os.environ.get('GH_CACHE_SIZE', '1024'))
+    if backend_name == 'none':
+        return None
+
+    backend = None
+    if backend_name == 'sqlite':
+        try:
+            backend = SqliteCacheBackend(os.environ.get('GH_CACHE_PATH', '/tmp/github-response-cache.sqlite'), maxsize)
+        except Exception as err:
+            logging.warn(f"Could not open sqlite GitHub cache, using memory: {err}")
+
+    if not backend:
+        backend = MemoryCacheBackend(maxsize)
+
+    return ResponseCache(backend)
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import threading
+from azure.common import AzureConflictHttpError, AzureHttpError, AzureMissingResourceHttpError
+from azure.cosmosdb.table.tableservice import TableService
+
+# Rate limit governor for the GitHub token every function shares.
+# The X-RateLimit-Remaining / X-RateLimit-Reset of each response are recorded per resource (core,
+# search, graphql) in a store every function instance reads, and a request first takes a permit
+# from it, waiting for the window to reset when the budget is spent. Permits are taken from the
+# store GH_RATE_CHUNK at a time so a shared store is not hit on every request.
+# Interactive callers (Slack commands, member pages) stop at GH_RATE_RESERVE of the limit, batch
+# jobs (site builds, reports) already at GH_RATE_BATCH_RESERVE, so a nightly build cannot spend
+# what a Slack command needs. Batch jobs wait out a spent budget (up to max_wait), interactive
+# callers sit behind an HTTP timeout and wait at most GH_RATE_INTERACTIVE_WAIT seconds before the
+# request goes out anyway.
+#
+# Store is picked with GH_RATE_BACKEND: memory (this worker only), file (a JSON file at
+# GH_RATE_PATH shared by processes on one machine, e.g. running locally) or table (GH_RATE_TABLE
+# in the storage account, shared by every instance).
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+RESERVES = {
+    INTERACTIVE: float(os.environ.get('GH_RATE_RESERVE', '0.01')),
+    BATCH: float(os.environ.get('GH_RATE_BATCH_RESERVE', '0.1'))
+}
+
+# another instance's response from the same window may be older, the lowest remaining wins
+def merge_budget(budget, remaining, reset, limit):
+    if budget and budget['reset'] == reset:
+        remaining = min(remaining, budget['remaining'])
+    elif budget and budget['reset'] > reset:
+        return budget
+
+    return { 'remaining': remaining, 'reset': reset, 'limit': limit }
+
+# (permits granted, seconds to wait when none were)
+def take_permits(budget, count, priority, now):
+    if not budget or budget['reset'] <= now: # unknown, or the window rolled over: the next response tells us
+        return count, 0
+
+    reserve = int(budget['limit'] * RESERVES.get(priority, RESERVES[BATCH]))
+    available = budget['remaining'] - reserve
+    if available <= 0:
+        return 0, budget['reset'] - now
+
+    granted = min(count, available)
+    budget['remaining'] = budget['remaining'] - granted
+    return granted, 0
+
+class MemoryRateBackend:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.budgets = {}
+
+    def Update(self, resource, remaining, reset, limit):
+        with self.lock:
+            self.budgets[resource] = merge_budget(self.budgets.get(resource, None), remaining, reset, limit)
+
+    def Take(self, resource, count, priority):
+        with self.lock:
+            return take_permits(self.budgets.get(resource, None), count, priority, time.time())
+
+class FileRateBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def Modify(self, change):
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read()
+                budgets = json.loads(text) if text else {}
+                result = change(budgets)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(budgets))
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def Update(self, resource, remaining, reset, limit):
+        def change(budgets):
+            budgets[resource] = merge_budget(budgets.get(resource, None), remaining, reset, limit)
+        self.Modify(change)
+
+    def Take(self, resource, count, priority):
+        return self.Modify(lambda budgets: take_permits(budgets.get(resource, None), count, priority, time.time()))
+
+class TableRateBackend:
+    partition_key = 'github'
+    attempts = 5
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.table_service = TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+    def GetRow(self, resource):
+        try:
+            return self.table_service.get_entity(self.table_name, self.partition_key, resource)
+        except AzureMissingResourceHttpError:
+            return None
+
+    def ToBudget(self, row):
+        if not row:
+            return None
+
+        return { 'remaining': row['Remaining'], 'reset': row['Reset'], 'limit': row['Limit'] }
+
+    def SaveRow(self, resource, row, budget):
+        entity = { 'PartitionKey': self.partition_key, 'RowKey': resource, 'Remaining': budget['remaining'], 'Reset': budget['reset'], 'Limit': budget['limit'] }
+        try:
+            if row:
+                self.table_service.update_entity(self.table_name, entity, if_match=row['etag'])
+            else:
+                self.table_service.insert_entity(self.table_name, entity)
+            return True
+        except AzureConflictHttpError: # inserted by another instance first
+            return False
+        except AzureHttpError as err:
+            if err.status_code == 412: # or updated first, read it again
+                return False
+            raise
+
+    def Update(self, resource, remaining, reset, limit):
+        for attempt in range(self.attempts):
+            row = self.GetRow(resource)
+            budget = merge_budget(self.ToBudget(row), remaining, reset, limit)
+            if row and budget == self.ToBudget(row):
+                return
+            if self.SaveRow(resource, row, budget):
+                return
+
+    def Take(self, resource, count, priority):
+        for attempt in range(self.attempts):
+            row = self.GetRow(resource)
+            budget = self.ToBudget(row)
+            granted, wait = take_permits(budget, count, priority, time.time())
+            if granted == 0 or not row:
+                return granted, wait
+            if self.SaveRow(resource, row, budget):
+                return granted, wait
+
+        return 1, 0 # too contended to count, let the request find out
+
+class RateLimitBudget:
+    def __init__(self, backend, chunk=1, max_wait=900, interactive_wait=None):
+        if interactive_wait is None:
+            interactive_wait = int(os.environ.get('GH_RATE_INTERACTIVE_WAIT', '5'))
+        self.lock = threading.Lock()
+        self.backend = backend
+        self.chunk = chunk
+        self.max_wait = max_wait
+        self.interactive_wait = interactive_wait
+        self.permits = {}
+        self.reported = {}
+
+    def Update(self, r):
+        remaining = r.headers.get('X-RateLimit-Remaining', None)
+        reset = r.headers.get('X-RateLimit-Reset', None)
+        if remaining is None or reset is None:
+            return
+
+        resource = r.headers.get('X-RateLimit-Resource', 'core')
+        limit = int(r.headers.get('X-RateLimit-Limit', '5000'))
+        with self.lock: # permits already count down the store, a shared one only needs correcting now and then
+            last = self.reported.get(resource, None)
+            if last and last[1] == int(reset) and abs(last[0] - int(remaining)) < self.chunk:
+                return
+            self.reported[resource] = (int(remaining), int(reset))
+
+        try:
+            self.backend.Update(resource, int(remaining), int(reset), limit)
+        except Exception as err:
+            logging.warn(f"GitHub rate limit update failed: {err}")
+
+    def GetMaxWait(self, priority):
+        return self.interactive_wait if priority == INTERACTIVE else self.max_wait
+
+    def TakeLocal(self, key):
+        with self.lock:
+            if self.permits.get(key, 0) > 0:
+                self.permits[key] = self.permits[key] - 1
+                return True
+
+        return False
+
+    # the lock only covers the local permits, the store is asked outside it so one thread's round
+    # trip (or wait) does not hold up the others; their chunks just add to the local permits
+    def Acquire(self, resource='core', priority=BATCH):
+        key = (resource, priority)
+        while True:
+            if self.TakeLocal(key):
+                return
+
+            try:
+                granted, wait = self.backend.Take(resource, self.chunk, priority)
+            except Exception as err: # the store being down should not stop GitHub calls
+                logging.warn(f"GitHub rate limit store failed: {err}")
+                return
+
+            if granted > 0:
+                with self.lock:
+                    self.permits[key] = self.permits.get(key, 0) + granted - 1
+                return
+
+            max_wait = self.GetMaxWait(priority)
+            if priority == INTERACTIVE and wait > max_wait: # nobody can wait that long, let GitHub answer
+                logging.warn(f"GitHub {resource} rate limit budget for {priority} callers exhausted for {int(wait)} seconds, not waiting")
+                return
+
+            wait = min(wait, max_wait)
+            logging.warn(f"GitHub {resource} rate limit budget for {priority} callers exhausted, waiting {int(wait)} seconds")
+            time.sleep(wait)
+            if wait >= max_wait:
+                return
+
+def get_rate_budget():
+    backend_name = os.environ.get('GH_RATE_BACKEND', 'memory').lower()
+    chunk = int(os.environ.get('GH_RATE_CHUNK', '10'))
+
+    backend = None
+    try:
+        if backend_name == 'table':
+            backend = TableRateBackend(os.environ['GH_RATE_TABLE'])
+        elif backend_name == 'file':
+            backend = FileRateBackend(os.environ.get('GH_RATE_PATH', '/tmp/github-rate-limit.json'))
+    except Exception as err:
+        logging.warn(f"Could not open {backend_name} GitHub rate limit store, using memory: {err}")
+
+    if not backend:
+        return RateLimitBudget(MemoryRateBackend())
+
+    return RateLimitBudget(backend, chunk)
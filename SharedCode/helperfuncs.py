@@ -7,12 +7,15 @@ import json
 import azure.functions as func
 import base64
 import os
-import requests
 import stripe
 from ..SharedCode.github import OWASPGitHub
 from ..SharedCode.owaspmailchimp import OWASPMailchimp
 from ..SharedCode.copper import OWASPCopper
 from ..SharedCode.googleapi import OWASPGoogle
+from ..SharedCode.leaderindex import leader_index
+from ..SharedCode.frontmatter import parse_front_matter
+from ..SharedCode.httpsession import get_session
+from ..SharedCode import membershipindex
 from sendgrid.helpers.mail import Mail
 from sendgrid.helpers.mail import Attachment
 from sendgrid.helpers.mail import FileContent
@@ -199,22 +202,8 @@ def is_force_majeure_country(country):
 # simple true/false function as opposed to the IsLeaderByEmail Azure Function that returns more details
 def is_leader_by_email(email):
     is_leader = False
-    if email:
-        email = email.lower()
-        gh = OWASPGitHub()
-        r = gh.GetFile('owasp.github.io', '_data/leaders.json')
-        if r.ok:
-            doc = json.loads(r.text)
-            content = base64.b64decode(doc['content']).decode(encoding='utf-8')
-            leaders = json.loads(content)
-            is_leader = False
-            gleader = {'group_url':'', 'group':''}
-            leaders.extend(json.loads(os.environ['OWASP.Additional.Leaders']))
-            for leader in leaders:
-                if email == leader['email']:
-                    gleader = leader
-                    is_leader = True
-                    break
+    if email and leader_index.Refresh():
+        is_leader = leader_index.IsLeader(email, include_additional=True)
 
     return is_leader
 
@@ -225,7 +214,7 @@ def send_onetime_secret(emails, secret):
     if len(emails) > 0:
         for email in emails:
             logging.info(f"Sending to {email}")
-            r = requests.post(f"https://onetimesecret.com/api/v1/share/?secret={secret}&recipient={email}", headers=headers)
+            r = get_session().post(f"https://onetimesecret.com/api/v1/share/?secret={secret}&recipient={email}", headers=headers)
             if not r.ok:
                 logging.error(f'Failed to send secret: {r.text}')
             else:
@@ -234,9 +223,7 @@ def send_onetime_secret(emails, secret):
         logging.error(f"No emails to send")
 
 def get_page_name(content):
-    sndx = content.find('title:') + 7
-    endx = content.find('\n', sndx)
-    return content[sndx:endx]
+    return parse_front_matter(content).get('title', '')
 
 def get_project_description(content):
     desc = ''
@@ -392,14 +379,11 @@ def build_staff_milestone_json(gh, projects):
 
     milestones.sort(key=lambda x: x.milestone_date)
     contents = json.dumps(milestones, default=lambda x: x.__dict__, indent=4)
-    r = gh.GetFile('www-staff', '_data/milestones.json')
-    sha = ''
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
-    r = gh.UpdateFile('www-staff', '_data/milestones.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
+    r, written = gh.UpsertFileIfChanged('www-staff', '_data/milestones.json', contents)
+    if written:
         logging.info('Updated www-staff/_data/milestones.json successfully')
+    elif gh.TestResultCode(r.status_code):
+        logging.info('www-staff/_data/milestones.json unchanged, skipped the commit')
     else:
         logging.error(f"Failed to update www-staff/_data/milestones.json: {r.text}")
 
@@ -438,14 +422,11 @@ def build_staff_project_json(gh):
     
     build_staff_milestone_json(gh, projects)
 
-    r = gh.GetFile('www-staff', '_data/projects.json')
-    sha = ''
-    if gh.TestResultCode(r.status_code):
-        doc = json.loads(r.text)
-        sha = doc['sha']
-    r = gh.UpdateFile('www-staff', '_data/projects.json', contents, sha)
-    if gh.TestResultCode(r.status_code):
+    r, written = gh.UpsertFileIfChanged('www-staff', '_data/projects.json', contents)
+    if written:
         logging.info('Updated www-staff/_data/projects.json successfully')
+    elif gh.TestResultCode(r.status_code):
+        logging.info('www-staff/_data/projects.json unchanged, skipped the commit')
     else:
         logging.error(f"Failed to update www-staff/_data/projects.json: {r.text}")
 
@@ -559,9 +540,9 @@ class MemberData:
                 start_set = datetime.fromtimestamp(stts)
 
         if not start_set: # if copper did not have it, pull it from Stripe
-            customers = stripe.Customer.list(email=email)
-            if len(customers.data) > 0:
-                customer = customers.data[0]
+            customers = membershipindex.get_member_customers(email)
+            if len(customers) > 0:
+                customer = customers[0]
                 cmetadata = customer.get('metadata', None)
                 if cmetadata:
                     memstart = cmetadata.get('membership_start', None)
@@ -629,7 +610,7 @@ class MemberData:
                 use_person = person
                 if len(person['emails']) > 0: # do not need people we have no email for
                     for email in person['emails']:
-                        customers = stripe.Customer.list(email=email['email'])                       
+                        customers = membershipindex.get_member_customers(email['email'])
                         for customer in customers:
                             metadata = customer.get('metadata', None)
                             if metadata.get('membership_type', None) == 'lifetime': # only one that matters...use this
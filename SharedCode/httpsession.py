@@ -0,0 +1,57 @@
+import os
+import threading
+import http.cookiejar
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One pooled requests.Session per worker process for the SharedCode clients (GitHub, Copper, Meetup,
+# Salesforce, YM, Zoom...). Connections are kept alive and reused per host instead of a new TLS
+# handshake per call. Calls without an explicit timeout get HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT.
+# Connection failures and 502/503/504 on idempotent requests are retried with backoff here;
+# API rate limits (403/429) are left to the clients, which know each service's headers.
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    def __init__(self, *args, **kwargs):
+        self.timeout = kwargs.pop('timeout', None)
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout', None) is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session():
+    retry = Retry(
+        total=int(os.environ.get('HTTP_RETRIES', '3')),
+        backoff_factor=float(os.environ.get('HTTP_BACKOFF_FACTOR', '0.5')),
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False,
+        respect_retry_after_header=True
+    )
+    timeout = (float(os.environ.get('HTTP_CONNECT_TIMEOUT', '10')), float(os.environ.get('HTTP_READ_TIMEOUT', '60')))
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=int(os.environ.get('HTTP_POOL_HOSTS', '10')),
+        pool_maxsize=int(os.environ.get('HTTP_POOL_SIZE', '16')),
+        max_retries=retry,
+        timeout=timeout
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # the clients share the session, so nothing one of them is sent back should ride along on another's calls
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+
+    return _session
@@ -0,0 +1,183 @@
+import os
+import logging
+import stripe
+from azure.common import AzureConflictHttpError, AzureHttpError, AzureMissingResourceHttpError
+from azure.cosmosdb.table.tableservice import TableService
+
+# Ticket and discount code inventory counted in INVENTORY_TABLE instead of read-decrement-write
+# on Stripe metadata. One row per SKU or coupon (PartitionKey 'sku'/'coupon', RowKey the id) with
+# Remaining, Uses and Tracked (False when the Stripe object has no inventory, i.e. unlimited).
+# Changes are conditional merges on the row's ETag so concurrent checkouts cannot both take the
+# last ticket. Rows are seeded from Stripe metadata the first time they are needed, InventorySync
+# copies Remaining/Uses back into Stripe metadata (rows marked Dirty) and a metadata edit made in
+# Stripe (the eventbot product form) resets the counter. Without INVENTORY_TABLE nothing is
+# reserved and StripeQueueWorker updates Stripe metadata as before.
+
+SKU = 'sku'
+COUPON = 'coupon'
+ATTEMPTS = 10
+
+def is_enabled():
+    return bool(os.environ.get('INVENTORY_TABLE', ''))
+
+def get_table_service():
+    return TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+def parse_inventory(value):
+    if value is None or value == '':
+        return None
+
+    return int(value)
+
+def retrieve(kind, object_id):
+    if kind == SKU:
+        return stripe.SKU.retrieve(object_id, api_key=os.environ['STRIPE_SECRET'])
+
+    return stripe.Coupon.retrieve(object_id, api_key=os.environ['STRIPE_SECRET'])
+
+def make_counter_row(kind, object_id, metadata):
+    remaining = parse_inventory(metadata.get('inventory', None))
+    uses = int(metadata.get('uses', 0) or 0)
+    return {
+        'PartitionKey': kind,
+        'RowKey': object_id,
+        'Tracked': remaining is not None,
+        'Remaining': remaining or 0,
+        'Uses': uses,
+        'SyncedInventory': '' if remaining is None else str(remaining),
+        'Dirty': False
+    }
+
+def get_counter(kind, object_id, table_service):
+    table_name = os.environ['INVENTORY_TABLE']
+    try:
+        return table_service.get_entity(table_name, kind, object_id)
+    except AzureMissingResourceHttpError:
+        pass
+
+    row = make_counter_row(kind, object_id, retrieve(kind, object_id).get('metadata', {}))
+    try:
+        table_service.insert_entity(table_name, row)
+    except AzureConflictHttpError: # seeded by someone else meanwhile
+        pass
+
+    return table_service.get_entity(table_name, kind, object_id)
+
+# adds delta to Remaining (or Uses), False if that would take tracked stock below zero
+def adjust(kind, object_id, delta, field='Remaining', table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    for attempt in range(ATTEMPTS):
+        row = get_counter(kind, object_id, table_service)
+        if field == 'Remaining':
+            if not row['Tracked']:
+                return True
+            if delta < 0 and row['Remaining'] + delta < 0:
+                return False
+
+        try:
+            table_service.merge_entity(os.environ['INVENTORY_TABLE'], { 'PartitionKey': kind, 'RowKey': object_id, field: row[field] + delta, 'Dirty': True }, if_match=row['etag'])
+            return True
+        except AzureHttpError as err:
+            if err.status_code != 412: # 412: another checkout changed it first, read it again
+                raise
+
+    logging.error(f"Could not adjust {kind} {object_id} {field} by {delta}")
+    return False
+
+def get_order_items(sku_ids, discount_code=None):
+    items = [(SKU, sku_id) for sku_id in sku_ids]
+    if discount_code:
+        items.append((COUPON, discount_code.strip().upper()))
+
+    return items
+
+# takes one of each SKU (and a use of the discount code's inventory), all or nothing
+def reserve_order(sku_ids, discount_code=None, table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    reserved = []
+    for kind, object_id in get_order_items(sku_ids, discount_code):
+        if not adjust(kind, object_id, -1, table_service=table_service):
+            for rkind, robject_id in reserved:
+                adjust(rkind, robject_id, 1, table_service=table_service)
+            return False
+        reserved.append((kind, object_id))
+
+    return True
+
+def release_order(sku_ids, discount_code=None, table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    for kind, object_id in get_order_items(sku_ids, discount_code):
+        adjust(kind, object_id, 1, table_service=table_service)
+
+def add_use(discount_code, table_service=None):
+    return adjust(COUPON, discount_code.strip().upper(), 1, field='Uses', table_service=table_service)
+
+# inventory set in Stripe by hand replaces the count, our own syncs come back unchanged
+def apply_stripe_update(kind, object_id, metadata, table_service=None):
+    if not is_enabled():
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['INVENTORY_TABLE']
+    try:
+        row = table_service.get_entity(table_name, kind, object_id)
+    except AzureMissingResourceHttpError:
+        return # seeded from Stripe when first needed
+
+    inventory = (metadata or {}).get('inventory', None)
+    if str(inventory or '') == row.get('SyncedInventory', ''):
+        return
+
+    update = make_counter_row(kind, object_id, metadata or {})
+    update['Uses'] = row.get('Uses', 0)
+    try:
+        table_service.update_entity(table_name, update, if_match=row['etag'])
+    except AzureHttpError as err:
+        if err.status_code != 412:
+            raise
+        logging.warn(f"{kind} {object_id} changed while applying its Stripe inventory, next update will apply it")
+
+def sync(table_service=None):
+    if not is_enabled():
+        logging.warn('INVENTORY_TABLE is not configured, nothing to sync')
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['INVENTORY_TABLE']
+    synced = 0
+    for row in table_service.query_entities(table_name, filter="Dirty eq true"):
+        metadata = { 'uses': row.get('Uses', 0) } if row['PartitionKey'] == COUPON else {}
+        if row['Tracked']:
+            metadata['inventory'] = row['Remaining']
+
+        # recorded first so the webhook for our own update is not taken for a change made in Stripe,
+        # a row that changed since it was read stays dirty for the next run
+        synced_inventory = str(row['Remaining']) if row['Tracked'] else ''
+        try:
+            etag = table_service.merge_entity(table_name, { 'PartitionKey': row['PartitionKey'], 'RowKey': row['RowKey'], 'SyncedInventory': synced_inventory }, if_match=row['etag'])
+        except AzureHttpError as err:
+            if err.status_code != 412:
+                raise
+            continue
+
+        if row['PartitionKey'] == SKU:
+            stripe.SKU.modify(row['RowKey'], metadata=metadata, api_key=os.environ['STRIPE_SECRET'])
+        else:
+            stripe.Coupon.modify(row['RowKey'], metadata=metadata, api_key=os.environ['STRIPE_SECRET'])
+
+        try:
+            table_service.merge_entity(table_name, { 'PartitionKey': row['PartitionKey'], 'RowKey': row['RowKey'], 'Dirty': False }, if_match=etag)
+        except AzureHttpError as err:
+            if err.status_code != 412:
+                raise
+        synced = synced + 1
+
+    logging.info(f"Inventory: synced {synced} counters to Stripe")
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from .github import OWASPGitHub, INTERACTIVE
+
+# In-process index over owasp.github.io/_data/leaders.json.
+# The file is downloaded once per worker and indexed by lowercased email and by group url
+# so leader lookups are dictionary hits. After LEADERS_INDEX_TTL seconds the next lookup
+# re-requests the file; GetFile answers from its ETag cache when nothing changed and the
+# index is only rebuilt when the ETag differs.
+
+def normalize_email(email):
+    if not email:
+        return ''
+
+    return email.replace('mailto://', '').replace('mailto:', '').strip().lower()
+
+class LeaderIndex:
+    leaders_repo = 'owasp.github.io'
+    leaders_path = '_data/leaders.json'
+
+    def __init__(self, ttl=None):
+        if ttl is None:
+            ttl = int(os.environ.get('LEADERS_INDEX_TTL', '300'))
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.etag = None
+        self.loaded_at = 0
+        self.leaders = []
+        self.by_email = {}
+        self.by_group_url = {}
+        self.additional_by_email = None
+
+    def Refresh(self, force=False):
+        with self.lock:
+            if not force and self.leaders and (time.time() - self.loaded_at) < self.ttl:
+                return True
+
+            gh = OWASPGitHub(priority=INTERACTIVE) # member pages wait on this
+            r = gh.GetFile(self.leaders_repo, self.leaders_path)
+            if not r.ok:
+                logging.error(f"Error retrieving leaders file from GitHub: {r.text}")
+                return len(self.leaders) > 0 # keep answering from what we have
+
+            self.loaded_at = time.time()
+            etag = r.headers.get('ETag', None)
+            if etag and etag == self.etag and self.leaders:
+                return True
+
+            doc = json.loads(r.text)
+            content = base64.b64decode(doc['content']).decode(encoding='utf-8')
+            self.Build(json.loads(content))
+            self.etag = etag
+
+        return True
+
+    def Build(self, leaders):
+        by_email = {}
+        by_group_url = {}
+        for leader in leaders:
+            email = normalize_email(leader.get('email', None))
+            if email:
+                by_email.setdefault(email, []).append(leader)
+            group_url = leader.get('group_url', None)
+            if group_url:
+                by_group_url.setdefault(group_url, []).append(leader)
+
+        self.leaders = leaders
+        self.by_email = by_email
+        self.by_group_url = by_group_url
+
+    def GetAdditionalLeaders(self):
+        if self.additional_by_email is None:
+            additional = {}
+            for leader in json.loads(os.environ.get('OWASP.Additional.Leaders', '[]')):
+                email = normalize_email(leader.get('email', None))
+                if email:
+                    additional.setdefault(email, []).append(leader)
+            self.additional_by_email = additional
+
+        return self.additional_by_email
+
+    def GetLeader(self, email, include_additional=False):
+        email = normalize_email(email)
+        entries = list(self.by_email.get(email, []))
+        if include_additional:
+            entries.extend(self.GetAdditionalLeaders().get(email, []))
+
+        return entries
+
+    def IsLeader(self, email, include_additional=False):
+        return len(self.GetLeader(email, include_additional)) > 0
+
+    def GetGroupLeaders(self, group_url):
+        return self.by_group_url.get(group_url, [])
+
+    def Count(self):
+        return len(self.leaders)
+
+leader_index = LeaderIndex()
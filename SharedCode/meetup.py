@@ -1,4 +1,3 @@
-import requests
 import json
 import base64
 from pathlib import Path
@@ -11,6 +10,78 @@ import jwt
 from jwt import algorithms
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from azure.cosmosdb.table.tableservice import TableService
+from .httpsession import get_session
+
+# urlname -> Meetup group id. Group ids never change, so they are kept in MEETUP_GROUP_TABLE
+# (when storage is configured) and only groups we have not seen before cost a lookup.
+# Urlnames Meetup does not know are kept too (with an empty GroupId) and not looked up again
+# for MU_GROUP_MISS_TTL seconds, in case the group is created later.
+class MeetupGroupIdCache:
+    partition_key = 'meetupgroup'
+    miss_ttl = int(os.environ.get('MU_GROUP_MISS_TTL', '86400'))
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = None
+        self.misses = None
+        self.table_service = None
+        self.table_name = os.environ.get('MEETUP_GROUP_TABLE', '')
+        if self.table_name and 'STORAGE_ACCOUNT' in os.environ:
+            self.table_service = TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+    def Load(self):
+        with self.lock:
+            if self.ids is not None:
+                return
+
+            ids = {}
+            misses = {}
+            if self.table_service:
+                try:
+                    for row in self.table_service.query_entities(self.table_name, filter=f"PartitionKey eq '{self.partition_key}'"):
+                        if row['GroupId']:
+                            ids[row['RowKey']] = row['GroupId']
+                        else:
+                            misses[row['RowKey']] = row.get('MissedAt', 0)
+                except Exception as err:
+                    logging.warn(f"Could not load meetup group ids: {err}")
+            self.ids = ids
+            self.misses = misses
+
+    def Get(self, groupname):
+        self.Load()
+        return self.ids.get(groupname.lower(), '')
+
+    def IsMissing(self, groupname):
+        self.Load()
+        missed_at = self.misses.get(groupname.lower(), None)
+        return missed_at is not None and time.time() - missed_at < self.miss_ttl
+
+    def Set(self, groupname, id):
+        self.Load()
+        key = groupname.lower()
+        with self.lock:
+            self.ids[key] = id
+            self.misses.pop(key, None)
+        self.Save(groupname, { 'PartitionKey': self.partition_key, 'RowKey': key, 'GroupId': id })
+
+    def SetMissing(self, groupname):
+        self.Load()
+        key = groupname.lower()
+        missed_at = int(time.time())
+        with self.lock:
+            self.misses[key] = missed_at
+        self.Save(groupname, { 'PartitionKey': self.partition_key, 'RowKey': key, 'GroupId': '', 'MissedAt': missed_at })
+
+    def Save(self, groupname, entity):
+        if self.table_service:
+            try:
+                self.table_service.insert_or_replace_entity(self.table_name, entity=entity)
+            except Exception as err:
+                logging.warn(f"Could not save meetup group id for {groupname}: {err}")
 
 class OWASPMeetup:
     meetup_api_url = "https://api.meetup.com"
@@ -19,10 +90,53 @@ class OWASPMeetup:
     refresh_token = ''
     oauth_token = ''
     oauth_token_secret = ''
+    group_ids = MeetupGroupIdCache()
+    events_workers = int(os.environ.get('MU_EVENTS_WORKERS', '3'))
+    events_batch_size = int(os.environ.get('MU_EVENTS_BATCH_SIZE', '10'))
+    throttle_lock = threading.Lock()
+    throttled_until = 0
 
     def HandleRateLimit(self):
         time.sleep(1 * random.randint(0, 3))
 
+    # when Meetup throttles one worker every worker backs off, not just the one that was told
+    def Throttle(self, count):
+        with self.throttle_lock:
+            until = time.time() + (2 ** count) + random.randint(0, 3)
+            if until > OWASPMeetup.throttled_until:
+                OWASPMeetup.throttled_until = until
+
+    def WaitForThrottle(self):
+        wait = OWASPMeetup.throttled_until - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+    def PostQuery(self, query, caller):
+        headers = self.GetHeaders()
+        query_data = {
+            "query": query
+        }
+
+        json_res = ''
+        tryagain = True
+        count = 0
+        maxcount = 5
+        while(tryagain and count < maxcount):
+            self.WaitForThrottle()
+            res = get_session().post(self.meetup_gql_url, headers=headers, data=json.dumps(query_data))
+            json_res = ''
+            if res.ok:
+                json_res = res.text
+                tryagain = False
+            elif 'throttled' in res.text or res.status_code == 429:
+                self.Throttle(count)
+                count = count + 1
+            else:
+                logging.warn(f"{caller} failed with {res.text}")
+                tryagain = False
+
+        return json_res
+
     def GetHeaders(self):
         headers = {
             'Content-Type': 'application/json',
@@ -57,7 +171,7 @@ class OWASPMeetup:
                  "grant_type" : "urn:ietf:params:oauth:grant-type:jwt-bearer",
                  "assertion" : encoded
              }
-            res = requests.post(login_url, data=urldata, headers={'Content-Type': 'application/x-www-form-urlencoded', 'Accept':'application/json'})
+            res = get_session().post(login_url, data=urldata, headers={'Content-Type': 'application/x-www-form-urlencoded', 'Accept':'application/json'})
             
             json_res = json.loads(res.text)
             self.access_token = json_res['access_token']
@@ -77,14 +191,14 @@ class OWASPMeetup:
     #         'X-OAuth-Scopes': 'event_management, basic'
     #     }
 
-    #     res = requests.post(login_url, headers=headers)
+    #     res = get_session().post(login_url, headers=headers)
     #     result = False
     #     if '"code":' in res.text:
     #         try:
     #             json_res = json.loads(res.text)
     #             auth_code = json_res['code']
     #             login_url  = f"https://secure.meetup.com/oauth2/access?client_id={os.environ['MU_CONSUMER_KEY']}&client_secret={os.environ['MU_SECRET']}&code={auth_code}&redirect_uri={os.environ['MU_REDIRECT_URI']}&grant_type=anonymous_code"
-    #             res = requests.post(login_url, headers=headers)
+    #             res = get_session().post(login_url, headers=headers)
     #             json_res = json.loads(res.text)
     #             self.access_token = json_res['access_token']
     #             self.refresh_token = json_res['refresh_token']
@@ -94,7 +208,7 @@ class OWASPMeetup:
     #                 'Authorization': f'Bearer {self.access_token}'
     #             }
     #             login_url = f"https://api.meetup.com/sessions?email={os.environ['MU_USER_NAME']}&password={os.environ['MU_USER_PW']}"
-    #             res = requests.post(login_url, headers=headers)
+    #             res = get_session().post(login_url, headers=headers)
     #             json_res = json.loads(res.text)
     #             self.oauth_token = json_res['oauth_token']
     #             self.oauth_token_secret = json_res['oauth_token_secret']
@@ -105,63 +219,96 @@ class OWASPMeetup:
 
     #     return result    
 
-    def GetGroupEvents(self, groupname, earliest = '', status = ''):
-        headers = self.GetHeaders()
-        
-        id = self.GetGroupIdFromGroupname(groupname)
-        if not status:
-            status = "UPCOMING"
+    def GetEventDates(self, earliest = ''):
         datemax = (datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d')
         datemin = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
         if earliest:
             datemin = earliest #here, we are assuming an ISO 8601 format date
 
-        query = "query { proNetworkByUrlname(urlname: \"OWASP\") {"
-        query += "eventsSearch(filter: { status: :STATUS groups: [ \":GROUPID\" ] "
+        return datemin, datemax
+
+    def GetEventsSearchQuery(self, id, status, datemin, datemax, alias = ''):
+        query = ""
+        if alias:
+            query += alias + ": "
+        query += "proNetworkByUrlname(urlname: \"OWASP\") {"
+        query += "eventsSearch(filter: { status: :STATUS groups: [ :GROUPID ] "
         query += f"eventDateMin: \"{datemin}\" eventDateMax: \"{datemax}\""
         query += "  }, input: { first: 100 }) {"
-        query += " count pageInfo { endCursor } edges { node { id title eventUrl dateTime timezone description }}}}}"
-        query = query.replace(":GROUPID",id).replace(":STATUS", status.upper())
-        query_data = {
-            "query": query
-        }
-        
-        
-        json_res = ''
-        tryagain = True
-        count = 0
-        maxcount = 5
-        while(tryagain and count < maxcount):
-            res = requests.post(self.meetup_gql_url, headers=headers, data=json.dumps(query_data))
-            json_res = ''
-            if res.ok:
-                json_res = res.text
-                tryagain = False
-            elif 'throttled' in res.text:
-                self.HandleRateLimit()
-                count = count + 1
-            else:
-                logging.warn(f"GetGroupEvents failed with {res.text}")
-                tryagain = False
-                
-        return json_res
+        query += " count pageInfo { endCursor } edges { node { id title eventUrl dateTime timezone description }}}}"
+        return query.replace(":GROUPID", json.dumps(id)).replace(":STATUS", status.upper())
+
+    def GetGroupEvents(self, groupname, earliest = '', status = ''):
+        id = self.GetGroupIdFromGroupname(groupname)
+        if not status:
+            status = "UPCOMING"
+        datemin, datemax = self.GetEventDates(earliest)
+
+        query = "query { " + self.GetEventsSearchQuery(id, status, datemin, datemax) + "}"
+        return self.PostQuery(query, "GetGroupEvents")
+
+    # Events for many groups at once: unknown group ids are looked up first, then each batch of
+    # groups goes out as one aliased query, batches spread over a small worker pool.
+    # Returns groupname -> the same json string GetGroupEvents gives for that group ('' if it failed).
+    def GetEventsForGroups(self, groupnames, earliest = '', status = ''):
+        if not status:
+            status = "UPCOMING"
+        datemin, datemax = self.GetEventDates(earliest)
+
+        groupnames = list(dict.fromkeys(groupnames))
+        ids = self.GetGroupIdsFromGroupnames(groupnames)
+        results = { groupname: '' for groupname in groupnames }
+        found = [groupname for groupname in groupnames if ids.get(groupname, '')]
+        batches = [found[i:i + self.events_batch_size] for i in range(0, len(found), self.events_batch_size)]
+
+        def get_batch(batch):
+            query = "query { "
+            for i, groupname in enumerate(batch):
+                query += self.GetEventsSearchQuery(ids[groupname], status, datemin, datemax, f"g{i}") + " "
+            query += "}"
+            json_res = self.PostQuery(query, "GetEventsForGroups")
+            batch_results = {}
+            if json_res:
+                jdata = json.loads(json_res).get('data', None) or {}
+                for i, groupname in enumerate(batch):
+                    batch_results[groupname] = json.dumps({ 'data': { 'proNetworkByUrlname': jdata.get(f"g{i}", None) } })
+            return batch_results
+
+        with ThreadPoolExecutor(max_workers=self.events_workers) as executor:
+            for batch_results in executor.map(get_batch, batches):
+                results.update(batch_results)
+
+        return results
 
     def GetGroupIdFromGroupname(self, groupname):
-        headers = self.GetHeaders()
-        querystr = "query {"
-        querystr += " groupByUrlname(urlname: \"" + groupname + "\")"
-        querystr += "{ id }"
-        querystr += "}"
+        return self.GetGroupIdsFromGroupnames([groupname]).get(groupname, '')
 
-        query_data = {
-            "query": querystr
-        }
-        
-        res = requests.post(self.meetup_gql_url, headers=headers, data=json.dumps(query_data))
-        id = ""
-        if res.ok:
-            jgroup = json.loads(res.text)
-            if jgroup['data']['groupByUrlname']:
-                id = jgroup['data']['groupByUrlname']['id']
-                
-        return id
+    def GetGroupIdsFromGroupnames(self, groupnames):
+        ids = {}
+        missing = []
+        for groupname in groupnames:
+            id = self.group_ids.Get(groupname)
+            if id:
+                ids[groupname] = id
+            elif not self.group_ids.IsMissing(groupname):
+                missing.append(groupname)
+
+        for i in range(0, len(missing), self.events_batch_size):
+            batch = missing[i:i + self.events_batch_size]
+            querystr = "query {"
+            for n, groupname in enumerate(batch):
+                querystr += f" g{n}: groupByUrlname(urlname: {json.dumps(groupname)}) {{ id }}"
+            querystr += "}"
+
+            json_res = self.PostQuery(querystr, "GetGroupIdFromGroupname")
+            if not json_res:
+                continue
+            jdata = json.loads(json_res).get('data', None) or {}
+            for n, groupname in enumerate(batch):
+                if jdata.get(f"g{n}", None):
+                    ids[groupname] = jdata[f"g{n}"]['id']
+                    self.group_ids.Set(groupname, ids[groupname])
+                elif f"g{n}" in jdata: # answered with null, Meetup has no such group
+                    self.group_ids.SetMissing(groupname)
+
+        return ids
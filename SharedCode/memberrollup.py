@@ -0,0 +1,247 @@
+import os
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import stripe
+from azure.common import AzureConflictHttpError, AzureHttpError, AzureMissingResourceHttpError
+from azure.cosmosdb.table.tableservice import TableService
+from azure.cosmosdb.table.tablebatch import TableBatch
+from .membershipindex import parse_membership_date, MEMBER_SEARCH
+
+# Member counts kept in MEMBER_ROLLUP_TABLE so /member-report does not page every Stripe customer.
+# PartitionKey is the membership type and RowKey the membership_end date (YYYY-MM-DD, 'never' for
+# lifetime) with a Count column. Counts by expiry month, and how many are current today, are sums
+# over those rows. StripeWebhookProcessor moves a customer between buckets as their metadata changes
+# and recount() rebuilds the whole table from Stripe.
+# The bucket each customer was last counted in is kept as well (PartitionKey CUSTOMER_PARTITION,
+# RowKey the customer id, Bucket column), so a replayed or retried customer event finds the customer
+# already where it belongs and changes nothing.
+
+NO_EXPIRY = 'never'
+CUSTOMER_PARTITION = 'customer'
+BATCH_SIZE = 100
+REPORT_TYPES = ['one', 'two', 'lifetime', 'complimentary']
+
+def is_enabled():
+    return bool(os.environ.get('MEMBER_ROLLUP_TABLE', ''))
+
+def get_table_service():
+    return TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+# the bucket a customer's membership metadata counts in, or None if it does not count
+def get_bucket(metadata):
+    if not metadata:
+        return None
+
+    member_type = metadata.get('membership_type', None)
+    if not member_type:
+        return None
+    member_type = member_type.lower().strip()
+    if member_type == 'lifetime':
+        return (member_type, NO_EXPIRY)
+
+    member_end = parse_membership_date(metadata.get('membership_end', None))
+    if not member_end:
+        return None
+
+    return (member_type, member_end.strftime('%Y-%m-%d'))
+
+def adjust_bucket(bucket, delta, table_service):
+    table_name = os.environ['MEMBER_ROLLUP_TABLE']
+    member_type, expiry = bucket
+    for attempt in range(10): # other webhook deliveries may be moving the same bucket
+        try:
+            row = table_service.get_entity(table_name, member_type, expiry)
+        except AzureMissingResourceHttpError:
+            try:
+                table_service.insert_entity(table_name, { 'PartitionKey': member_type, 'RowKey': expiry, 'Count': max(delta, 0) })
+                return
+            except AzureConflictHttpError:
+                continue
+
+        count = max(row.get('Count', 0) + delta, 0)
+        try:
+            table_service.update_entity(table_name, { 'PartitionKey': member_type, 'RowKey': expiry, 'Count': count }, if_match=row['etag'])
+            return
+        except AzureHttpError as err:
+            if err.status_code != 412:
+                raise
+
+    logging.error(f"Could not adjust member rollup {bucket} by {delta}")
+
+# previous_attributes is what Stripe sends with customer.updated; only changed metadata keys are in it
+def get_previous_metadata(metadata, previous_attributes):
+    if not previous_attributes or 'metadata' not in previous_attributes:
+        return metadata
+
+    previous = dict(metadata or {})
+    for key, value in (previous_attributes['metadata'] or {}).items():
+        if value is None or value == '':
+            previous.pop(key, None)
+        else:
+            previous[key] = value
+
+    return previous
+
+def bucket_key(bucket):
+    return '|'.join(bucket) if bucket else ''
+
+def parse_bucket_key(key):
+    return tuple(key.split('|', 1)) if key else None
+
+# Records new_bucket as the customer's, True when this call moved it (so it owns the adjustment).
+# A customer not seen before is taken to be in the bucket the event says it came from.
+def claim_customer_bucket(customer_id, derived_old_bucket, new_bucket, table_service):
+    table_name = os.environ['MEMBER_ROLLUP_TABLE']
+    row = { 'PartitionKey': CUSTOMER_PARTITION, 'RowKey': customer_id, 'Bucket': bucket_key(new_bucket) }
+    for attempt in range(10):
+        try:
+            known = table_service.get_entity(table_name, CUSTOMER_PARTITION, customer_id)
+        except AzureMissingResourceHttpError:
+            known = None
+
+        old_bucket = parse_bucket_key(known['Bucket']) if known else derived_old_bucket
+        if old_bucket == new_bucket:
+            return None, False
+        try:
+            if known:
+                table_service.update_entity(table_name, row, if_match=known['etag'])
+            else:
+                table_service.insert_entity(table_name, row)
+            return old_bucket, True
+        except AzureConflictHttpError:
+            continue
+        except AzureHttpError as err:
+            if err.status_code != 412:
+                raise
+
+    logging.error(f"Could not record member rollup bucket for {customer_id}")
+    return None, False
+
+def apply_customer_event(event_type, customer, previous_attributes=None, table_service=None):
+    if not is_enabled():
+        return
+
+    metadata = customer.get('metadata', None) or {}
+    derived_old_bucket = None
+    new_bucket = None
+    if event_type == 'customer.created':
+        new_bucket = get_bucket(metadata)
+    elif event_type == 'customer.deleted':
+        derived_old_bucket = get_bucket(metadata)
+    else:
+        derived_old_bucket = get_bucket(get_previous_metadata(metadata, previous_attributes))
+        new_bucket = get_bucket(metadata)
+
+    if not table_service:
+        table_service = get_table_service()
+    # the customer row is moved first: a retry after it finds nothing to do, rather than counting twice
+    old_bucket, moved = claim_customer_bucket(customer['id'], derived_old_bucket, new_bucket, table_service)
+    if not moved:
+        return
+    if old_bucket:
+        adjust_bucket(old_bucket, -1, table_service)
+    if new_bucket:
+        adjust_bucket(new_bucket, 1, table_service)
+
+# bucket counts, empty when the table has not been created (recounted) yet
+def load_rollup(table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    rollup = {}
+    try:
+        for row in table_service.query_entities(os.environ['MEMBER_ROLLUP_TABLE'], filter=f"PartitionKey ne '{CUSTOMER_PARTITION}'"):
+            rollup[(row['PartitionKey'], row['RowKey'])] = row.get('Count', 0)
+    except AzureMissingResourceHttpError:
+        logging.warn(f"Member rollup table {os.environ['MEMBER_ROLLUP_TABLE']} does not exist")
+        return {}
+
+    return rollup
+
+# current members by type, as the member report has always counted them
+def get_member_counts(rollup, today=None):
+    if not today:
+        today = datetime.today()
+    todaystr = today.strftime('%Y-%m-%d')
+
+    member_data = { member_type: 0 for member_type in REPORT_TYPES }
+    for (member_type, expiry), count in rollup.items():
+        if member_type not in member_data:
+            continue
+        if expiry == NO_EXPIRY or expiry > todaystr: # a membership ending today has lapsed
+            member_data[member_type] += count
+
+    return member_data
+
+# members expiring per YYYY-MM from this month on
+def get_expiring_by_month(rollup, today=None):
+    if not today:
+        today = datetime.today()
+    todaystr = today.strftime('%Y-%m-%d')
+
+    months = {}
+    for (member_type, expiry), count in rollup.items():
+        if expiry == NO_EXPIRY or expiry <= todaystr or count <= 0:
+            continue
+        months[expiry[:7]] = months.get(expiry[:7], 0) + count
+
+    return months
+
+def count_customers(query):
+    counts = {}
+    customer_buckets = {}
+    customers = stripe.Customer.search(query=query, limit=100, api_key=os.environ['STRIPE_SECRET'], stripe_version="2020-08-27")
+    for customer in customers.auto_paging_iter():
+        bucket = get_bucket(customer.get('metadata', None))
+        if bucket:
+            counts[bucket] = counts.get(bucket, 0) + 1
+            customer_buckets[customer['id']] = bucket
+
+    return counts, customer_buckets
+
+# Search results only page with a cursor, so the parallelism is one search per report type
+# plus one for every other type, each paged on its own worker.
+def recount(table_service=None):
+    queries = [f"metadata['membership_type']:'{member_type}'" for member_type in REPORT_TYPES]
+    queries.append(" AND ".join([MEMBER_SEARCH] + [f"-metadata['membership_type']:'{member_type}'" for member_type in REPORT_TYPES]))
+
+    rollup = {}
+    customer_buckets = {}
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        for counts, buckets in executor.map(count_customers, queries):
+            for bucket, count in counts.items():
+                rollup[bucket] = rollup.get(bucket, 0) + count
+            customer_buckets.update(buckets)
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['MEMBER_ROLLUP_TABLE']
+    table_service.create_table(table_name) # no-op once it exists
+    previous = load_rollup(table_service)
+    for (member_type, expiry), count in rollup.items():
+        if previous.get((member_type, expiry), None) != count:
+            table_service.insert_or_replace_entity(table_name, { 'PartitionKey': member_type, 'RowKey': expiry, 'Count': count })
+    for member_type, expiry in previous:
+        if (member_type, expiry) not in rollup:
+            table_service.delete_entity(table_name, member_type, expiry)
+
+    # what each customer now counts in, so later events move them from the right bucket
+    operations = []
+    for row in table_service.query_entities(table_name, filter=f"PartitionKey eq '{CUSTOMER_PARTITION}'", select='RowKey,Bucket'):
+        if row['RowKey'] not in customer_buckets:
+            operations.append(('delete', row['RowKey']))
+        elif row.get('Bucket', '') == bucket_key(customer_buckets[row['RowKey']]):
+            customer_buckets.pop(row['RowKey'])
+    operations.extend([('upsert', customer_id) for customer_id in customer_buckets])
+    for start in range(0, len(operations), BATCH_SIZE):
+        batch = TableBatch()
+        for op, customer_id in operations[start:start + BATCH_SIZE]:
+            if op == 'delete':
+                batch.delete_entity(CUSTOMER_PARTITION, customer_id)
+            else:
+                batch.insert_or_replace_entity({ 'PartitionKey': CUSTOMER_PARTITION, 'RowKey': customer_id, 'Bucket': bucket_key(customer_buckets[customer_id]) })
+        table_service.commit_batch(table_name, batch)
+
+    logging.info(f"Member rollup recounted: {sum(rollup.values())} members in {len(rollup)} buckets")
+    return rollup
@@ -0,0 +1,167 @@
+import os
+import json
+import logging
+import urllib.parse
+from datetime import datetime
+import stripe
+from azure.cosmosdb.table.tableservice import TableService
+
+# Membership index materialized from the membership metadata on Stripe customers.
+# One row per customer carrying a membership_type, partitioned by lowercased email, so checking
+# someone's membership is a single partition read instead of a live stripe.Customer.list.
+# StripeWebhookProcessor keeps rows current from customer.created/updated/deleted events and
+# MembershipIndexReconcile sweeps every member customer nightly to repair anything missed.
+# Without MEMBERSHIP_TABLE configured lookups go to Stripe as before.
+
+MEMBER_SEARCH = "-metadata['membership_type']:null"
+
+def is_enabled():
+    return bool(os.environ.get('MEMBERSHIP_TABLE', ''))
+
+def get_table_service():
+    return TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+# PartitionKey may not hold / \ # or ?, which an email address can
+def get_partition_key(email):
+    return urllib.parse.quote(email.strip().lower(), safe='@.+-_')
+
+def make_member_row(customer):
+    email = customer.get('email', None)
+    metadata = customer.get('metadata', None) or {}
+    if not email or not metadata.get('membership_type', None):
+        return None
+
+    return {
+        'PartitionKey': get_partition_key(email),
+        'RowKey': customer['id'],
+        'Email': email.lower(),
+        'MembershipType': metadata.get('membership_type', None),
+        'MembershipStart': metadata.get('membership_start', None),
+        'MembershipEnd': metadata.get('membership_end', None),
+        'MembershipRecurring': metadata.get('membership_recurring', None),
+        'Metadata': json.dumps(dict(metadata))
+    }
+
+def row_to_customer(row):
+    return {
+        'id': row['RowKey'],
+        'email': row['Email'],
+        'metadata': json.loads(row['Metadata'])
+    }
+
+def remove_customer(customer_id, email, table_service=None):
+    if not is_enabled() or not email:
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+    try:
+        table_service.delete_entity(os.environ['MEMBERSHIP_TABLE'], get_partition_key(email), customer_id)
+    except Exception: # was not a member
+        pass
+
+# previous_email is the address the customer had before an update, if it changed
+def update_customer(customer, previous_email=None, table_service=None):
+    if not is_enabled():
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+
+    if previous_email and previous_email.lower() != (customer.get('email', None) or '').lower():
+        remove_customer(customer['id'], previous_email, table_service)
+
+    row = make_member_row(customer)
+    if row:
+        table_service.insert_or_replace_entity(os.environ['MEMBERSHIP_TABLE'], entity=row)
+    else:
+        remove_customer(customer['id'], customer.get('email', None), table_service)
+
+# customers with membership metadata for an email, as {'id', 'email', 'metadata'} dicts
+def get_member_customers(email, table_service=None):
+    if not email:
+        return []
+
+    if not is_enabled():
+        customers = []
+        for customer in stripe.Customer.list(email=email, api_key=os.environ['STRIPE_SECRET']).auto_paging_iter():
+            metadata = customer.get('metadata', None)
+            if metadata and metadata.get('membership_type', None):
+                customers.append({ 'id': customer['id'], 'email': customer.get('email', None), 'metadata': metadata })
+        return customers
+
+    if not table_service:
+        table_service = get_table_service()
+    rows = table_service.query_entities(os.environ['MEMBERSHIP_TABLE'], filter=f"PartitionKey eq '{get_partition_key(email)}'")
+    return [row_to_customer(row) for row in rows]
+
+def parse_membership_date(datestr):
+    if not datestr:
+        return None
+
+    for fmt in ["%m/%d/%Y", "%Y-%m-%d", "%m/%d/%y"]:
+        try:
+            return datetime.strptime(datestr, fmt)
+        except ValueError:
+            pass
+
+    return None
+
+# the customer whose membership counts: lifetime wins, otherwise the latest membership_end
+def get_membership(email, table_service=None):
+    use_customer = None
+    use_end = None
+    for customer in get_member_customers(email, table_service):
+        metadata = customer['metadata']
+        if metadata.get('membership_type', None) == 'lifetime':
+            return customer
+
+        end = parse_membership_date(metadata.get('membership_end', None))
+        if end and (use_end is None or end > use_end):
+            use_customer = customer
+            use_end = end
+
+    return use_customer
+
+def is_current_member(email, table_service=None):
+    customer = get_membership(email, table_service)
+    if not customer:
+        return False
+
+    metadata = customer['metadata']
+    if metadata.get('membership_type', None) == 'lifetime':
+        return True
+
+    end = parse_membership_date(metadata.get('membership_end', None))
+    return end is not None and end >= datetime.today()
+
+def reconcile(table_service=None):
+    if not is_enabled():
+        logging.warn('MEMBERSHIP_TABLE is not configured, nothing to reconcile')
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['MEMBERSHIP_TABLE']
+    table_service.create_table(table_name) # no-op once it exists
+
+    existing = set()
+    for row in table_service.query_entities(table_name, select='PartitionKey,RowKey'):
+        existing.add((row['PartitionKey'], row['RowKey']))
+
+    current = set()
+    updated = 0
+    customers = stripe.Customer.search(query=MEMBER_SEARCH, limit=100, api_key=os.environ['STRIPE_SECRET'], stripe_version="2020-08-27")
+    for customer in customers.auto_paging_iter():
+        row = make_member_row(customer)
+        if row:
+            table_service.insert_or_replace_entity(table_name, entity=row)
+            current.add((row['PartitionKey'], row['RowKey']))
+            updated = updated + 1
+
+    removed = 0
+    for partition_key, row_key in existing - current:
+        table_service.delete_entity(table_name, partition_key, row_key)
+        removed = removed + 1
+
+    logging.info(f"Membership index: {updated} member customers indexed, {removed} stale rows removed")
@@ -1,8 +1,8 @@
-import requests
 import io
 import base64
 import os
 import json
+from .httpsession import get_session
 
 class OWASPYM():
     base_url = os.environ['YM_APIENDPOINT']
@@ -64,7 +64,7 @@ class OWASPYM():
             'Password': os.environ['YM_APIPW']            
         }
 
-        r = requests.post(url = url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url = url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             content = json.loads(r.content)
             self.session_id = content['SessionId']
@@ -75,7 +75,7 @@ class OWASPYM():
     def GetGroups(self):
         content = []
         url = self.base_url + self.group_url.replace(':ClientID', os.environ['YM_CLIENTID'])
-        r = requests.get(url = url, headers=self.GetHeaders())
+        r = get_session().get(url = url, headers=self.GetHeaders())
         if r.ok:
             content = json.loads(r.content)
         
@@ -84,7 +84,7 @@ class OWASPYM():
     def GetGroupTypes(self):
         content = []
         url = self.base_url + self.grouptype_url.replace(':ClientID', os.environ['YM_CLIENTID'])
-        r = requests.get(url = url, headers=self.GetHeaders())
+        r = get_session().get(url = url, headers=self.GetHeaders())
         if r.ok:
             content = json.loads(r.content)
         
@@ -114,7 +114,7 @@ class OWASPYM():
             'EmailOptionsMember': self.GROUP_EMAIL_MEMBER_AUTOAPPROVE
         }
 
-        r = requests.post(url = url, headers=self.GetHeaders(), data=json.dumps(data))
+        r = get_session().post(url = url, headers=self.GetHeaders(), data=json.dumps(data))
         if r.ok:
             content = json.loads(r.content)
         elif r.content is not None:
@@ -1,6 +1,6 @@
 import os
 import io
-import requests
+from .httpsession import get_session
 
 class OWASPZoom:
     base_url = 'https://api.zoom.us/v2/'
@@ -16,7 +16,7 @@ class OWASPZoom:
     def GetUser(self, user_id = None):
         if user_id == None:
             user_id = 'me'
-        r = requests.get(self.base_url + self.user_url + user_id, headers=self.GetHeaders())
+        r = get_session().get(self.base_url + self.user_url + user_id, headers=self.GetHeaders())
         if r.ok:
             return r.text
         else:
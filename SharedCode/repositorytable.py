@@ -0,0 +1,152 @@
+import os
+import json
+import logging
+from azure.common import AzureMissingResourceHttpError
+from azure.cosmosdb.table.tableservice import TableService
+from azure.cosmosdb.table.tablebatch import TableBatch
+
+# Access to the REPOSITORY_TABLE that holds one row per www- repository.
+# Repo is the json of the dict GetPublicRepositories builds and PushedAt is the GitHub pushed_at
+# the row was harvested at, which lets incremental builds skip repos nobody has pushed to.
+# Rows are partitioned by repo type (chapter, project, committee, event) so a reader that only
+# wants chapters queries one partition, and a harvest only writes the rows that changed, in
+# entity group transactions of up to BATCH_SIZE, while readers keep seeing the previous rows.
+
+PARTITION_KEYS = { 'www-chapter-': 'chapter', 'www-project-': 'project', 'www-committee-': 'committee', 'www-revent-': 'event' }
+OTHER_PARTITION_KEY = 'other'
+LEGACY_PARTITION_KEY = 'ghrepos' # everything lived here before the table was partitioned
+BATCH_SIZE = 100
+
+def get_table_service():
+    return TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+def get_partition_key(repo_name):
+    for prefix, partition_key in PARTITION_KEYS.items():
+        if repo_name.startswith(prefix):
+            return partition_key
+
+    return OTHER_PARTITION_KEY
+
+# group_types limits the query to those partitions, e.g. ['chapter'] or ['committee', 'event']
+def get_repository_entries(table_service=None, group_types=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    filter = None
+    if group_types:
+        filter = ' or '.join([f"PartitionKey eq '{group_type}'" for group_type in group_types])
+
+    entries = {}
+    results = table_service.query_entities(os.environ['REPOSITORY_TABLE'], filter=filter)
+    for result in results:
+        repo = json.loads(result['Repo'])
+        entries[repo['name']] = {
+            'repo': repo,
+            'pushed_at': result.get('PushedAt', None),
+            'partition': result['PartitionKey']
+        }
+
+    return entries
+
+def get_repos(table_service=None, group_types=None):
+    entries = get_repository_entries(table_service, group_types)
+    return [entry['repo'] for entry in entries.values()]
+
+def make_repository_row(entry):
+    return {
+        'PartitionKey': get_partition_key(entry['repo']['name']),
+        'RowKey': entry['repo']['name'],
+        'Repo': json.dumps(entry['repo']),
+        'PushedAt': entry['pushed_at']
+    }
+
+def is_unchanged(row, known):
+    if not known or known.get('partition', None) != row['PartitionKey']:
+        return False
+
+    return known['pushed_at'] == row['PushedAt'] and json.dumps(known['repo']) == row['Repo']
+
+# one entity group transaction per BATCH_SIZE operations of a partition,
+# operations are ('upsert', row) or ('delete', (partition_key, row_key))
+def commit_operations(table_service, table_name, operations):
+    partitions = {}
+    for op, value in operations:
+        partition_key = value['PartitionKey'] if op == 'upsert' else value[0]
+        partitions.setdefault(partition_key, []).append((op, value))
+
+    for partition_ops in partitions.values():
+        for start in range(0, len(partition_ops), BATCH_SIZE):
+            batch = TableBatch()
+            for op, value in partition_ops[start:start + BATCH_SIZE]:
+                if op == 'upsert':
+                    batch.insert_or_replace_entity(value)
+                else:
+                    batch.delete_entity(value[0], value[1])
+            table_service.commit_batch(table_name, batch)
+
+# writes the rows that changed since the previous harvest and removes repos that no longer show up
+def save_repository_entries(entries, previous, table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    table_name = os.environ['REPOSITORY_TABLE']
+    table_service.create_table(table_name) # no-op once it exists
+
+    operations = []
+    current = set()
+    for entry in entries:
+        row = make_repository_row(entry)
+        current.add((row['PartitionKey'], row['RowKey']))
+        if not is_unchanged(row, previous.get(row['RowKey'], None)):
+            operations.append(('upsert', row))
+    updated = len(operations)
+
+    # a repo whose row moved partition (or is still in the legacy one) leaves its old row behind
+    for name, known in previous.items():
+        partition_key = known.get('partition', LEGACY_PARTITION_KEY)
+        if (partition_key, name) not in current:
+            operations.append(('delete', (partition_key, name)))
+    removed = len(operations) - updated
+
+    commit_operations(table_service, table_name, operations)
+
+    logging.info(f"Repository table: {updated} updated, {removed} removed, {len(entries) - updated} unchanged")
+    return updated, removed
+
+# one repository's row as it is stored, None when there is none
+def get_repository_row(repo_name, table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    try:
+        return table_service.get_entity(os.environ['REPOSITORY_TABLE'], get_partition_key(repo_name), repo_name)
+    except AzureMissingResourceHttpError:
+        return None
+
+# True when the repository as the site sees it differs from its row (not just its pushed_at);
+# entry None means the repository is gone
+def is_entry_changed(entry, known):
+    if entry is None:
+        return known is not None
+
+    return not known or known['Repo'] != make_repository_row(entry)['Repo']
+
+# one repository's row, as a push to it is harvested; entry None removes the row.
+# known is the row get_repository_row read before
+def save_repository_entry(repo_name, entry, known, table_service=None):
+    if not table_service:
+        table_service = get_table_service()
+
+    table_name = os.environ['REPOSITORY_TABLE']
+    if entry is None:
+        if known:
+            table_service.delete_entity(table_name, known['PartitionKey'], repo_name)
+            logging.info(f"Repository table: removed {repo_name}")
+        return
+
+    row = make_repository_row(entry)
+    if known and known['Repo'] == row['Repo'] and known.get('PushedAt', None) == row['PushedAt']:
+        return
+
+    table_service.insert_or_replace_entity(table_name, row)
+    logging.info(f"Repository table: updated {repo_name}")
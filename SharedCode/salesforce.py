@@ -6,6 +6,7 @@ import os
 import logging
 import datetime
 import locale
+from .httpsession import get_session
 
 class OWASPSalesforce:
     sf_consumer_key = os.environ["SF_CONSUMER_KEY"]
@@ -46,7 +47,7 @@ class OWASPSalesforce:
                     username=self.sf_user_name,
                     password=self.sf_user_pw + self.sf_user_security_token)
 
-        r = requests.post(url = self.sf_login_url, data=data)
+        r = get_session().post(url = self.sf_login_url, data=data)
         if r.ok:
             resObj = r.json()
             self.sf_token_id = resObj["access_token"]
@@ -57,13 +58,13 @@ class OWASPSalesforce:
         
         headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
         params = {"q":queryString}
-        r = requests.get(url=self.sf_query_url, headers=headers, params=params)
+        r = get_session().get(url=self.sf_query_url, headers=headers, params=params)
         records = {}
         if r.ok:
             resObj = r.json()
             records = resObj["records"]
             while not resObj["done"]:
-                r = requests.get(url=self.sf_instance_url + "/" + resObj["nextRecordsUrl"])
+                r = get_session().get(url=self.sf_instance_url + "/" + resObj["nextRecordsUrl"])
                 resObj = r.json()
                 records.update(resObj["records"])
        
@@ -140,7 +141,7 @@ class OWASPSalesforce:
             jsonContact = '{ "FirstName":"' + firstname + '", "LastName":"' + lastname + '", "Email":"' + contactEmail + '", "AccountId":"' + accountId + '" }'
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_contact_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonContact)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonContact)
             if not r.ok:
                 logging.error(r.text)
 
@@ -153,7 +154,7 @@ class OWASPSalesforce:
             jsonAccount = '{ "Name":"' + accountName + '"}'
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_account_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonAccount)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonAccount)
             if not r.ok:
                 logging.error(r.text)
 
@@ -166,7 +167,7 @@ class OWASPSalesforce:
             jsonSubscription = '{ "OrderApi__Account__c":"' + account + '", "OrderApi__Contact__c":"' + contact + '", "OrderApi__Item__c":"' + mtype + '", "OrderApi__Subscription_Plan__c":"' + plan + '" }'
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_subscription_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonSubscription)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonSubscription)
             if not r.ok:
                 logging.error(r.text)
 
@@ -186,7 +187,7 @@ class OWASPSalesforce:
 
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_sales_order_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(r.text)
 
@@ -204,7 +205,7 @@ class OWASPSalesforce:
 
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_sales_order_url + f'/{sorder_id}'
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.patch(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().patch(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(r.text)
 
@@ -227,7 +228,7 @@ class OWASPSalesforce:
 
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_sales_order_line_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(r.text)
 
@@ -251,7 +252,7 @@ class OWASPSalesforce:
 
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_receipt_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(f'Failed to create receipt: {r.text}')
             else:
@@ -265,7 +266,7 @@ class OWASPSalesforce:
 
                 obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_receipt_line_url
                 headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-                r = requests.post(url=obj_url, headers=headers, data=jsonString)
+                r = get_session().post(url=obj_url, headers=headers, data=jsonString)
                 if not r.ok:
                     logging.error(f'Failed to create receipt: {r.text}')
 
@@ -288,7 +289,7 @@ class OWASPSalesforce:
             jsonString = json.dumps(jsonBadge)
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_badge_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(r.text)
 
@@ -308,13 +309,13 @@ class OWASPSalesforce:
             cgmem_id = records[0]['Id']
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_member_url + '/' + cgmem_id
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.get(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().get(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(f"Failed to create community group member: {r.text}")
         else:
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_member_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(f"Failed to create community group member: {r.text}")
 
@@ -330,7 +331,7 @@ class OWASPSalesforce:
             # need to query chapter record from API....
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_url + '/' + ch_id
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.get(url=obj_url, headers=headers)
+            r = get_session().get(url=obj_url, headers=headers)
             if not r.ok:
                 logging.error(r.text)
 
@@ -348,7 +349,7 @@ class OWASPSalesforce:
             
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(r.text)
 
@@ -394,7 +395,7 @@ class OWASPSalesforce:
             # need to query chapter record from API....
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_url + '/' + ch_id
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.get(url=obj_url, headers=headers)
+            r = get_session().get(url=obj_url, headers=headers)
             if not r.ok:
                 logging.error(r.text)
 
@@ -415,7 +416,7 @@ class OWASPSalesforce:
 
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_url
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.post(url=obj_url, headers=headers, data=jsonString)
+            r = get_session().post(url=obj_url, headers=headers, data=jsonString)
             if not r.ok:
                 logging.error(r.text)
 
@@ -552,7 +553,7 @@ class OWASPSalesforce:
             # need to query chapter record from API....
             obj_url =    self.sf_instance_url + self.sf_api_url + self.sf_community_group_url + '/' + ch_id
             headers = {"Content-Type":"application/json", "Authorization":"Bearer " + self.sf_token_id, "X-PrettyPrint":"1" }
-            r = requests.get(url=obj_url, headers=headers)
+            r = get_session().get(url=obj_url, headers=headers)
             if not r.ok:
                 logging.error(r.text)
 
@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import time
+import threading
+import gspread
+from googleapiclient.discovery import build
+from oauth2client.service_account import ServiceAccountCredentials
+
+# Google Sheets access shared by the report and event registrant writers.
+# The service account is authorized once per worker and re-logged in when its token expires,
+# worksheets are kept open by name with their header row, and SheetWriter keeps an index of
+# column value -> row numbers so finding an order or charge costs one column read at most.
+# Rows go out in one append_rows and cell changes in one batch_update.
+
+SCOPE = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
+INDEX_TTL = int(os.environ.get('SHEETS_INDEX_TTL', '300'))
+
+_lock = threading.Lock()
+_creds = None
+_client = None
+_drive = None
+_writers = {}
+
+def get_credentials():
+    global _creds
+    with _lock:
+        if _creds is None:
+            client_secret = json.loads(os.environ['GOOGLE_CREDENTIALS'], strict=False)
+            _creds = ServiceAccountCredentials.from_json_keyfile_dict(client_secret, SCOPE)
+
+    return _creds
+
+def get_client():
+    global _client
+    creds = get_credentials()
+    with _lock:
+        if _client is None:
+            _client = gspread.authorize(creds)
+        elif creds.access_token_expired:
+            _client.login()
+
+    return _client
+
+def get_drive():
+    global _drive
+    creds = get_credentials()
+    with _lock:
+        if _drive is None:
+            _drive = build('drive', 'v3', credentials=creds, cache_discovery=False)
+
+    return _drive
+
+def create_spreadsheet(sheet_name, parents, row_headers):
+    file_metadata = {
+        'name': sheet_name,
+        'parents': parents,
+        'mimeType': 'application/vnd.google-apps.spreadsheet',
+    }
+    rfile = get_drive().files().create(body=file_metadata, supportsAllDrives=True).execute()
+
+    sheet = get_client().open(sheet_name).sheet1
+    sheet.append_row(row_headers)
+    with _lock:
+        _writers[sheet_name] = SheetWriter(sheet, row_headers)
+
+    return rfile.get('id'), sheet
+
+def get_writer(sheet_name):
+    with _lock:
+        writer = _writers.get(sheet_name, None)
+    if writer is None:
+        writer = SheetWriter(get_client().open(sheet_name).sheet1)
+        with _lock:
+            _writers[sheet_name] = writer
+
+    return writer
+
+def get_column_letter(column):
+    letters = ''
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(65 + remainder) + letters
+
+    return letters
+
+class SheetWriter:
+    def __init__(self, sheet, headers=None):
+        self.sheet = sheet
+        self.headers = headers
+        self.lock = threading.Lock()
+        self.indexes = {}
+
+    def GetHeaders(self):
+        if self.headers is None:
+            self.headers = self.sheet.row_values(1)
+
+        return self.headers
+
+    def GetColumn(self, column_name):
+        return self.GetHeaders().index(column_name) + 1
+
+    def BuildIndex(self, column_name):
+        values = self.sheet.col_values(self.GetColumn(column_name))
+        index = {}
+        for row, value in enumerate(values, start=1):
+            if row > 1 and value:
+                index.setdefault(str(value), []).append(row)
+        self.indexes[column_name] = { 'rows': index, 'built': time.time() }
+        return index
+
+    # Row numbers holding value in column_name. Another worker may have added rows since the index
+    # was read, so a miss or an old index reads the column again before answering.
+    def FindRows(self, column_name, value):
+        with self.lock:
+            entry = self.indexes.get(column_name, None)
+            if entry is not None and time.time() - entry['built'] < INDEX_TTL:
+                rows = entry['rows'].get(str(value), [])
+                if rows:
+                    return list(rows)
+
+            return list(self.BuildIndex(column_name).get(str(value), []))
+
+    def MakeRow(self, values):
+        headers = self.GetHeaders()
+        row = [''] * len(headers)
+        for column_name, value in values.items():
+            row[headers.index(column_name)] = value
+
+        return row
+
+    def AppendRows(self, rows):
+        if len(rows) == 0:
+            return
+
+        with self.lock:
+            result = self.sheet.append_rows(rows, table_range='A1')
+            updated = result.get('updates', {}).get('updatedRange', '') if result else ''
+            match = re.search(r'![A-Z]+(\d+)', updated)
+            if not match:
+                self.indexes = {} # can't tell where they landed, read again next time
+                return
+
+            first_row = int(match.group(1))
+            headers = self.GetHeaders()
+            for column_name, entry in self.indexes.items():
+                column = headers.index(column_name)
+                for offset, row in enumerate(rows):
+                    if column < len(row) and row[column]:
+                        entry['rows'].setdefault(str(row[column]), []).append(first_row + offset)
+
+    def UpdateCells(self, row_numbers, column_name, value):
+        if len(row_numbers) == 0:
+            return
+
+        column = get_column_letter(self.GetColumn(column_name))
+        data = [{ 'range': f"{column}{row}", 'values': [[value]] } for row in row_numbers]
+        self.sheet.batch_update(data)
@@ -0,0 +1,113 @@
+import os
+import threading
+import contextvars
+from contextlib import contextmanager
+from cachetools import TTLCache
+import stripe
+
+# Read-through cache for the Stripe catalog objects events are sold from: products, SKUs and coupons.
+# Objects are kept per worker process for STRIPE_CATALOG_TTL seconds and, inside request_scope(),
+# for the rest of the request so a checkout sees one consistent copy of each. get_skus() lists
+# every SKU of the event with one SKU.list once it knows the product, instead of a retrieve per SKU.
+# StripeWebhookProcessor invalidates objects as their product/sku/coupon events come in.
+# Anything about to be modified (inventory, coupon uses) should still be read from Stripe directly.
+
+PRODUCT = 'product'
+SKU = 'sku'
+COUPON = 'coupon'
+
+TTL = int(os.environ.get('STRIPE_CATALOG_TTL', '60'))
+CACHE_SIZE = int(os.environ.get('STRIPE_CATALOG_CACHE_SIZE', '1024'))
+
+_lock = threading.Lock()
+_entries = TTLCache(maxsize=CACHE_SIZE, ttl=TTL) if TTL > 0 else None
+_scope = contextvars.ContextVar('stripe_catalog_scope', default=None)
+
+@contextmanager
+def request_scope():
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+def get_cached(kind, object_id):
+    scope = _scope.get()
+    if scope is not None and (kind, object_id) in scope:
+        return scope[(kind, object_id)]
+    if _entries is None:
+        return None
+    with _lock:
+        obj = _entries.get((kind, object_id), None)
+    if obj is not None and scope is not None:
+        scope[(kind, object_id)] = obj
+
+    return obj
+
+def set_cached(kind, object_id, obj):
+    scope = _scope.get()
+    if scope is not None:
+        scope[(kind, object_id)] = obj
+    if _entries is not None:
+        with _lock:
+            _entries[(kind, object_id)] = obj
+
+def invalidate(kind, object_id):
+    scope = _scope.get()
+    if scope is not None:
+        scope.pop((kind, object_id), None)
+    if _entries is not None:
+        with _lock:
+            _entries.pop((kind, object_id), None)
+
+# invalidates whatever a product.*, sku.* or coupon.* webhook event is about
+def invalidate_for_event(event_type, event_data):
+    kind = event_type.split('.')[0]
+    if kind in [PRODUCT, SKU, COUPON] and event_data.get('id', None):
+        invalidate(kind, event_data['id'])
+
+def retrieve(kind, object_id):
+    if kind == PRODUCT:
+        return stripe.Product.retrieve(object_id, api_key=os.environ['STRIPE_SECRET'])
+    if kind == SKU:
+        return stripe.SKU.retrieve(object_id, api_key=os.environ['STRIPE_SECRET'])
+
+    return stripe.Coupon.retrieve(object_id, api_key=os.environ['STRIPE_SECRET'])
+
+def get(kind, object_id):
+    obj = get_cached(kind, object_id)
+    if obj is None:
+        obj = retrieve(kind, object_id)
+        set_cached(kind, object_id, obj)
+
+    return obj
+
+def get_product(product_id):
+    return get(PRODUCT, product_id)
+
+def get_sku(sku_id):
+    return get(SKU, sku_id)
+
+def get_coupon(coupon_id):
+    return get(COUPON, coupon_id)
+
+def prefetch_skus(product_id):
+    skus = stripe.SKU.list(product=product_id, limit=100, api_key=os.environ['STRIPE_SECRET'])
+    for sku in skus.auto_paging_iter():
+        set_cached(SKU, sku['id'], sku)
+
+# the SKUs for sku_ids in order; one retrieve for the first, one listing for the rest of its product
+def get_skus(sku_ids):
+    skus = []
+    prefetched = False
+    for sku_id in sku_ids:
+        sku = get_cached(SKU, sku_id)
+        if sku is None and skus and not prefetched:
+            prefetch_skus(skus[0]['product'])
+            prefetched = True
+            sku = get_cached(SKU, sku_id)
+        if sku is None:
+            sku = get_sku(sku_id)
+        skus.append(sku)
+
+    return skus
@@ -0,0 +1,105 @@
+import os
+import time
+import logging
+from azure.common import AzureConflictHttpError, AzureHttpError, AzureMissingResourceHttpError
+from azure.cosmosdb.table.tableservice import TableService
+
+# Idempotency ledger for Stripe webhook events, one row per Stripe event id in STRIPE_EVENT_TABLE.
+# StripeWebhookProcessor records an event before queueing it and drops deliveries of events already
+# processed or being processed; a delivery of an event still only queued is queued again, the
+# worker dedups. StripeQueueWorker claims the row before processing (Status queued -> processing
+# -> done, failed when it raised) so a message the queue hands out twice runs once.
+# A processing claim older than STRIPE_EVENT_LEASE seconds is taken to be a worker that died.
+# Without STRIPE_EVENT_TABLE configured every delivery is queued and processed.
+
+QUEUED = 'queued'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+ROW_KEY = 'event'
+LEASE = int(os.environ.get('STRIPE_EVENT_LEASE', '600'))
+
+def is_enabled():
+    return bool(os.environ.get('STRIPE_EVENT_TABLE', ''))
+
+def get_table_service():
+    return TableService(account_name=os.environ['STORAGE_ACCOUNT'], account_key=os.environ['STORAGE_KEY'])
+
+def is_claimed(row):
+    status = row.get('Status', QUEUED)
+    if status == DONE:
+        return True
+
+    return status == PROCESSING and time.time() - row.get('Claimed', 0) < LEASE
+
+# True when the event should be queued, False for a replay of one already handled
+def record_event(event_id, event_type, table_service=None):
+    if not is_enabled() or not event_id:
+        return True
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['STRIPE_EVENT_TABLE']
+    try:
+        table_service.insert_entity(table_name, { 'PartitionKey': event_id, 'RowKey': ROW_KEY, 'EventType': event_type, 'Status': QUEUED, 'Received': time.time() })
+        return True
+    except AzureConflictHttpError:
+        pass
+
+    try:
+        row = table_service.get_entity(table_name, event_id, ROW_KEY)
+    except AzureMissingResourceHttpError:
+        return True
+
+    return not is_claimed(row)
+
+# True when this worker now owns processing the event
+def claim_event(event_id, table_service=None):
+    if not is_enabled() or not event_id:
+        return True
+
+    if not table_service:
+        table_service = get_table_service()
+    table_name = os.environ['STRIPE_EVENT_TABLE']
+    try:
+        row = table_service.get_entity(table_name, event_id, ROW_KEY)
+    except AzureMissingResourceHttpError:
+        row = None
+
+    if row is not None and is_claimed(row):
+        return False
+
+    claim = { 'PartitionKey': event_id, 'RowKey': ROW_KEY, 'Status': PROCESSING, 'Claimed': time.time(), 'Attempts': (row.get('Attempts', 0) if row else 0) + 1 }
+    try:
+        if row is None:
+            table_service.insert_entity(table_name, claim)
+        else:
+            table_service.merge_entity(table_name, claim, if_match=row['etag'])
+    except AzureConflictHttpError: # another worker inserted it first
+        return False
+    except AzureHttpError as err:
+        if err.status_code == 412: # or updated it first
+            return False
+        raise
+
+    return True
+
+def set_status(event_id, status, error=None, table_service=None):
+    if not is_enabled() or not event_id:
+        return
+
+    if not table_service:
+        table_service = get_table_service()
+    row = { 'PartitionKey': event_id, 'RowKey': ROW_KEY, 'Status': status }
+    if error is not None:
+        row['Error'] = str(error)[:1024]
+    try:
+        table_service.merge_entity(os.environ['STRIPE_EVENT_TABLE'], row)
+    except Exception as err:
+        logging.error(f"Could not mark Stripe event {event_id} {status}: {err}")
+
+def complete_event(event_id, table_service=None):
+    set_status(event_id, DONE, table_service=table_service)
+
+def fail_event(event_id, error, table_service=None):
+    set_status(event_id, FAILED, error, table_service)
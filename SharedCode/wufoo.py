@@ -1,9 +1,9 @@
-import requests
 import json
 import base64
 from pathlib import Path
 import os
 import logging
+from .httpsession import get_session
 
 class OWASPWufoo:
     apitoken = os.environ["WF_APIKEY"]
@@ -44,7 +44,7 @@ class OWASPWufoo:
         headers = { 'Authorization': f'Basic { auth }' }
         url = f'{self.baseurl}{form}/entries.json?system=1&Filter1={fieldid}+{operator}+{param}'
         result = ''
-        r = requests.get(url, headers=headers)
+        r = get_session().get(url, headers=headers)
         if r.status_code == 200:
             jsonEntries = json.loads(r.text)
             if len(jsonEntries) > 0: 
@@ -63,7 +63,7 @@ class OWASPWufoo:
         result = ''
         transactionId = None
         merchantType = None
-        r = requests.get(url, headers=headers)
+        r = get_session().get(url, headers=headers)
         if r.status_code == 200:
             jsonEntries = json.loads(r.text)
             if len(jsonEntries['Entries']) > 0: # There should be only one entry with the same email and datecreated but these idiots do not support is equal to for date...
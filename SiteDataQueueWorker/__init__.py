@@ -0,0 +1,40 @@
+import logging
+import json
+
+import azure.functions as func
+
+from ..SharedCode import github
+from ..SharedCode import repositorytable
+from ..BuildSiteFiles import get_affected_outputs, patch_site_data
+
+# Handles the pushes GitHubPushWebhook queues: harvests the pushed repository again, saves its
+# REPOSITORY_TABLE row and rewrites just its entries in the site data files it appears in.
+
+def main(msg: func.QueueMessage) -> None:
+    payload = json.loads(msg.get_body().decode('utf-8'))
+    repo_name = payload['repo']
+    paths = payload.get('paths', [])
+    logging.info(f"SiteDataQueueWorker: push to {repo_name} ({payload.get('delivery', None)}) touching {len(paths) if paths is not None else 'unlisted'} paths")
+
+    # entry stays None (row and site entries removed) only when GitHub says the repository or its
+    # index.md is gone; any other failure raises so the queue retries the message
+    gh = github.OWASPGitHub()
+    r = gh.RepoExists(repo_name)
+    entry = None
+    if r.ok:
+        repo = json.loads(r.text)
+        if not repo['private'] and not repo.get('is_template', False):
+            entry = gh.HarvestRepositoryEntry(repo)
+    elif r.status_code != 404:
+        raise Exception(f"Could not read repository {repo_name}: {r.text}")
+
+    # the row is only saved once the site data is patched, a retried message still sees the change
+    known = repositorytable.get_repository_row(repo_name)
+    outputs = get_affected_outputs(repo_name, repositorytable.is_entry_changed(entry, known), paths)
+    if len(outputs) > 0:
+        logging.info(f"Updating {', '.join(outputs)} for {repo_name}")
+        patch_site_data(gh, repo_name, entry['repo'] if entry else None, outputs)
+    else:
+        logging.info(f"Nothing on the site changed for {repo_name}")
+
+    repositorytable.save_repository_entry(repo_name, entry, known)
@@ -5,16 +5,23 @@ import stripe
 import hashlib
 import html
 import base64
+import markdown
 from datetime import datetime
 from datetime import timedelta
 from typing import Dict
 import azure.functions as func
 
 from ..SharedCode.eventbot import registrant
+from ..SharedCode.eventbot import products_file
 from ..SharedCode.copper import OWASPCopper
 from ..SharedCode.googleapi import OWASPGoogle
 from ..SharedCode import helperfuncs
 from ..SharedCode import github
+from ..SharedCode import membershipindex
+from ..SharedCode import memberrollup
+from ..SharedCode import stripeledger
+from ..SharedCode import stripecatalog
+from ..SharedCode import inventory
 
 from mailchimp3 import MailChimp
 from mailchimp3.mailchimpclient import MailChimpError
@@ -24,11 +31,48 @@ mailchimp = MailChimp(mc_api=os.environ["MAILCHIMP_API_KEY"])
 def main(msg: func.QueueMessage) -> None:
     payload = json.loads(msg.get_body().decode('utf-8'))
 
+    # the queue may deliver a message more than once, the ledger lets one delivery run it
+    event_id = payload.get('event_id', None)
+    if not stripeledger.claim_event(event_id):
+        logging.info(f"Stripe event {event_id} already processed or in progress, skipping")
+        return
+
+    try:
+        with stripecatalog.request_scope():
+            process_job(payload)
+    except Exception as err:
+        stripeledger.fail_event(event_id, err)
+        raise # leave it to the queue to retry
+
+    stripeledger.complete_event(event_id)
+
+
+def process_job(payload):
     job_type = payload.get('job_type', None)
     job_payload =  payload.get('payload', {})
     logging.info(job_payload)
 
-    if job_type == 'order.created':
+    if job_type == 'product.created':
+        handle_product_created(job_payload)
+    elif job_type == products_file.FLUSH_JOB:
+        products_file.flush(payload['repo_name'])
+    elif job_type == 'sku.created':
+        handle_sku_created(job_payload)
+    elif job_type == 'sku.updated':
+        inventory.apply_stripe_update(inventory.SKU, job_payload['id'], job_payload.get('metadata', None))
+        handle_sku_updated(job_payload)
+    elif job_type == 'coupon.updated':
+        inventory.apply_stripe_update(inventory.COUPON, job_payload['id'], job_payload.get('metadata', None))
+    elif job_type == 'checkout.session.expired':
+        handle_checkout_session_expired(job_payload)
+    elif job_type == 'customer.created' or job_type == 'customer.updated':
+        previous = payload.get('previous_attributes', None) or {}
+        membershipindex.update_customer(job_payload, previous.get('email', None))
+        memberrollup.apply_customer_event(job_type, job_payload, previous)
+    elif job_type == 'customer.deleted':
+        membershipindex.remove_customer(job_payload['id'], job_payload.get('email', None))
+        memberrollup.apply_customer_event(job_type, job_payload)
+    elif job_type == 'order.created':
         logging.info('Order Created')
         handle_order_created(job_payload.get('id'))
     elif job_type == 'checkout.session.completed':
@@ -64,37 +108,54 @@ def update_product_inventory(order):
         if item['type'] != 'sku':
             continue
 
+        if inventory.is_enabled():
+            if not inventory.adjust(inventory.SKU, item['parent'], -1):
+                logging.warn(f"Order {order['id']} took {item['parent']} past its inventory")
+            continue
+
         sku = stripe.SKU.retrieve(item['parent'], api_key=os.environ['STRIPE_SECRET'])
-        inventory = sku['metadata'].get('inventory', None)
+        stock = sku['metadata'].get('inventory', None)
 
-        if inventory is None or int(inventory) == 0:
+        if stock is None or int(stock) == 0:
             continue
 
-        inventory = int(inventory) - 1
-        stripe.SKU.modify(sku['id'], metadata={'inventory': inventory}, api_key=os.environ['STRIPE_SECRET'])
+        stock = int(stock) - 1
+        stripe.SKU.modify(sku['id'], metadata={'inventory': stock}, api_key=os.environ['STRIPE_SECRET'])
+        stripecatalog.invalidate(stripecatalog.SKU, sku['id'])
 
 
 def update_discount_code_inventory(order):
     discount_code = order.get('metadata', {}).get('discount_code', None)
 
-    if discount_code is not None:
+    if discount_code is not None and inventory.is_enabled():
+        inventory.adjust(inventory.COUPON, discount_code.strip().upper(), -1)
+    elif discount_code is not None:
         discount_code = discount_code.strip().upper()
         coupon = stripe.Coupon.retrieve(discount_code, api_key=os.environ['STRIPE_SECRET'])
-        inventory = coupon['metadata'].get('inventory', None)
+        stock = coupon['metadata'].get('inventory', None)
 
-        if inventory is not None and int(inventory) != 0:
-            inventory = int(inventory) - 1
-            stripe.Coupon.modify(discount_code, metadata={'inventory': inventory}, api_key=os.environ['STRIPE_SECRET'])
+        if stock is not None and int(stock) != 0:
+            stock = int(stock) - 1
+            stripe.Coupon.modify(discount_code, metadata={'inventory': stock}, api_key=os.environ['STRIPE_SECRET'])
+            stripecatalog.invalidate(stripecatalog.COUPON, discount_code)
 
 
 def handle_order_created(order_id):
     order = stripe.Order.retrieve(order_id, api_key=os.environ['STRIPE_SECRET'])
 
-    update_product_inventory(order)
-    update_discount_code_inventory(order)
+    if order.get('metadata', {}).get('inventory_reserved', None) != 'True': # otherwise held at checkout
+        update_product_inventory(order)
+        update_discount_code_inventory(order)
     registrant.add_order(order)
 
 
+def handle_checkout_session_expired(session):
+    metadata = session.get('metadata', None) or {}
+    if metadata.get('inventory_reserved', None) == 'True':
+        skus = [sku for sku in metadata.get('skus', '').split('|') if sku]
+        inventory.release_order(skus, metadata.get('discount_code', None) or None)
+
+
 def handle_order_refunded(charge_id, amount_refunded):
     registrant.add_refund(charge_id, amount_refunded)
 
@@ -388,10 +449,7 @@ def add_event_registrant_to_mailing_list(email, metadata):
         request_data
     )
 
-    product = stripe.Product.retrieve(
-        metadata.get('event_id'),
-        api_key=os.environ["STRIPE_SECRET"]
-    )
+    product = stripecatalog.get_product(metadata.get('event_id'))
 
     event_date = product['metadata'].get('event_date', None)
     if event_date is None:
@@ -541,11 +599,7 @@ def create_order_from_payment_intent(payment_intent):
     order_total = 0
     order_items = []
 
-    for sku in skus:
-        stripe_sku = stripe.SKU.retrieve(
-            sku,
-            api_key=os.environ["STRIPE_SECRET"]
-        )
+    for sku, stripe_sku in zip(skus, stripecatalog.get_skus(skus)):
         order_total += stripe_sku.get('price', 0)
         order_items.append({
             "amount": stripe_sku.get('price', 0),
@@ -581,6 +635,10 @@ def create_order_from_payment_intent(payment_intent):
 
 
 def increment_discount_code(discount_code):
+    if inventory.is_enabled():
+        inventory.add_use(discount_code)
+        return
+
     try:
         discount_code = discount_code.strip().upper()
         coupon = stripe.Coupon.retrieve(
@@ -594,6 +652,7 @@ def increment_discount_code(discount_code):
             metadata={"uses": uses},
             api_key=os.environ["STRIPE_SECRET"]
         )
+        stripecatalog.invalidate(stripecatalog.COUPON, discount_code)
     except Exception as exception:
         pass
 
@@ -604,3 +663,70 @@ def get_customer_email_from_id(customer_id):
         api_key=os.environ["STRIPE_SECRET"]
     )
     return customer.email
+
+
+def handle_product_created(event_data):
+    metadata = event_data.get('metadata', {})
+
+    if metadata.get('type', None) == 'event':
+        product_file = '_data/products.json'
+        repo_name = metadata.get('repo_name', None)
+        event_name = event_data.get('name', None)
+
+        gh = github.OWASPGitHub()
+        existing_file = gh.GetFile(repo_name, product_file)
+
+        sha = ''
+
+        if gh.TestResultCode(existing_file.status_code):
+            products = json.loads(existing_file.text)
+            sha = products['sha']
+
+        product_listing = {
+            'id': event_data.get('id', None),
+            'name': event_name,
+            'currency': metadata.get('currency', 'usd'),
+            'products': []
+        }
+
+        file_contents = json.dumps(product_listing)
+        gh.UpdateFile(repo_name, product_file, file_contents, sha)
+
+        registrant.create_spreadsheet(event_data)
+
+
+def handle_sku_updated(event_data):
+    product = stripecatalog.get_product(event_data.get('product', None))
+    product_metadata = product.get('metadata', {})
+
+    if product_metadata.get('type', None) == 'event':
+        repo_name = product_metadata.get('repo_name', None)
+
+        if event_data['active'] is False:
+            products_file.add_change(repo_name, 'delete', { 'id': event_data['id'] })
+        else:
+            event_data['metadata']['description'] = markdown.markdown(event_data['metadata'].get('description', ''), extensions=['markdown.extensions.nl2br'])
+            products_file.add_change(repo_name, 'update', {
+                'id': event_data['id'],
+                'name': event_data['attributes']['name'],
+                'amount': event_data['price'],
+                'metadata': event_data['metadata']
+            })
+
+
+def handle_sku_created(event_data):
+    product = stripecatalog.get_product(event_data.get('product', None))
+    product_metadata = product.get('metadata', {})
+    sku_attributes = event_data.get('attributes', {})
+    sku_metadata = event_data.get('metadata', {})
+
+    if product_metadata.get('type', None) == 'event':
+        repo_name = product_metadata.get('repo_name', None)
+
+        sku_metadata['description'] = markdown.markdown(sku_metadata.get('description', ''), extensions=['markdown.extensions.nl2br'])
+        products_file.add_change(repo_name, 'create', {
+            'id': event_data.get('id', None),
+            'name': sku_attributes.get('name', None),
+            'amount': event_data.get('price', None),
+            'metadata': sku_metadata
+        })
@@ -0,0 +1,128 @@
+# Micro-benchmark for SharedCode/frontmatter.py against the str.find parsing GetPublicRepositories used before.
+# Builds a corpus of index.md pages from the chapter and project templates and times both parsers over it.
+#
+#   python benchmarks/frontmatter_benchmark.py [corpus size] [rounds]
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from SharedCode.frontmatter import parse_index_page
+
+TEMPLATES = ['chapter-process/docs/index.md', 'project-process/docs/index.md', 'committee-process/docs/index.md', 'event-process/docs/index.md']
+REGIONS = ['Africa', 'Asia', 'Europe', 'North America', 'South America', 'Oceania']
+
+def legacy_parse(repoName, content):
+    addrepo = {}
+    ndx = content.find('title:')
+    eol = content.find('\n', ndx + 7)
+    if ndx >= 0:
+        addrepo['title'] = content[ndx + 7:eol].strip()
+    else:
+        addrepo['title'] = repoName
+
+    ndx = content.find('level:') + 6
+    eol = content.find("\n", ndx)
+    not_updated = (content.find("This is an example of a Project") >= 0)
+    if ndx < 0 or not_updated:
+        level = "-1"
+    else:
+        level = content[ndx:eol]
+    addrepo['level'] = level.strip()
+    ndx = content.find('type:') + 5
+    eol = content.find("\n", ndx)
+    addrepo['type'] = content[ndx:eol].strip()
+    ndx = content.find('region:') + 7
+    if not_updated:
+        gtype = 'Needs Website Update'
+    elif ndx > 6:
+        eol = content.find("\n", ndx)
+        gtype = content[ndx:eol]
+    else:
+        gtype = 'Unknown'
+    addrepo['region'] = gtype.strip()
+
+    ndx = content.find('pitch:') + 6
+    if ndx > 5:
+        eol = content.find('\n', ndx)
+        gtype = content[ndx:eol]
+    else:
+        gtype = 'More info soon...'
+    addrepo['pitch'] = gtype.strip()
+
+    ndx = content.find('meetup-group:')
+    if ndx > -1:
+        ndx += 13
+        eol = content.find('\n', ndx)
+        mu = content[ndx:eol]
+        if len(mu.strip()) > 0:
+            addrepo['meetup-group'] = mu.strip()
+
+    return addrepo
+
+def new_parse(repoName, content):
+    page = parse_index_page(content)
+    addrepo = {}
+    addrepo['title'] = page.title if page.title is not None else repoName
+    addrepo['level'] = page.level
+    addrepo['type'] = page.type
+    addrepo['region'] = page.region
+    addrepo['pitch'] = page.pitch
+    if page.meetup_group:
+        addrepo['meetup-group'] = page.meetup_group
+
+    return addrepo
+
+def build_corpus(size):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    templates = []
+    for template in TEMPLATES:
+        with open(os.path.join(root, template)) as tfile:
+            templates.append(tfile.read())
+
+    random.seed(42)
+    corpus = []
+    for i in range(size):
+        content = random.choice(templates)
+        content = content.replace('[GROUPNAME]', f'Group {i}').replace('[:REGION]', random.choice(REGIONS))
+        content = content.replace('[:PROJTYPE]', random.choice(['code', 'tool', 'documentation'])).replace('[:COUNTRY]', 'Somewhere')
+        content = content.replace('meetup-group:', f'meetup-group: OWASP-Group-{i}')
+        if i % 2 == 0: # leaders replace the example text with their own page
+            content = content[:content.find('---', 4) + 3] + '\n\n' + ('Some chapter news and links.\n' * random.randint(10, 400))
+        corpus.append((f'www-chapter-group-{i}', content))
+
+    return corpus
+
+def time_parser(parser, corpus, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for name, content in corpus:
+            parser(name, content)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    corpus = build_corpus(size)
+
+    differences = 0
+    for name, content in corpus:
+        if legacy_parse(name, content) != new_parse(name, content):
+            differences = differences + 1
+
+    legacy = time_parser(legacy_parse, corpus, rounds)
+    single = time_parser(new_parse, corpus, rounds)
+    print(f"corpus: {size} pages, best of {rounds} rounds")
+    print(f"  str.find scans:    {legacy * 1000:8.2f} ms  ({legacy / size * 1e6:6.2f} us/page)")
+    print(f"  front-matter pass: {single * 1000:8.2f} ms  ({single / size * 1e6:6.2f} us/page)")
+    print(f"  pages parsed differently: {differences} (pages without a level: used to pick up whatever followed the first 6 characters)")
+
+if __name__ == '__main__':
+    main()
@@ -120,7 +120,7 @@ def CreateCopperObjects(chapter_name, leaders, emails, gitusers, region, country
     resString = 'Chapter created.'
     cp = copper.OWASPCopper()
     cp_region = GetCopperRegion(region)
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     repo = gh.FormatRepoName(chapter_name, gh.RepoType.CHAPTER)
     chapter_name = "Chapter - OWASP " + chapter_name
 
@@ -130,7 +130,7 @@ def CreateCopperObjects(chapter_name, leaders, emails, gitusers, region, country
     return resString
 
 def CreateGithubStructure(chapter_name, func_dir, region, emaillinks, gitusers, country):
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     r = gh.CreateRepository(chapter_name, gh.RepoType.CHAPTER)
     resString = "Chapter created."
     if not gh.TestResultCode(r.status_code):
@@ -64,7 +64,7 @@ def process_form(values, view_id, function_directory):
 def CreateCopperObjects(committee_name, leaders, emails, gitusers):
     resString = 'Committee created.'
     cp = copper.OWASPCopper()
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     repo = gh.FormatRepoName(committee_name, gh.RepoType.COMMITTEE)
     committee_name = "Committee - OWASP " + committee_name
 
@@ -74,7 +74,7 @@ def CreateCopperObjects(committee_name, leaders, emails, gitusers):
     return resString
 
 def CreateGithubStructure(project_name, func_dir, emaillinks, githubs):
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     r = gh.CreateRepository(project_name, gh.RepoType.COMMITTEE)
     resString = "Committee created."
     if not r.ok:
@@ -2,13 +2,12 @@ import os
 import requests
 import azure.functions as func
 import json
-import base64
 import stripe
 import logging
 
 from datetime import timedelta, datetime
 from ..SharedCode.helperfuncs import MemberData
-from ..SharedCode.github import OWASPGitHub
+from ..SharedCode.leaderindex import leader_index
 from ..SharedCode.copper import OWASPCopper
 
 stripe.api_key = os.environ["STRIPE_SECRET"]
@@ -273,18 +272,11 @@ def contact_lookup_multiple(persons, response_url):
     return send_response(response_text, response_url)
 
 def fill_leader_details(memberinfo):
-    gh = OWASPGitHub()
-    r = gh.GetFile('owasp.github.io', '_data/leaders.json')
     leader_infos = []
-    if r.ok:
-        doc = json.loads(r.text)
-        content = base64.b64decode(doc['content']).decode(encoding='utf-8')
-        leaders = json.loads(content)
+    if leader_index.Refresh():
         for email in memberinfo['emails']:
-            for sub in leaders:
-                if sub['email'] and sub['email'].lower() == email['email'].lower():
-                    leader_infos.append(sub)
-            
+            leader_infos.extend(leader_index.GetLeader(email['email']))
+
         memberinfo['leader_info'] = leader_infos
 
     return memberinfo
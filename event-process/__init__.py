@@ -62,7 +62,7 @@ def process_form(values, view_id, function_directory):
 def CreateCopperObjects(event_name, leaders, emails, gitusers):
     resString = 'Event created.'
     cp = copper.OWASPCopper()
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     repo = gh.FormatRepoName(event_name, gh.RepoType.EVENT)
     event_name = "Event - OWASP " + event_name
 
@@ -72,7 +72,7 @@ def CreateCopperObjects(event_name, leaders, emails, gitusers):
     return resString
 
 def CreateGithubStructure(project_name, func_dir, emaillinks, githubs, groupsite):
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     r = gh.CreateRepository(project_name, gh.RepoType.EVENT)
     resString = "Event created."
     if not r.ok:
@@ -3,14 +3,13 @@ import os
 import jwt
 from jwt import algorithms
 import azure.functions as func
-import requests
 import json
-import base64
 from ..SharedCode import helperfuncs
 from ..SharedCode.googleapi import OWASPGoogle
-from ..SharedCode.github import OWASPGitHub
+from ..SharedCode.leaderindex import leader_index
 from ..SharedCode.copper import OWASPCopper
 from ..SharedCode import recurringtoken
+from ..SharedCode import accesskeys
 import stripe
 from datetime import datetime
 import re
@@ -59,32 +58,19 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
              status_code=404
         )
 
-def get_public_keys():
-    r = requests.get(os.environ['CF_TEAMS_DOMAIN'])
-    public_keys = []
-    jwk_set = r.json()
-    for key_dict in jwk_set['keys']:
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key_dict))
-        public_keys.append(public_key)
-    return public_keys
-
 def get_token_data(token):
     data = {}
-    keys = get_public_keys()
-    
-    for key in keys:
-        try:
-            data = jwt.decode(token, key=key, algorithms=['RS256'], verify=True, options={"verify_aud": False})
-            break
-        except Exception as err:
-            logging.info(f"Exception decoding token: {err}")
-            pass
+    try:
+        data = accesskeys.decode_access_token(token)
+    except Exception as err:
+        logging.info(f"Exception decoding token: {err}")
+        pass
 
     return data
 
 def get_token_data_otp(token):
     data = {}
-    pub_key = jwt.algorithms.RSAAlgorithm.from_jwk(os.environ["CF_MEMBERSHIP_KEY_PUBLIC"])
+    pub_key = accesskeys.get_membership_public_key()
     try:
         data = jwt.decode(token, pub_key, ['RS256'], options={"verify_aud": False, "verify": False})
     except Exception as err:
@@ -144,18 +130,11 @@ def LogIpFromRequestHeaders(req):
         logging.info(f"Authority: {req.headers.get(':authority:')}")
 
 def fill_leader_details(memberinfo):
-    gh = OWASPGitHub()
-    r = gh.GetFile('owasp.github.io', '_data/leaders.json')
     leader_infos = []
-    if r.ok:
-        doc = json.loads(r.text)
-        content = base64.b64decode(doc['content']).decode(encoding='utf-8')
-        leaders = json.loads(content)
+    if leader_index.Refresh():
         for email in memberinfo['emails']:
-            for sub in leaders:
-                if sub['email'] and sub['email'].lower() == email['email'].lower():
-                    leader_infos.append(sub)
-            
+            leader_infos.extend(leader_index.GetLeader(email['email']))
+
         memberinfo['leader_info'] = leader_infos
 
     return memberinfo
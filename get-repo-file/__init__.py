@@ -39,7 +39,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             repo = req_body.get('repo')
 
     if fpath and repo:
-        gh = github.OWASPGitHub()
+        gh = github.OWASPGitHub(priority=github.INTERACTIVE)
         r = gh.GetFile(repo, fpath)
         response = func.HttpResponse(status_code=200, body=r.text)
 
@@ -72,7 +72,7 @@ def process_form(values, view_id, function_directory):
 def CreateCopperObjects(project_name, leaders, emails, gitusers):
     resString = 'Project created.'
     cp = copper.OWASPCopper()
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     repo = gh.FormatRepoName(project_name, gh.RepoType.PROJECT)
     project_name = "Project - OWASP " + project_name
     if cp.CreateProject(project_name, leaders, emails, gitusers, copper.OWASPCopper.cp_project_type_option_project, copper.OWASPCopper.cp_project_chapter_status_option_active, repo = repo) == '':
@@ -81,7 +81,7 @@ def CreateCopperObjects(project_name, leaders, emails, gitusers):
     return resString
 
 def CreateGithubStructure(project_name, func_dir, proj_type, emaillinks, gitusers, description):
-    gh = github.OWASPGitHub()
+    gh = github.OWASPGitHub(priority=github.INTERACTIVE)
     r = gh.CreateRepository(project_name, gh.RepoType.PROJECT)
     resString = "Project created."
     if not gh.TestResultCode(r.status_code):
@@ -9,14 +9,14 @@ import time
 from ..SharedCode import spotchk
 from ..SharedCode import helperfuncs
 from ..SharedCode.copper import OWASPCopper
+from ..SharedCode import memberrollup
+from ..SharedCode import sheetswriter
+from concurrent.futures import ThreadPoolExecutor
 import stripe
 from urllib.parse import unquote_plus
 import pathlib
 import urllib
-import gspread
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from oauth2client.service_account import ServiceAccountCredentials
 
 # Function to process reports on the report-queue
 # Currently has
@@ -49,42 +49,25 @@ def main(msg: func.QueueMessage) -> None:
 
 
 
+REPORT_ROWS_CHUNK = int(os.environ.get('REPORT_ROWS_CHUNK', '50'))
+
 def get_repo_name(urlstr):
-    sndx = urlstr.find('/www-chapter') + 1
+    sndx = urlstr.find('/www-') + 1
     endx = urlstr.find('/', sndx)
 
     return urlstr[sndx:endx]
 
 def create_spreadsheet(spreadsheet_name, row_headers, report_type):
-    scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
-    client_secret = json.loads(os.environ['GOOGLE_CREDENTIALS'], strict=False)
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(client_secret, scope)
-    drive = build('drive', 'v3', credentials=creds, cache_discovery=False)
-    
     parents = [os.environ['CHAPTER_REPORT_FOLDER']]
     if report_type == REPORT_TYPE_MEMBER:# not used as member does not produce a spreadsheet - but will leave it
         parents = [os.environ['MEMBER_REPORT_FOLDER']]
     elif report_type == REPORT_TYPE_LEADER:
-        parents = [os.enivon['LEADER_REPORT_FOLDER']]
+        parents = [os.environ['LEADER_REPORT_FOLDER']]
     elif report_type == REPORT_TYPE_PROJECT:
         parents = [os.environ['PROJECT_REPORT_FOLDER']]
 
 
-    file_metadata = {
-        'name': spreadsheet_name,
-        'parents': parents,
-        'mimeType': 'application/vnd.google-apps.spreadsheet',
-    }
-
-    rfile = drive.files().create(body=file_metadata, supportsAllDrives=True).execute()
-    file_id = rfile.get('id')
-
-    client = gspread.authorize(creds)
-    sheet = client.open(spreadsheet_name).sheet1
-
-    
-
-    sheet.append_row(row_headers)
+    file_id, sheet = sheetswriter.create_spreadsheet(spreadsheet_name, parents, row_headers)
     header_format = {
         "backgroundColor": {
         "red": 0.0,
@@ -173,6 +156,54 @@ def add_to_leaders(repo, content, all_leaders, stype):
             
             all_leaders.append(leader)
 
+# leaders.md is read for every group, leaders.json only keeps the first few leaders of each
+def get_group_leaders(gh, group, stype):
+    leaders = []
+    lr = gh.GetFile(get_repo_name(group['url']), 'leaders.md')
+    if lr.ok:
+        ldoc = json.loads(lr.text)
+        lcontent = base64.b64decode(ldoc['content']).decode(encoding='utf-8')
+        add_to_leaders(group, lcontent, leaders, stype)
+        return leaders
+
+    return None
+
+# Leaders for all groups are fetched on a bounded pool (GetFile waits on the GitHub rate limit budget)
+# and rows go to the sheet in chunks, in chapters.json/projects.json order, as they are ready.
+def write_group_rows(gh, sheet, headers, groups, stype, detail_key):
+    def fetch(group):
+        return group, get_group_leaders(gh, group, stype)
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=gh.harvest_workers) as executor:
+        for group, leaders in executor.map(fetch, groups):
+            if leaders is None:
+                continue
+
+            leaderstr = ''
+            emailstr = ''
+            i = 0
+            count = len(leaders)
+            for leader in leaders:
+                i+=1
+                leaderstr += leader['name']
+                if leader['email'] is not None and '@' in leader['email']:
+                    emailstr += leader['email'].replace('mailto://','').replace('mailto:', '')
+                else:
+                    emailstr += 'Unknown'
+
+                if i < count:
+                    leaderstr += ', '
+                    emailstr += '\n'
+
+            add_group_row(rows, headers, group['name'], group['updated'], get_repo_name(group['url']), group[detail_key], leaderstr, emailstr)
+            if len(rows) >= REPORT_ROWS_CHUNK:
+                sheet.append_rows(rows)
+                rows = []
+
+    if len(rows) > 0:
+        sheet.append_rows(rows)
+
 def process_leader_report(datastr):
     data = urllib.parse.parse_qs(datastr)
     gh = OWASPGitHub()
@@ -217,36 +248,7 @@ def process_chapter_report(datastr):
         sheet = ret[0]
         file_id = ret[1]
         headers = sheet.row_values(1) # pull them again anyway
-        rows = []
-        for ch in ch_json:
-            repo = get_repo_name(ch['url'])
-            lr = gh.GetFile(repo, 'leaders.md')
-            if lr.ok:
-                ldoc = json.loads(lr.text)
-                lcontent = base64.b64decode(ldoc['content']).decode(encoding='utf-8')
-                # need to grab the leaders....
-                leaders = []
-                leader_emails = []
-                add_to_leaders(ch, lcontent, leaders, 'chapter')
-                leaderstr = ''
-                emailstr = ''
-                i = 0
-                count = len(leaders)
-                for leader in leaders:
-                    i+=1
-                    leaderstr += leader['name']
-                    if leader['email'] is not None and '@' in leader['email']:
-                        emailstr += leader['email'].replace('mailto://','').replace('mailto:', '')
-                    else:
-                        emailstr += 'Unknown'
-
-                    if i < count:
-                        leaderstr += ', '
-                        emailstr += '\n'
-
-                add_group_row(rows, headers, ch['name'], ch['updated'], repo, ch['region'], leaderstr, emailstr)
-
-        sheet.append_rows(rows)
+        write_group_rows(gh, sheet, headers, ch_json, 'chapter', 'region')
         msgtext = 'Your chapter report is ready at https://docs.google.com/spreadsheets/d/' + file_id
         response_url = data['response_url'][0]
         headers = { 'Content-type':'application/json'}
@@ -258,6 +260,41 @@ def process_chapter_report(datastr):
 
 def process_member_report(datastr):
     data = urllib.parse.parse_qs(datastr)
+    expiring = None
+    member_data = None
+    if memberrollup.is_enabled():
+        # answer from the rollup; /member-report --recount rebuilds it from Stripe first
+        if '--recount' in data.get('text', [''])[0]:
+            rollup = memberrollup.recount()
+        else:
+            rollup = memberrollup.load_rollup()
+        if rollup:
+            member_data = memberrollup.get_member_counts(rollup)
+            expiring = memberrollup.get_expiring_by_month(rollup)
+        else: # not counted yet, an empty rollup would report no members at all
+            logging.warn('Member rollup is empty, counting members from Stripe')
+    if member_data is None:
+        member_data = count_members_live()
+
+    total_members = member_data['complimentary'] + member_data['one'] + member_data['two'] + member_data['lifetime']
+    msgtext = ""
+
+    msgtext += f"\ttotal members: {total_members}\n"
+    msgtext += f"\t\tone: {member_data['one']}\ttwo:{member_data['two']}\n"
+    msgtext += f"\t\tlifetime: {member_data['lifetime']}\tcomplimentary:{member_data['complimentary']}\n"
+    if expiring:
+        months = sorted(expiring.keys())[:3]
+        msgtext += "\texpiring: " + "\t".join([f"{month}: {expiring[month]}" for month in months]) + "\n"
+
+    response_url = data['response_url'][0]
+    headers = { 'Content-type':'application/json'}
+    msgdata = {
+        'text':msgtext,
+        'response_type':'ephemeral'
+    }
+    requests.post(response_url, data=json.dumps(msgdata), headers = headers)
+
+def count_members_live():
     stripe.api_key = os.environ['STRIPE_SECRET']
     stripe.api_version = "2020-08-27"
 
@@ -294,22 +331,8 @@ def process_member_report(datastr):
                         print(f"ERROR: Could not convert member end date for member {customer['id']} and type {member_type}")
                     elif member_end_date >= datetime.today():                                                
                         member_data[member_type]+=1
-                       
 
-    total_members = member_data['complimentary'] + member_data['one'] + member_data['two'] + member_data['lifetime']
-    msgtext = ""
-
-    msgtext += f"\ttotal members: {total_members}\n"
-    msgtext += f"\t\tone: {member_data['one']}\ttwo:{member_data['two']}\n"
-    msgtext += f"\t\tlifetime: {member_data['lifetime']}\tcomplimentary:{member_data['complimentary']}\n"
-
-    response_url = data['response_url'][0]
-    headers = { 'Content-type':'application/json'}
-    msgdata = {
-        'text':msgtext,
-        'response_type':'ephemeral'
-    }
-    requests.post(response_url, data=json.dumps(msgdata), headers = headers)
+    return member_data
 
 def process_member_report_old(datastr):
     cp = OWASPCopper()
@@ -404,36 +427,7 @@ def process_project_report(datastr):
         sheet = ret[0]
         file_id = ret[1]
         headers = sheet.row_values(1) # pull them again anyway
-        rows = []
-        for ch in ch_json:
-            repo = get_repo_name(ch['url'])
-            lr = gh.GetFile(repo, 'leaders.md')
-            if lr.ok:
-                ldoc = json.loads(lr.text)
-                lcontent = base64.b64decode(ldoc['content']).decode(encoding='utf-8')
-                # need to grab the leaders....
-                leaders = []
-                
-                add_to_leaders(ch, lcontent, leaders, 'project')
-                leaderstr = ''
-                emailstr = ''
-                i = 0
-                count = len(leaders)
-                for leader in leaders:
-                    i+=1
-                    leaderstr += leader['name']
-                    if leader['email'] is not None and '@' in leader['email']:
-                        emailstr += leader['email'].replace('mailto://','').replace('mailto:', '')
-                    else:
-                        emailstr += 'Unknown'
-
-                    if i < count:
-                        leaderstr += ', '
-                        emailstr += '\n'
-
-                add_group_row(rows, headers, ch['name'], ch['updated'], repo, ch['level'], leaderstr, emailstr)
-
-        sheet.append_rows(rows)
+        write_group_rows(gh, sheet, headers, ch_json, 'project', 'level')
         msgtext = 'Your project report is ready at https://docs.google.com/spreadsheets/d/' + file_id
         response_url = data['response_url'][0]
         headers = { 'Content-type':'application/json'}
@@ -3,13 +3,13 @@ import os
 import jwt
 from jwt import algorithms
 import azure.functions as func
-import requests
 import json
 import base64
 from ..SharedCode import helperfuncs
 from ..SharedCode.googleapi import OWASPGoogle
 from ..SharedCode.github import OWASPGitHub
 from ..SharedCode.copper import OWASPCopper
+from ..SharedCode import accesskeys
 import stripe
 from datetime import datetime
 
@@ -104,25 +104,12 @@ def check_values(membership_data):
 
     return ret
 
-def get_public_keys():
-    r = requests.get(os.environ['CF_TEAMS_DOMAIN'])
-    public_keys = []
-    jwk_set = r.json()
-    for key_dict in jwk_set['keys']:
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key_dict))
-        public_keys.append(public_key)
-    return public_keys
-
 def get_token_data(token):
     data = {}
-    keys = get_public_keys()
-    
-    for key in keys:
-        try:
-            data = jwt.decode(token, key=key, audience=os.environ['CF_POLICY_AUD'], algorithms=['RS256'], verify=True)
-            break
-        except Exception as err:
-            pass
+    try:
+        data = accesskeys.decode_access_token(token, audience=os.environ['CF_POLICY_AUD'])
+    except Exception as err:
+        pass
 
     return data
 
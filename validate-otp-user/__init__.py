@@ -3,11 +3,12 @@ import jwt
 from jwt import algorithms
 import os
 import json
-import requests
 import azure.functions as func
 from datetime import datetime, timedelta
 from ..SharedCode.copper import OWASPCopper
 from ..SharedCode import helperfuncs
+from ..SharedCode import membershipindex
+from ..SharedCode import accesskeys
 import stripe
 stripe.api_key = os.environ['STRIPE_SECRET']
 
@@ -68,25 +69,10 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
 
 
-def get_public_keys():
-    r = requests.get(os.environ['CF_TEAMS_DOMAIN'])
-    public_keys = {}
-    jwk_set = r.json()
-    for key_dict in jwk_set['keys']:
-        kid = key_dict['kid']
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(key_dict))
-        public_keys[kid] = public_key
-
-    return public_keys
-
 def get_token_data(token):
     data = {}
-    keys = get_public_keys()
-    kid = jwt.get_unverified_header(token)['kid']
-    key = keys[kid]
-    
     try:
-        data = jwt.decode(token, key, ['RS256'], options={"verify_aud": False})
+        data = accesskeys.decode_access_token(token)
     except Exception as err:
         logging.info(f"Exception decoding token: {err}")
         pass
@@ -193,8 +179,8 @@ def get_membership_recurring(cp, opp):
 def get_membership_email(person):
     membership_email = None
     for email in person['emails']:
-        customers = stripe.Customer.list(email=email['email'], api_key=os.environ['STRIPE_SECRET'])
-        for customer in customers.auto_paging_iter():
+        customers = membershipindex.get_member_customers(email['email'])
+        for customer in customers:
             metadata = customer.get('metadata', None)
             if metadata and 'membership_type' in metadata:
                 if metadata['membership_type'] == 'lifetime':